@@ -1,11 +1,36 @@
 import streamlit as st
-import subprocess
-from rag.pipeline import answer
+from config.settings import RETRIEVAL_MODE, RERANK
+from ingestion.background import start_build, current_build
+from rag.pipeline import answer_stream, get_engine
+from rag.retriever import RETRIEVAL_MODES
 
 st.set_page_config(page_title="CeADAR RAG", layout="wide")
 st.title("CeADAR RAG Prototype (Groq + Open Embeddings)")
 st.caption("Chat memory improves retrieval, while answers remain grounded ONLY in retrieved document context.")
 
+@st.cache_resource(show_spinner="Loading models...")
+def warm_engine():
+    # one warmed-up engine shared by every session of this server process
+    return get_engine().warm_up()
+
+warm_engine()
+
+@st.fragment(run_every=1.0)
+def build_status():
+    # the build runs in a background process and swaps the new index in when done
+    job = current_build()
+    if job is None:
+        return
+    if job.running:
+        p = job.progress()
+        st.progress(job.fraction(), text=f"Building index: {p.get('phase', 'starting')}")
+    elif job.state == "succeeded":
+        st.success("Index built successfully.")
+        st.code(job.stdout)
+    else:
+        st.error("Index build failed.")
+        st.code(job.stderr)
+
 # ---------- Session State ----------
 if "messages" not in st.session_state:
     st.session_state.messages = []  # [{"role": "user"/"assistant", "content": "..."}]
@@ -15,17 +40,41 @@ with st.sidebar:
     st.subheader("Indexing")
     st.write("If you changed documents, rebuild the index.")
     if st.button("Build/Rebuild Index"):
-        with st.spinner("Building index..."):
-            result = subprocess.run(["python", "-m", "ingestion.build_index"], capture_output=True, text=True)
-            if result.returncode == 0:
-                st.success("Index built successfully.")
-                st.code(result.stdout)
-            else:
-                st.error("Index build failed.")
-                st.code(result.stderr)
+        start_build()
+    build_status()
 
     st.subheader("Retrieval Settings")
+    with st.expander("Filters", expanded=False):
+        # options come from the metadata index built with the collection
+        try:
+            options = get_engine().filter_values()
+        except Exception:
+            options = {"source_file": [], "doc_type": []}
+        filter_files = st.multiselect("Documents", options["source_file"], help="Only search these files")
+        filter_types = st.multiselect("Document types", options["doc_type"])
+        page_from, page_to = st.columns(2)
+        first_page = page_from.number_input("From page", min_value=0, value=None, step=1, help="Stored page numbers, as shown in the sources. Chunks without page numbers (spreadsheets, Word, HTML) are not affected")
+        last_page = page_to.number_input("To page", min_value=0, value=None, step=1)
+        ingested_after = st.date_input("Ingested on or after", value=None)
+    filters = {
+        "source_file": filter_files or None,
+        "doc_type": filter_types or None,
+        "page_range": [first_page, last_page] if first_page is not None or last_page is not None else None,
+        "ingested_after": ingested_after,
+    }
+    filters = {k: v for k, v in filters.items() if v is not None} or None
     top_k = st.slider("Top-K chunks", 2, 8, 4)
+    retrieval_mode = st.selectbox(
+        "Retrieval mode",
+        RETRIEVAL_MODES,
+        index=RETRIEVAL_MODES.index(RETRIEVAL_MODE) if RETRIEVAL_MODE in RETRIEVAL_MODES else 0,
+        help="hybrid = dense vectors + BM25 keyword search (better for exact terms, article numbers, model names)"
+    )
+    use_rerank = st.toggle(
+        "Re-rank with cross-encoder",
+        value=RERANK,
+        help="Over-fetch candidates and keep the best Top-K (fewer, better chunks for the LLM)"
+    )
 
     show_context = st.toggle("Show retrieved sources", value=True)
     show_rewrite = st.toggle("Show rewritten retrieval query", value=False)
@@ -50,33 +99,50 @@ if user_input:
 
     # Generate answer
     with st.chat_message("assistant"):
-        with st.spinner("Retrieving + generating..."):
-            try:
-                res = answer(
+        try:
+            res = {}
+
+            def token_stream():
+                # tokens are rendered as they arrive; the final event carries sources + metrics
+                for event in answer_stream(
                     user_input,
                     top_k=top_k,
-                    history=st.session_state.messages
-                )
+                    history=st.session_state.messages,
+                    mode=retrieval_mode,
+                    rerank=use_rerank,
+                    filters=filters
+                ):
+                    if event["type"] == "token":
+                        yield event["text"]
+                    else:
+                        res.update(event)
+
+            st.write_stream(token_stream())
 
-                st.write(res["answer"])
+            metrics = res.get("metrics", {})
+            if metrics:
+                st.caption(f"Time to first token: {metrics['ttft_ms']:.0f} ms · total: {metrics['total_ms']:.0f} ms")
 
-                if show_rewrite:
-                    st.caption(f"Rewritten retrieval query: {res['rewritten_query']}")
+            if show_rewrite:
+                st.caption(f"Rewritten retrieval query: {res['rewritten_query']}")
 
-                if show_context:
-                    st.markdown("### Sources Used (Top Matches)")
-                    for s in res["sources"]:
-                        meta = f"**[{s['rank']}]** `{s['source_file']}`"
-                        if s["page"] is not None:
-                            meta += f" (page {s['page']})"
+            if show_context:
+                st.markdown("### Sources Used (Top Matches)")
+                for s in res["sources"]:
+                    meta = f"**[{s['rank']}]** `{s['source_file']}`"
+                    # sources cached before "location" existed only carry a page
+                    where = s.get("location") or (f"page {s['page']}" if s.get("page") is not None else None)
+                    if where:
+                        meta += f" ({where})"
+                    if s["distance"] is not None:
                         meta += f" — similarity distance: `{s['distance']:.4f}`"
-                        st.markdown(meta)
-                        st.code(s["text_preview"])
+                    st.markdown(meta)
+                    st.code(s["text_preview"])
 
-                
-                st.session_state.messages.append({"role": "assistant", "content": res["answer"]})
+            
+            st.session_state.messages.append({"role": "assistant", "content": res["answer"]})
 
-            except Exception as e:
-                err = str(e)
-                st.error(err)
-                st.session_state.messages.append({"role": "assistant", "content": f"Error: {err}"})
+        except Exception as e:
+            err = str(e)
+            st.error(err)
+            st.session_state.messages.append({"role": "assistant", "content": f"Error: {err}"})
@@ -6,10 +6,131 @@ BASE_DIR = Path(__file__).resolve().parent.parent  # repo root
 RAW_DIR = str(BASE_DIR / "data" / "raw")
 CHROMA_DIR = str(BASE_DIR / "chroma_db")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "ceadar_docs")
+# multi-collection serving: open collection handles kept per process (LRU), and
+# seconds after which an unused handle is closed (0 = only LRU eviction)
+MAX_OPEN_COLLECTIONS = int(os.getenv("MAX_OPEN_COLLECTIONS", "8"))
+COLLECTION_IDLE_S = float(os.getenv("COLLECTION_IDLE_S", "600"))
 
+# "recursive": the LangChain character splitter (CHUNK_SIZE, CHUNK_OVERLAP characters)
+# "tokens": sentence / heading / page-aware chunks sized in tokens (CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS),
+# with sentences longer than CHUNK_SIZE characters cut like over-long ones;
+# opt in with CHUNKER=tokens (the next build re-chunks every file, so chunk IDs change)
+CHUNKER = os.getenv("CHUNKER", "recursive")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "220"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "30"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
 TOP_K = int(os.getenv("TOP_K", "4"))
+# "dense" (vectors only) or "hybrid" (vectors + BM25, fused with RRF); opt in
+# with RETRIEVAL_MODE=hybrid (changes which chunks are retrieved)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+# selective metadata filters (at most this many chunks AND at most this fraction
+# of the collection) are searched exactly among just those chunks (pre-filter);
+# the others over-fetch from the full index and drop the hits that do not match
+# (post-filter). A pre-filter fetches the matching chunks' embeddings per query.
+FILTER_PREFILTER_MAX_ROWS = int(os.getenv("FILTER_PREFILTER_MAX_ROWS", "2000"))
+FILTER_PREFILTER_MAX_FRACTION = float(os.getenv("FILTER_PREFILTER_MAX_FRACTION", "0.05"))
+
+# optional cross-encoder re-ranking: over-fetch N candidates, keep the best TOP_K
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+# "sentence-transformers", or "hash" for a model-free deterministic encoder (offline benchmarks)
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "sentence-transformers")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# unit-length vectors: L2 ranking == cosine ranking, and dot products are cosines.
+# Opt in with EMBED_NORMALIZE=1 and rebuild (--full): the setting is recorded in
+# index_meta.json, and querying an index built with the other setting warns
+EMBED_NORMALIZE = os.getenv("EMBED_NORMALIZE", "0") == "1"
+# persistent embedding cache (vectors keyed by model + normalized text hash)
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", str(BASE_DIR / ".cache" / "embeddings"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "100000"))  # max vectors kept
+
+# vector store: "chroma" (chromadb.PersistentClient) or "local" (memory-mapped
+# matrix: exact search below LOCAL_IVF_MIN_ROWS, IVF above; no SQLite / server)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+LOCAL_IVF_MIN_ROWS = int(os.getenv("LOCAL_IVF_MIN_ROWS", "50000"))
+LOCAL_IVF_NLIST = int(os.getenv("LOCAL_IVF_NLIST", "0"))  # 0 = 4 * sqrt(rows)
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "16"))
+# local backend: compressed codes for a coarse first pass ("none", "int8" = 1 byte
+# per dim, "pq" = VECTOR_PQ_SUBSPACES bytes per vector, 0 = dim / 8), optionally
+# after a PCA projection to VECTOR_PCA_DIM dims (0 = off). The best
+# top_k * VECTOR_RESCORE_FACTOR are rescored with the float vectors. This is the
+# default for new collections; build_index --quantize sets it per collection.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_PCA_DIM = int(os.getenv("VECTOR_PCA_DIM", "0"))
+VECTOR_PQ_SUBSPACES = int(os.getenv("VECTOR_PQ_SUBSPACES", "0"))
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "8"))
+
+# index versions kept under CHROMA_DIR/versions (the live one and the one it replaced are never deleted)
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+
+# ingestion: parser processes (0 = one per CPU)
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "0"))
+# ingestion: parsed pages cached per file hash, so unchanged files are never re-extracted
+PARSE_CACHE = os.getenv("PARSE_CACHE", "1") == "1"
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", str(BASE_DIR / ".cache" / "parsed"))
+# ingestion: spreadsheet rows per page (pages are what chunks and citations point into)
+XLSX_ROWS_PER_PAGE = int(os.getenv("XLSX_ROWS_PER_PAGE", "40"))
+# ingestion: chunks embedded + written to Chroma per batch
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+
+# semantic answer cache (repeated / paraphrased questions skip generation)
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+
+# query rewriting: follow-ups are resolved locally from keyphrases of recent
+# turns; the LLM is asked only below this confidence (0 = never, 1 = always).
+# LLM rewrites are memoized per (history, query).
+REWRITE_LLM_THRESHOLD = float(os.getenv("REWRITE_LLM_THRESHOLD", "0.5"))
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "1024"))
+
+# async pipeline per-stage timeouts (seconds)
+REWRITE_TIMEOUT_S = float(os.getenv("REWRITE_TIMEOUT_S", "5"))
+RETRIEVE_TIMEOUT_S = float(os.getenv("RETRIEVE_TIMEOUT_S", "10"))
+GENERATE_TIMEOUT_S = float(os.getenv("GENERATE_TIMEOUT_S", "60"))
+
+# context packing: prompt context budget in tokens (0 = every chunk in full);
+# while over budget, chunks past the first CONTEXT_FULL_CHUNKS are cut to their most relevant sentences
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_FULL_CHUNKS = int(os.getenv("CONTEXT_FULL_CHUNKS", "2"))
+CONTEXT_TRIM_SENTENCES = int(os.getenv("CONTEXT_TRIM_SENTENCES", "3"))
+
+# answer_batch: concurrent LLM calls for the questions of one batch
+BATCH_GENERATE_WORKERS = int(os.getenv("BATCH_GENERATE_WORKERS", "4"))
+
+# HTTP server (serving/api.py): worker threads = concurrent answers (and LLM calls),
+# admitted requests waiting for a worker before new ones get 503, and how long
+# one may wait; query embeddings of concurrent requests are batched within
+# SERVE_BATCH_WINDOW_MS (0 = no batching), at most SERVE_MAX_BATCH texts per call
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "8"))
+SERVE_MAX_QUEUE = int(os.getenv("SERVE_MAX_QUEUE", "64"))
+SERVE_QUEUE_TIMEOUT_S = float(os.getenv("SERVE_QUEUE_TIMEOUT_S", "10"))
+SERVE_BATCH_WINDOW_MS = float(os.getenv("SERVE_BATCH_WINDOW_MS", "5"))
+SERVE_MAX_BATCH = int(os.getenv("SERVE_MAX_BATCH", "32"))
+
+# per-stage tracing: JSONL traces + Prometheus text metrics in TRACE_DIR
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_DIR = os.getenv("TRACE_DIR", str(BASE_DIR / "traces"))
+# traces.jsonl is rotated to traces.jsonl.1 .. .N past this size (N = TRACE_KEEP_FILES);
+# traces are written by a background thread, and dropped (counted) if it falls
+# TRACE_QUEUE_SIZE traces behind
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_KEEP_FILES = int(os.getenv("TRACE_KEEP_FILES", "3"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+# "groq", or "fake" for a local deterministic LLM (offline tests / benchmarks)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "200"))
+FAKE_LLM_CHUNK_MS = float(os.getenv("FAKE_LLM_CHUNK_MS", "20"))
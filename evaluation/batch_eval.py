@@ -0,0 +1,240 @@
+"""
+Concurrent, resumable batch evaluation.
+
+  PYTHONPATH=. python evaluation/batch_eval.py --questions questions.jsonl --out results.jsonl --workers 8 --rate 5
+  PYTHONPATH=. python evaluation/batch_eval.py --out results.jsonl --retrieval-only --top-k 8   # tune TOP_K / CHUNK_TOKENS
+
+Each line of the questions file is one JSON object:
+  {"id": "q1", "question": "...",
+   "expected": "answer_with_citations" | "refuse",                    (optional)
+   "gold_chunk_ids": ["attention.pdf-2-<hash>", ...],               (optional)
+   "gold_sources": [{"source_file": "attention.pdf", "page": 2}]}   (optional)
+Without --questions the five built-in run_eval.TESTS are used.
+
+Results are appended to --out one line per question as soon as each finishes,
+so an interrupted run resumes where it stopped (failed questions are retried).
+gold_sources matches on file (+ page when given), so it survives re-chunking;
+gold_chunk_ids is exact but tied to one chunker configuration.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config.settings import TOP_K, RETRIEVAL_MODE, RERANK
+from evaluation.run_eval import TESTS, judge
+from ingestion.chunking import chunk_settings
+
+class RateLimiter:
+    """Token bucket shared by all workers: at most `rate` starts per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def load_questions(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return [{"id": f"builtin-{i}", "question": q, "expected": e} for i, (q, e) in enumerate(TESTS, start=1)]
+
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", f"line-{n}")
+            questions.append(item)
+    return questions
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """Finished results by question id; errored ones are left out so they run again."""
+    done: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            if "error" not in rec:
+                done[rec["id"]] = rec
+    return done
+
+# ---------- Metrics ----------
+def _is_relevant(source: Dict[str, Any], gold_ids: set, gold_sources: List[Dict[str, Any]]) -> List[int]:
+    """Indexes of the gold items this retrieved source satisfies."""
+    hits = []
+    if source.get("chunk_id") in gold_ids:
+        hits.append(-1)
+    for j, g in enumerate(gold_sources):
+        if g.get("source_file") == source.get("source_file") and (g.get("page") is None or g.get("page") == source.get("page")):
+            hits.append(j)
+    return hits
+
+def retrieval_metrics(sources: List[Dict[str, Any]], item: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    gold_ids = set(item.get("gold_chunk_ids") or [])
+    gold_sources = item.get("gold_sources") or []
+    if not gold_ids and not gold_sources:
+        return None
+
+    found_ids, found_sources = set(), set()
+    first_rank = None
+    for rank, s in enumerate(sources, start=1):
+        hits = _is_relevant(s, gold_ids, gold_sources)
+        if hits and first_rank is None:
+            first_rank = rank
+        if -1 in hits:
+            found_ids.add(s["chunk_id"])
+        found_sources.update(j for j in hits if j >= 0)
+
+    total = len(gold_ids) + len(gold_sources)
+    return {
+        "recall": (len(found_ids) + len(found_sources)) / total,
+        "hit": 1.0 if first_rank is not None else 0.0,
+        "rr": 1.0 / first_rank if first_rank is not None else 0.0,
+    }
+
+def summarize(results: List[Dict[str, Any]], top_k: int) -> Dict[str, Any]:
+    ok = [r for r in results if "error" not in r]
+    judged = [r for r in ok if r.get("passed") is not None]
+    scored = [r["retrieval"] for r in ok if r.get("retrieval")]
+    latency = np.asarray([r["latency_ms"] for r in ok], dtype=np.float64)
+
+    chunker, chunk_size, chunk_overlap = chunk_settings()
+    summary: Dict[str, Any] = {
+        "questions": len(results),
+        "errors": len(results) - len(ok),
+        "top_k": top_k,
+        "chunker": chunker,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+    }
+    if judged:
+        summary["passed"] = sum(1 for r in judged if r["passed"])
+        summary["pass_rate"] = summary["passed"] / len(judged)
+    if scored:
+        summary[f"recall@{top_k}"] = float(np.mean([m["recall"] for m in scored]))
+        summary[f"hit_rate@{top_k}"] = float(np.mean([m["hit"] for m in scored]))
+        summary["mrr"] = float(np.mean([m["rr"] for m in scored]))
+    if len(latency):
+        p50, p95 = np.percentile(latency, [50, 95])
+        summary["latency_p50_ms"] = round(float(p50), 1)
+        summary["latency_p95_ms"] = round(float(p95), 1)
+    return summary
+
+# ---------- Runner ----------
+def evaluate_one(engine, item: Dict[str, Any], args) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    if args.retrieval_only:
+        from rag.retriever import to_sources
+        docs = engine.retrieve(item["question"], top_k=args.top_k, mode=args.mode, rerank=args.rerank)
+        res = {"answer": None, "sources": to_sources(docs)}
+    else:
+        res = engine.answer(item["question"], top_k=args.top_k, mode=args.mode, rerank=args.rerank)
+    latency_ms = (time.perf_counter() - t0) * 1000.0
+
+    out = (res["answer"] or "").strip() if res["answer"] is not None else None
+    expected = item.get("expected")
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "expected": expected,
+        "passed": judge(expected, out) if (expected and out is not None) else None,
+        "retrieval": retrieval_metrics(res["sources"], item),
+        "retrieved": [s.get("chunk_id") for s in res["sources"]],
+        "answer": out,
+        "latency_ms": round(latency_ms, 1),
+    }
+
+def run(questions: List[Dict[str, Any]], args) -> List[Dict[str, Any]]:
+    from rag.pipeline import get_engine
+
+    done = load_checkpoint(args.out) if not args.restart else {}
+    todo = [q for q in questions if q["id"] not in done]
+    print(f"{len(questions)} questions | {len(done)} already done | {len(todo)} to run", flush=True)
+
+    if args.restart and os.path.exists(args.out):
+        os.remove(args.out)
+
+    engine = get_engine().warm_up()
+    limiter = RateLimiter(args.rate, burst=args.workers)
+    write_lock = threading.Lock()
+    results = dict(done)
+
+    def task(item):
+        limiter.acquire()
+        try:
+            return evaluate_one(engine, item, args)
+        except Exception as e:
+            return {"id": item["id"], "question": item["question"], "error": f"{type(e).__name__}: {e}"}
+
+    started = time.perf_counter()
+    with open(args.out, "a", encoding="utf-8") as ckpt, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(task, item) for item in todo]
+        for n, fut in enumerate(as_completed(futures), start=1):
+            rec = fut.result()
+            results[rec["id"]] = rec
+            with write_lock:
+                ckpt.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                ckpt.flush()
+            if n % args.progress_every == 0 or n == len(todo):
+                rate = n / (time.perf_counter() - started)
+                print(f"  {n}/{len(todo)} done | {rate:.1f} q/s", flush=True)
+
+    # question-file order, not completion order
+    return [results[q["id"]] for q in questions if q["id"] in results]
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent, resumable RAG evaluation.")
+    parser.add_argument("--questions", default="", help="JSONL question set (default: the built-in TESTS)")
+    parser.add_argument("--out", default="eval_results.jsonl", help="per-question results / checkpoint file")
+    parser.add_argument("--summary", default="", help="write the summary JSON here")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.0, help="max questions started per second (0 = unlimited)")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--mode", default=RETRIEVAL_MODE)
+    parser.add_argument("--rerank", action="store_true", default=RERANK)
+    parser.add_argument("--retrieval-only", action="store_true", help="skip generation: retrieval metrics only")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--progress-every", type=int, default=25)
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    results = run(questions, args)
+    summary = summarize(results, args.top_k)
+
+    print("\n" + "=" * 90)
+    for k, v in summary.items():
+        print(f"{k:>16}: {v:.4f}" if isinstance(v, float) else f"{k:>16}: {v}")
+    print("=" * 90 + "\n")
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: float32 ndarray embedding path vs the old nested-list path.
+
+  PYTHONPATH=. python evaluation/bench_embeddings.py --n 5000
+  PYTHONPATH=. python evaluation/bench_embeddings.py --n 20000 --synthetic   # no model, random vectors
+
+For each path it reports wall time and tracemalloc peak for
+  represent: what our code builds after encoding (list of lists vs one array)
+  store:     represent + upsert into a throwaway Chroma collection
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+def measure(fn):
+    # timed and memory-traced separately: tracemalloc slows allocation-heavy code
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 4), "peak_mb": round(peak / 1e6, 2)}
+
+def get_vectors(n: int, synthetic: bool) -> np.ndarray:
+    if synthetic:
+        rng = np.random.default_rng(0)
+        v = rng.standard_normal((n, 384), dtype=np.float32)
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+    from vector_store.embeddings import STEmbeddingFunction
+    fn = STEmbeddingFunction()
+    texts = [f"synthetic benchmark sentence number {i} about attention and regulation" for i in range(n)]
+    return fn.encode(texts)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--synthetic", action="store_true", help="random vectors instead of the embedding model")
+    parser.add_argument("--no-store", action="store_true", help="skip the Chroma upsert part")
+    parser.add_argument("--json", default="", help="write results to this file")
+    args = parser.parse_args()
+
+    import chromadb
+
+    vectors = get_vectors(args.n, args.synthetic)
+    ids = [f"id-{i}" for i in range(args.n)]
+    docs = [f"doc {i}" for i in range(args.n)]
+
+    results = {
+        "n": args.n,
+        "dim": int(vectors.shape[1]),
+        "list_represent": measure(lambda: vectors.tolist()),
+        "array_represent": measure(lambda: np.ascontiguousarray(vectors, dtype=np.float32)),
+    }
+
+    if not args.no_store:
+        def store(as_list: bool):
+            tmp = tempfile.mkdtemp(prefix="bench_chroma_")
+            try:
+                coll = chromadb.PersistentClient(path=tmp).get_or_create_collection("bench", embedding_function=None)
+
+                def run():
+                    for s in range(0, args.n, args.batch_size):
+                        batch = vectors[s:s + args.batch_size]
+                        coll.upsert(
+                            ids=ids[s:s + args.batch_size],
+                            documents=docs[s:s + args.batch_size],
+                            embeddings=batch.tolist() if as_list else batch,
+                        )
+                return measure(run)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        results["list_store"] = store(as_list=True)
+        results["array_store"] = store(as_list=False)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Offline benchmark: ingestion throughput and query latency at several corpus sizes.
+
+Runs without network access: a synthetic corpus (evaluation/synthetic_corpus.py),
+the deterministic fake LLM, and optionally the model-free hashing encoder.
+
+  PYTHONPATH=. python evaluation/bench_pipeline.py --sizes 100,1000 --top-k 2,4,8 --out bench.json
+  PYTHONPATH=. python evaluation/bench_pipeline.py --embeddings hash --out new.json --compare bench.json
+
+Per corpus size it reports
+  ingest: load / chunk / embed / write / bm25 seconds and chunks/s, as timed
+          inside ingestion.build_index, plus the process RSS high-water mark
+  query:  p50 / p95 / p99 latency of retrieve() and answer() per TOP_K, and the
+          tracemalloc peak of one answer() (measured in a separate pass)
+--compare diffs the new results against an older JSON and exits 1 when a
+throughput drops or a latency / memory figure grows by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+def percentiles(samples_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3), "mean_ms": round(float(ms.mean()), 3)}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS; it only ever grows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1e6 if sys.platform == "darwin" else 1e3), 1)
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return ""
+
+def bench_ingest(raw_dir: str, persist_dir: str, args) -> Dict[str, Any]:
+    from ingestion import build_index
+
+    argv = ["--full", "--quiet", "--raw-dir", raw_dir, "--persist-dir", persist_dir, "--workers", str(args.workers)]
+    report = build_index.main(argv)
+    t, s = report["timings"], report["stats"]
+    chunks = s["upserted"]
+
+    def rate(n, seconds):
+        return round(n / seconds, 1) if seconds > 0 else None
+
+    return {
+        "files": s["new"],
+        "pages": s["docs"],
+        "chunks": chunks,
+        "seconds": {k: round(v, 4) for k, v in t.items()},
+        "load_files_per_sec": rate(s["new"], t["load_s"]),
+        "chunk_chunks_per_sec": rate(chunks, t["chunk_s"]),
+        "embed_chunks_per_sec": rate(chunks, t["embed_s"]),
+        "write_chunks_per_sec": rate(chunks, t["write_s"]),
+        "end_to_end_chunks_per_sec": rate(chunks, t["total_s"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def bench_queries(persist_dir: str, queries: List[str], args) -> Dict[str, Any]:
+    from rag.engine import RAGEngine
+    from rag.fake_llm import FakeStreamingLLM
+
+    llm = FakeStreamingLLM(first_token_delay=args.llm_ttft_ms / 1000.0, chunk_delay=args.llm_chunk_ms / 1000.0)
+    # no answer cache: every query must take the full path
+    engine = RAGEngine(persist_dir=persist_dir, llm=llm, rewrite_llm=llm, answer_cache=False)
+    engine.warm_up()
+
+    out: Dict[str, Any] = {}
+    try:
+        for top_k in args.top_k:
+            for q in queries[:args.warmup]:
+                engine.answer(q, top_k=top_k, mode=args.mode)
+
+            retrieve_s, answer_s = [], []
+            for q in queries:
+                t0 = time.perf_counter()
+                engine.retrieve(q, top_k=top_k, mode=args.mode)
+                retrieve_s.append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                engine.answer(q, top_k=top_k, mode=args.mode)
+                answer_s.append(time.perf_counter() - t0)
+
+            # memory pass kept apart from the timed one: tracemalloc slows allocation
+            tracemalloc.start()
+            engine.answer(queries[0], top_k=top_k, mode=args.mode)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            out[f"top_k={top_k}"] = {
+                "queries": len(queries),
+                "retrieve": percentiles(retrieve_s),
+                "answer": percentiles(answer_s),
+                "answer_qps": round(len(answer_s) / sum(answer_s), 2),
+                "answer_peak_alloc_mb": round(peak / 1e6, 2),
+            }
+    finally:
+        engine.close()
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out
+
+# ---------- Comparison ----------
+def _flatten(d: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            flat.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[key] = float(v)
+    return flat
+
+def _direction(key: str) -> int:
+    """+1 = higher is better, -1 = lower is better, 0 = informational."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith("_per_sec") or leaf.endswith("_qps"):
+        return 1
+    if leaf.endswith("_ms") or leaf.endswith("_mb"):
+        return -1
+    return 0
+
+def compare(new: Dict[str, Any], old: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    old_runs = {r["corpus_docs"]: r for r in old.get("runs", [])}
+    rows = []
+    for run in new.get("runs", []):
+        base = old_runs.get(run["corpus_docs"])
+        if base is None:
+            continue
+        a, b = _flatten(base), _flatten(run)
+        for key in sorted(set(a) & set(b)):
+            direction = _direction(key)
+            if direction == 0 or a[key] <= 0:
+                continue
+            change = (b[key] - a[key]) / a[key]
+            rows.append({
+                "corpus_docs": run["corpus_docs"],
+                "metric": key,
+                "old": a[key],
+                "new": b[key],
+                "change": round(change, 4),
+                "regression": direction * change < -tolerance,
+            })
+    return rows
+
+def print_comparison(rows: List[Dict[str, Any]], tolerance: float) -> int:
+    regressions = [r for r in rows if r["regression"]]
+    print(f"\n=== Comparison (tolerance {tolerance:.0%}) ===")
+    for r in rows:
+        flag = "❌" if r["regression"] else "  "
+        print(f"{flag} docs={r['corpus_docs']:<6} {r['metric']:<45} {r['old']:>12.3f} -> {r['new']:>12.3f} ({r['change']:+.1%})")
+    print(f"{len(regressions)} regression(s) out of {len(rows)} compared metrics")
+    return len(regressions)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion + query latency benchmark.")
+    parser.add_argument("--sizes", default="100,1000", help="comma-separated corpus sizes (documents)")
+    parser.add_argument("--top-k", default="2,4,8", help="comma-separated TOP_K values")
+    parser.add_argument("--queries", type=int, default=50, help="timed queries per TOP_K")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--paragraphs", type=int, default=12, help="paragraphs per synthetic document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", default="hybrid", help="retrieval mode")
+    parser.add_argument("--workers", type=int, default=0, help="parser processes for build_index (0 = one per CPU)")
+    parser.add_argument("--embeddings", choices=["model", "hash"], default="model",
+                        help="hash = model-free deterministic encoder (no model download needed)")
+    parser.add_argument("--embed-cache", action="store_true", help="keep the persistent embedding cache on")
+    parser.add_argument("--parse-cache", action="store_true", help="keep the parse cache on (load throughput then measures cache reads)")
+    parser.add_argument("--llm-ttft-ms", type=float, default=0.0, help="fake LLM time to first token")
+    parser.add_argument("--llm-chunk-ms", type=float, default=0.0, help="fake LLM delay per streamed chunk")
+    parser.add_argument("--out", default="", help="write results JSON here")
+    parser.add_argument("--compare", default="", help="older results JSON to diff against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpora and indexes")
+    args = parser.parse_args()
+    args.top_k = [int(k) for k in args.top_k.split(",") if k]
+    sizes = [int(n) for n in args.sizes.split(",") if n]
+
+    # settings are read at import time, so they are pinned before any project import
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["TRACE_ENABLED"] = "0"
+    os.environ["EMBED_CACHE"] = "1" if args.embed_cache else "0"
+    os.environ["PARSE_CACHE"] = "1" if args.parse_cache else "0"
+    if args.embeddings == "hash":
+        os.environ["EMBED_PROVIDER"] = "hash"
+
+    from config import settings
+    from evaluation.synthetic_corpus import sentence_pool, generate_corpus, make_queries
+    from ingestion.chunking import chunk_settings
+
+    chunker, chunk_size, chunk_overlap = chunk_settings()
+    pool = sentence_pool()
+    queries = make_queries(args.queries, seed=args.seed, pool=pool)
+    results: Dict[str, Any] = {
+        "meta": {
+            "created_at_utc": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embeddings": settings.EMBED_PROVIDER if args.embeddings == "hash" else settings.EMBED_MODEL,
+            "chunker": chunker,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "runs": [],
+    }
+
+    work = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        for n in sizes:
+            raw_dir = os.path.join(work, f"raw_{n}")
+            persist_dir = os.path.join(work, f"chroma_{n}")
+            print(f"\n=== corpus: {n} documents ===", flush=True)
+            generate_corpus(raw_dir, n, paragraphs=args.paragraphs, seed=args.seed, pool=pool)
+
+            run = {"corpus_docs": n, "ingest": bench_ingest(raw_dir, persist_dir, args)}
+            run["query"] = bench_queries(persist_dir, queries, args)
+            results["runs"].append(run)
+
+            ing = run["ingest"]
+            print(
+                f"  ingest | chunks={ing['chunks']} load={ing['load_files_per_sec']} files/s "
+                f"embed={ing['embed_chunks_per_sec']} chunks/s write={ing['write_chunks_per_sec']} chunks/s "
+                f"end-to-end={ing['end_to_end_chunks_per_sec']} chunks/s"
+            )
+            for key, q in run["query"].items():
+                if key.startswith("top_k="):
+                    a = q["answer"]
+                    print(f"  query {key:<8} | answer p50={a['p50_ms']}ms p95={a['p95_ms']}ms p99={a['p99_ms']}ms "
+                          f"retrieve p50={q['retrieve']['p50_ms']}ms peak_alloc={q['answer_peak_alloc_mb']}MB")
+    finally:
+        if args.keep:
+            print(f"\nKept corpora and indexes in {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        rows = compare(results, old, args.tolerance)
+        results["comparison"] = {"baseline": args.compare, "tolerance": args.tolerance, "rows": rows}
+        regressions = print_comparison(rows, args.tolerance)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {args.out}")
+
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
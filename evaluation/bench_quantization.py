@@ -0,0 +1,169 @@
+"""
+Benchmark: compressed vectors in the local backend (int8 / PQ, with and
+without PCA) against the uncompressed float32 baseline.
+
+  PYTHONPATH=. python evaluation/bench_quantization.py --n 100000 --queries 200 --json quant.json
+
+Vectors are synthetic and clustered (seeded), like bench_vector_store, but
+drawn in a --latent-dim subspace plus a little noise: sentence embeddings
+spend most of their variance in few directions, which is what PCA and PQ
+exploit (--latent-dim 0 gives bench_vector_store's isotropic vectors, a worst
+case). --vectors runs on real embeddings (.npy, n x dim) instead, with
+queries drawn from them. The collection is written once, then each config is
+copied, quantized and served in its own subprocess:
+  quantize_s     fitting PCA / the quantizer and encoding every row (optimize)
+  bytes/vector   size of one code, +4 for int8's per-row norm (float32: 4 * dim)
+  codes_mb       all codes: what the coarse pass reads (vectors.f32 is only
+                 touched for the shortlist, at most k * rescore_factor rows)
+  p50/p95_ms     single-query latency, top-k, coarse pass + float rescoring
+  recall@k       against exact numpy search, with the shortlist of
+                 k * rescore_factor rescored (the served result)
+  coarse_recall  the same with no extra rescoring candidates (factor 1): how
+                 good the compressed distances are on their own
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from evaluation.bench_vector_store import exact_top_k, make_vectors
+
+CONFIGS = {
+    "float32": {"mode": "none", "pca_dim": 0, "pq_m": 0},
+    "int8": {"mode": "int8", "pca_dim": 0, "pq_m": 0},
+    "pca128+int8": {"mode": "int8", "pca_dim": 128, "pq_m": 0},
+    "pq": {"mode": "pq", "pca_dim": 0, "pq_m": 0},
+    "pca128+pq": {"mode": "pq", "pca_dim": 128, "pq_m": 0},
+}
+
+def load_vectors(args):
+    if args.vectors:
+        x = np.ascontiguousarray(np.load(args.vectors), dtype=np.float32)
+        rng = np.random.default_rng(args.seed)
+        q = x[rng.integers(0, len(x), args.queries)] + 0.05 * rng.standard_normal((args.queries, x.shape[1])).astype(np.float32)
+        return x, (q / np.linalg.norm(q, axis=1, keepdims=True)).astype(np.float32)
+    if not args.latent_dim or args.latent_dim >= args.dim:
+        return make_vectors(args.n, args.dim, args.queries, args.seed)
+    # clustered in latent_dim dims, rotated into dim dims, plus a small isotropic floor
+    x, q = make_vectors(args.n, args.latent_dim, args.queries, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    basis, _ = np.linalg.qr(rng.standard_normal((args.dim, args.latent_dim)))
+    basis = basis.T.astype(np.float32)
+    out = []
+    for v in (x, q):
+        v = v @ basis + 0.01 * rng.standard_normal((len(v), args.dim)).astype(np.float32)
+        out.append((v / np.linalg.norm(v, axis=1, keepdims=True)).astype(np.float32))
+    return out[0], out[1]
+
+def open_collection(persist_dir: str, rescore_factor: int = 8):
+    from vector_store.local_store import LocalCollection
+    return LocalCollection(persist_dir, "bench", rescore_factor=rescore_factor)
+
+# ---------- Subprocess worker ----------
+def worker_serve(persist_dir: str, queries_path: str, k: int, rescore_factor: int):
+    q = np.load(queries_path)
+    coll = open_collection(persist_dir, rescore_factor)
+
+    lat, ids = [], []
+    for i in range(len(q)):
+        t0 = time.perf_counter()
+        res = coll.query(query_embeddings=q[i:i + 1], n_results=k, include=["distances"])
+        lat.append(time.perf_counter() - t0)
+        ids.append([int(v) for v in res["ids"][0]])
+
+    coll.rescore_factor = 1
+    coarse = [[int(v) for v in coll.query(query_embeddings=q[i:i + 1], n_results=k, include=["distances"])["ids"][0]] for i in range(len(q))]
+
+    ms = np.asarray(lat) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "ids": ids,
+        "coarse_ids": coarse,
+    }
+
+def run_worker(*argv) -> dict:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", *map(str, argv)], capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr[-2000:])
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def recall(truth, found, k: int) -> float:
+    return round(float(np.mean([len(set(a) & set(b)) / k for a, b in zip(truth, found)])), 4)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50000, help="vectors in the collection")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--latent-dim", type=int, default=64, help="dims the synthetic vectors vary in (0 = isotropic)")
+    parser.add_argument("--vectors", default="", help="real embeddings (.npy) instead of synthetic ones")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=8, help="shortlist = k * this, rescored with float vectors")
+    parser.add_argument("--ivf", action="store_true", help="also build the IVF index (coarse pass over the probed lists only)")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default="", help="write results to this file")
+    parser.add_argument("--worker", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        persist_dir, path, k, factor = args.worker
+        print(json.dumps(worker_serve(persist_dir, path, int(k), int(factor))))
+        return
+
+    work = tempfile.mkdtemp(prefix="bench_quant_")
+    try:
+        x, q = load_vectors(args)
+        args.n, args.dim = x.shape
+        np.save(os.path.join(work, "q.npy"), q)
+        truth = exact_top_k(x, q, args.k)
+
+        base_dir = os.path.join(work, "base")
+        coll = open_collection(base_dir)
+        for s in range(0, len(x), 10000):
+            coll.upsert(ids=[str(i) for i in range(s, min(len(x), s + 10000))], embeddings=x[s:s + 10000])
+        del x, coll
+
+        results = {"n": args.n, "dim": args.dim, "queries": args.queries, "k": args.k, "rescore_factor": args.rescore_factor, "configs": {}}
+        for name in [c for c in args.configs.split(",") if c]:
+            persist_dir = os.path.join(work, name)
+            shutil.copytree(base_dir, persist_dir)
+            coll = open_collection(persist_dir)
+            coll.set_quantization(**CONFIGS[name])
+            t0 = time.perf_counter()
+            coll.optimize(ivf_min_rows=0 if args.ivf else 10**12)
+            quantize_s = time.perf_counter() - t0
+            stats = coll.quantization_stats()
+            del coll
+
+            serve = run_worker(persist_dir, os.path.join(work, "q.npy"), args.k, args.rescore_factor)
+            quantized = CONFIGS[name]["mode"] != "none"
+            bytes_per_vector = stats["code_bytes_per_vector"] if quantized else stats["float_bytes_per_vector"]
+            results["configs"][name] = {
+                "quantize_s": round(quantize_s, 3),
+                "bytes/vector": bytes_per_vector,
+                "compression": round(stats["float_bytes_per_vector"] / bytes_per_vector, 1),
+                "codes_mb": stats["codes_mb"] if quantized else stats["vectors_mb"],
+                "p50_ms": serve["p50_ms"],
+                "p95_ms": serve["p95_ms"],
+                f"recall@{args.k}": recall(truth, serve["ids"], args.k),
+                "coarse_recall": recall(truth, serve["coarse_ids"], args.k) if quantized else None,
+            }
+            print(name, results["configs"][name], flush=True)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark: Chroma vs the local memory-mapped backend (exact and IVF).
+
+  PYTHONPATH=. python evaluation/bench_vector_store.py --n 100000 --queries 200 --json vs.json
+
+Vectors are synthetic and clustered (seeded), so no model is needed. Each
+backend is built and then served in its own subprocess, so the reported memory
+is that backend's alone:
+  build_s        upserting all vectors in batches (+ optimize for local)
+  cold_start_ms  opening the store and answering the first query
+  p50/p95_ms     single-query latency, top-10
+  batch_qps      queries/s when sent 32 at a time
+  rss_delta_mb   RSS growth from importing + opening the backend and querying
+                 (memory-mapped pages count while resident but are shared
+                 between processes serving the same files)
+  recall@10      against exact numpy search
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKENDS = {
+    "chroma": {"backend": "chroma"},
+    "local-exact": {"backend": "local", "ivf_min_rows": 10**12},
+    "local-ivf": {"backend": "local", "ivf_min_rows": 0},
+}
+
+def rss_mb() -> float:
+    # current RSS (Linux); the high-water mark elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1e6 if sys.platform == "darwin" else 1e3)
+
+def make_vectors(n: int, dim: int, n_queries: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, n // 500), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    q = x[rng.integers(0, n, n_queries)] + 0.05 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return x.astype(np.float32), q.astype(np.float32)
+
+def exact_top_k(x: np.ndarray, q: np.ndarray, k: int):
+    out = []
+    for s in range(0, len(q), 64):
+        d = (x @ q[s:s + 64].T) * -2.0 + (x * x).sum(axis=1)[:, None]
+        out.extend(np.argsort(d, axis=0)[:k].T.tolist())
+    return out
+
+def open_collection(name: str, persist_dir: str):
+    from vector_store.store import get_client
+    cfg = BACKENDS[name]
+    client = get_client(persist_dir, backend=cfg["backend"])
+    return client, client.get_or_create_collection(name="bench", embedding_function=None)
+
+# ---------- Subprocess workers ----------
+def worker_build(name: str, persist_dir: str, vectors_path: str, batch_size: int):
+    x = np.load(vectors_path, mmap_mode="r")
+    client, coll = open_collection(name, persist_dir)
+    batch_size = min(batch_size, client.get_max_batch_size())
+    t0 = time.perf_counter()
+    for s in range(0, len(x), batch_size):
+        batch = np.ascontiguousarray(x[s:s + batch_size])
+        coll.upsert(ids=[str(i) for i in range(s, s + len(batch))], documents=[f"doc {i}" for i in range(s, s + len(batch))], embeddings=batch)
+    optimize = getattr(coll, "optimize", None)
+    if callable(optimize):
+        optimize(ivf_min_rows=BACKENDS[name]["ivf_min_rows"])
+    return {"build_s": round(time.perf_counter() - t0, 3)}
+
+def worker_serve(name: str, persist_dir: str, queries_path: str, k: int):
+    q = np.load(queries_path)
+    base = rss_mb()
+
+    t0 = time.perf_counter()
+    _, coll = open_collection(name, persist_dir)
+    coll.query(query_embeddings=q[:1], n_results=k, include=["distances"])
+    cold_ms = (time.perf_counter() - t0) * 1000.0
+
+    lat, ids = [], []
+    for i in range(len(q)):
+        t0 = time.perf_counter()
+        res = coll.query(query_embeddings=q[i:i + 1], n_results=k, include=["documents", "distances"])
+        lat.append(time.perf_counter() - t0)
+        ids.append([int(v) for v in res["ids"][0]])
+
+    t0 = time.perf_counter()
+    for s in range(0, len(q), 32):
+        coll.query(query_embeddings=q[s:s + 32], n_results=k, include=["distances"])
+    batch_s = time.perf_counter() - t0
+
+    ms = np.asarray(lat) * 1000.0
+    return {
+        "cold_start_ms": round(cold_ms, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "batch_qps": round(len(q) / batch_s, 1),
+        "rss_delta_mb": round(rss_mb() - base, 1),
+        "ids": ids,
+    }
+
+def run_worker(*argv) -> dict:
+    env = dict(os.environ, ANONYMIZED_TELEMETRY="False")
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", *map(str, argv)], capture_output=True, text=True, env=env)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr[-2000:])
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50000, help="vectors in the collection")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default="", help="write results to this file")
+    parser.add_argument("--worker", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        kind, name, persist_dir, path, extra = args.worker
+        fn = worker_build if kind == "build" else worker_serve
+        print(json.dumps(fn(name, persist_dir, path, int(extra))))
+        return
+
+    work = tempfile.mkdtemp(prefix="bench_vs_")
+    try:
+        x, q = make_vectors(args.n, args.dim, args.queries, args.seed)
+        np.save(os.path.join(work, "x.npy"), x)
+        np.save(os.path.join(work, "q.npy"), q)
+        truth = exact_top_k(x, q, args.k)
+        del x
+
+        results = {"n": args.n, "dim": args.dim, "queries": args.queries, "k": args.k, "backends": {}}
+        for name in [b for b in args.backends.split(",") if b]:
+            persist_dir = os.path.join(work, name)
+            build = run_worker("build", name, persist_dir, os.path.join(work, "x.npy"), args.batch_size)
+            serve = run_worker("serve", name, persist_dir, os.path.join(work, "q.npy"), args.k)
+            found = serve.pop("ids")
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(truth, found)])
+            size_mb = sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(persist_dir) for f in fs) / 1e6
+            results["backends"][name] = {**build, **serve, f"recall@{args.k}": round(float(recall), 4), "disk_mb": round(size_mb, 1)}
+            print(name, results["backends"][name], flush=True)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
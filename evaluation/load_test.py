@@ -0,0 +1,238 @@
+"""
+Load test for the HTTP server (serving/api.py) against the fake local LLM.
+
+  PYTHONPATH=. python evaluation/load_test.py --embeddings hash --concurrency 1,8,32,128 --requests 200
+  PYTHONPATH=. python evaluation/load_test.py --url http://127.0.0.1:8000 --stream
+
+Without --url it builds a synthetic corpus (evaluation/synthetic_corpus.py),
+starts `python -m serving.api` on it with LLM_PROVIDER=fake, and stops it at
+the end. Each concurrency level is a closed loop: that many clients send
+requests back to back until --requests have been sent. Per level it reports
+  ok / shed (503) / errors, throughput (req/s)
+  p50 / p95 / p99 latency of successful requests (and time to first token with --stream)
+  the server's pool and embedding-batcher counters for that level
+Levels past SERVE_WORKERS + SERVE_MAX_QUEUE clients show load shedding.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+def percentiles(samples_s: List[float]) -> Dict[str, Optional[float]]:
+    if not samples_s:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(samples_s) * 1000.0, [50, 95, 99])
+    return {"p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def get_json(url: str) -> Dict[str, Any]:
+    try:
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            return json.load(resp)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+
+def wait_healthy(url: str, proc: Optional[subprocess.Popen], timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            if get_json(url + "/health").get("status") == "ok":
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} not healthy after {timeout_s:.0f}s")
+
+def one_request(url: str, body: Dict[str, Any], stream: bool, timeout_s: float) -> Dict[str, Any]:
+    data = json.dumps(body).encode("utf-8")
+    req = urllib.request.Request(url + ("/query/stream" if stream else "/query"), data=data, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    ttft = None
+    try:
+        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
+            if stream:
+                for line in resp:
+                    if ttft is None and b'"token"' in line:
+                        ttft = time.perf_counter() - t0
+            else:
+                resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0  # connection refused / reset / timed out
+    return {"status": status, "latency_s": time.perf_counter() - t0, "ttft_s": ttft}
+
+def run_level(url: str, queries: List[str], concurrency: int, n_requests: int, args) -> Dict[str, Any]:
+    before = get_json(url + "/health")
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    counter = iter(range(n_requests))
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            body = {"query": queries[i % len(queries)], "top_k": args.top_k, "mode": args.mode, "rerank": False}
+            r = one_request(url, body, args.stream, args.timeout)
+            with lock:
+                results.append(r)
+            if r["status"] == 503:
+                time.sleep(args.backoff_ms / 1000.0)  # what a well-behaved client does on Retry-After
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    after = get_json(url + "/health")
+
+    ok = [r for r in results if r["status"] == 200]
+    out = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "shed": sum(1 for r in results if r["status"] == 503),
+        "errors": sum(1 for r in results if r["status"] not in (200, 503)),
+        "throughput_rps": round(len(ok) / wall, 1) if wall > 0 else None,
+        "latency": percentiles([r["latency_s"] for r in ok]),
+    }
+    if args.stream:
+        out["ttft"] = percentiles([r["ttft_s"] for r in ok if r["ttft_s"] is not None])
+
+    pool_a, pool_b = after.get("pool", {}), before.get("pool", {})
+    out["server"] = {
+        "max_queued": pool_a.get("max_queued"),
+        "shed_queue_full": pool_a.get("shed_queue_full", 0) - pool_b.get("shed_queue_full", 0),
+        "shed_queue_timeout": pool_a.get("shed_queue_timeout", 0) - pool_b.get("shed_queue_timeout", 0),
+    }
+    eb_a, eb_b = after.get("embedding_batcher"), before.get("embedding_batcher")
+    if eb_a and eb_b:
+        batches = eb_a["batches"] - eb_b["batches"]
+        requests = eb_a["requests"] - eb_b["requests"]
+        out["server"]["embed_batches"] = batches
+        out["server"]["embed_requests_per_batch"] = round(requests / batches, 2) if batches else None
+    return out
+
+def start_server(args, work: str) -> Tuple[subprocess.Popen, str]:
+    from evaluation.synthetic_corpus import sentence_pool, generate_corpus
+
+    raw_dir, persist_dir = os.path.join(work, "raw"), os.path.join(work, "chroma")
+    env = dict(
+        os.environ,
+        LLM_PROVIDER="fake",
+        FAKE_LLM_TTFT_MS=str(args.llm_ttft_ms),
+        FAKE_LLM_CHUNK_MS=str(args.llm_chunk_ms),
+        ANSWER_CACHE="0",  # every request takes the full path
+        RERANK="0",
+        ANONYMIZED_TELEMETRY="False",
+    )
+    if args.embeddings == "hash":
+        env["EMBED_PROVIDER"] = "hash"
+    for flag, name in (("server_workers", "SERVE_WORKERS"), ("max_queue", "SERVE_MAX_QUEUE"), ("batch_window_ms", "SERVE_BATCH_WINDOW_MS")):
+        if getattr(args, flag) is not None:
+            env[name] = str(getattr(args, flag))
+
+    print(f"building a {args.docs}-document corpus in {work}", flush=True)
+    generate_corpus(raw_dir, args.docs, seed=args.seed, pool=sentence_pool())
+    subprocess.run(
+        [sys.executable, "-m", "ingestion.build_index", "--full", "--quiet", "--raw-dir", raw_dir, "--persist-dir", persist_dir],
+        env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+
+    port = free_port()
+    with open(os.path.join(work, "server.log"), "w") as log:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "serving.api", "--port", str(port), "--persist-dir", persist_dir],
+            env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    return proc, f"http://127.0.0.1:{port}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of the HTTP server.")
+    parser.add_argument("--url", default="", help="test a running server instead of starting one")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--stream", action="store_true", help="use /query/stream and report time to first token")
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--mode", default="hybrid")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request (s)")
+    parser.add_argument("--backoff-ms", type=float, default=100.0, help="client pause after a 503 before its next request")
+    parser.add_argument("--docs", type=int, default=50, help="synthetic corpus size (without --url)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embeddings", choices=["model", "hash"], default="model",
+                        help="hash = model-free deterministic encoder (no model download needed)")
+    parser.add_argument("--llm-ttft-ms", type=float, default=200.0, help="fake LLM time to first token")
+    parser.add_argument("--llm-chunk-ms", type=float, default=5.0, help="fake LLM delay per streamed word")
+    parser.add_argument("--server-workers", type=int, default=None, help="SERVE_WORKERS of the started server")
+    parser.add_argument("--max-queue", type=int, default=None, help="SERVE_MAX_QUEUE of the started server")
+    parser.add_argument("--batch-window-ms", type=float, default=None, help="SERVE_BATCH_WINDOW_MS of the started server")
+    parser.add_argument("--out", default="", help="write results JSON here")
+    args = parser.parse_args()
+
+    from evaluation.synthetic_corpus import sentence_pool, make_queries
+
+    queries = make_queries(max(args.requests, 50), seed=args.seed, pool=sentence_pool())
+    proc, work, url = None, None, args.url.rstrip("/")
+    try:
+        if not url:
+            work = tempfile.mkdtemp(prefix="rag_load_")
+            proc, url = start_server(args, work)
+        try:
+            wait_healthy(url, proc, timeout_s=300)
+        except (RuntimeError, TimeoutError):
+            if work:
+                with open(os.path.join(work, "server.log")) as f:
+                    print(f.read()[-3000:], file=sys.stderr)
+            raise
+
+        results = {"url": url, "stream": args.stream, "levels": []}
+        for c in [int(c) for c in args.concurrency.split(",") if c]:
+            level = run_level(url, queries, c, args.requests, args)
+            results["levels"].append(level)
+            lat = level["latency"]
+            print(
+                f"c={c:<4} ok={level['ok']:<4} shed={level['shed']:<4} err={level['errors']:<3} "
+                f"{level['throughput_rps']} req/s  p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms p99={lat['p99_ms']}ms"
+                + (f"  ttft p50={level['ttft']['p50_ms']}ms" if args.stream else "")
+                + f"  {level['server']}",
+                flush=True,
+            )
+        results["health"] = get_json(url + "/health")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if work:
+            shutil.rmtree(work, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,11 @@ REFUSAL = "I don't know based on the provided documents."
 def has_citation(text: str) -> bool:
     return "[" in text and "]" in text  
 
+def judge(expected: str, out: str) -> bool:
+    if expected == "refuse":
+        return out == REFUSAL
+    return (out != REFUSAL) and has_citation(out)
+
 def main():
     print("\n=== CeADAR RAG Evaluation (Lightweight) ===\n")
     total = len(TESTS)
@@ -27,11 +32,7 @@ def main():
         res = answer(q, top_k=4)
         out = (res["answer"] or "").strip()
 
-        ok = False
-        if expected == "refuse":
-            ok = (out == REFUSAL)
-        else:
-            ok = (out != REFUSAL) and has_citation(out)
+        ok = judge(expected, out)
 
         status = "✅ PASS" if ok else "❌ FAIL"
         print("-" * 90)
@@ -0,0 +1,130 @@
+"""
+Synthetic corpus generator for benchmarks.
+
+Sentences are sampled from the real documents in data/raw (or a small built-in
+vocabulary when that folder is empty), so chunk lengths and token statistics
+stay close to the real corpus while the document count scales freely.
+Everything is seeded: the same arguments always produce the same files.
+
+  PYTHONPATH=. python evaluation/synthetic_corpus.py --docs 2000 --out /tmp/synthetic_raw
+"""
+import argparse
+import os
+import random
+import re
+import zipfile
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from config.settings import RAW_DIR
+
+_FALLBACK_WORDS = (
+    "attention transformer encoder decoder layer token embedding sequence model training "
+    "regulation provider deployer risk system obligation article annex conformity assessment "
+    "transparency oversight dataset evaluation benchmark latency retrieval context answer "
+    "governance compliance safety robustness accuracy documentation market authority"
+).split()
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+# characters XML 1.0 cannot carry (PDF extraction leaves some behind)
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# smallest .docx that docx2txt (and Word) will open: content types, rels, one body part
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+def sentence_pool(raw_dir: str = RAW_DIR, min_words: int = 6, limit: int = 20000) -> List[str]:
+    """Sentences from the real corpus; falls back to generated ones."""
+    pool: List[str] = []
+    if os.path.isdir(raw_dir):
+        from ingestion.loaders import list_source_files, load_file
+        for path in list_source_files(raw_dir):
+            for d in load_file(path):
+                for s in _SENTENCE.split(" ".join(d.page_content.split())):
+                    if len(s.split()) >= min_words:
+                        pool.append(s)
+                        if len(pool) >= limit:
+                            return pool
+    if not pool:
+        rng = random.Random(0)
+        for _ in range(2000):
+            words = rng.choices(_FALLBACK_WORDS, k=rng.randint(8, 20))
+            pool.append(" ".join(words).capitalize() + ".")
+    return pool
+
+def write_docx(path: str, paragraphs: List[str]) -> None:
+    texts = (escape(_XML_INVALID.sub(" ", p)) for p in paragraphs)
+    body = "".join(f"<w:p><w:r><w:t xml:space=\"preserve\">{t}</w:t></w:r></w:p>" for t in texts)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        z.writestr("_rels/.rels", _RELS)
+        z.writestr("word/document.xml", document)
+
+def generate_corpus(
+    out_dir: str,
+    n_docs: int,
+    paragraphs: int = 12,
+    sentences_per_paragraph: Tuple[int, int] = (3, 7),
+    seed: int = 0,
+    pool: Optional[List[str]] = None,
+) -> List[str]:
+    """Writes n_docs .docx files into out_dir and returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    pool = pool or sentence_pool()
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n_docs):
+        doc_paragraphs = [f"Synthetic document {i:05d}"]
+        for p in range(paragraphs):
+            k = rng.randint(*sentences_per_paragraph)
+            doc_paragraphs.append(f"Section {i}.{p + 1}. " + " ".join(rng.choices(pool, k=k)))
+        path = os.path.join(out_dir, f"synthetic_{i:05d}.docx")
+        write_docx(path, doc_paragraphs)
+        paths.append(path)
+    return paths
+
+def make_queries(n: int, seed: int = 0, pool: Optional[List[str]] = None, span_words: Tuple[int, int] = (5, 10)) -> List[str]:
+    """Questions built from word spans of corpus sentences, so every query has real matches."""
+    pool = pool or sentence_pool()
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(n):
+        words = rng.choice(pool).split()
+        k = min(len(words), rng.randint(*span_words))
+        start = rng.randint(0, len(words) - k)
+        queries.append("What does the document say about " + " ".join(words[start:start + k]).strip(".,;:") + "?")
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic .docx corpus from data/raw.")
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--paragraphs", type=int, default=12, help="paragraphs per document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="output folder (use it as --raw-dir for build_index)")
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.out, args.docs, paragraphs=args.paragraphs, seed=args.seed)
+    print(f"✅ Wrote {len(paths)} documents to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config.settings import BASE_DIR, CHROMA_DIR, COLLECTION_NAME
+
+class IndexBuildJob:
+    """
+    One `python -m ingestion.build_index` run in a subprocess, so neither the
+    UI thread nor the serving process does the parsing / embedding. The build
+    writes a new index version and swaps CURRENT itself; engines pick the new
+    version up on their next query.
+    """
+
+    def __init__(self, full: bool = False, persist_dir: str = CHROMA_DIR, extra_args: Optional[List[str]] = None, collection: str = COLLECTION_NAME):
+        self.full = full
+        self.persist_dir = persist_dir
+        self.collection = collection
+        self.extra_args = list(extra_args or [])
+        self.state = "pending"  # pending -> running -> succeeded | failed
+        self.started_at_utc: Optional[str] = None
+        self.finished_at_utc: Optional[str] = None
+        self.returncode: Optional[int] = None
+        self.stdout = ""
+        self.stderr = ""
+        self._started = 0.0
+        self._elapsed: Optional[float] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._final_progress: Optional[Dict[str, Any]] = None
+        fd, self.progress_path = tempfile.mkstemp(prefix="index_build_", suffix=".json")
+        os.close(fd)
+
+    def start(self) -> "IndexBuildJob":
+        cmd = [sys.executable, "-m", "ingestion.build_index", "--quiet", "--persist-dir", self.persist_dir, "--collection", self.collection, "--progress-file", self.progress_path]
+        if self.full:
+            cmd.append("--full")
+        cmd.extend(self.extra_args)
+
+        self.state = "running"
+        self.started_at_utc = datetime.now(timezone.utc).isoformat()
+        self._started = time.perf_counter()
+        self._proc = subprocess.Popen(cmd, cwd=str(BASE_DIR), env=os.environ.copy(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        self._thread = threading.Thread(target=self._wait, name="index-build", daemon=True)
+        self._thread.start()
+        return self
+
+    def _wait(self) -> None:
+        out, err = self._proc.communicate()
+        self.stdout, self.stderr = out or "", err or ""
+        self.returncode = self._proc.returncode
+        self._elapsed = time.perf_counter() - self._started
+        self.finished_at_utc = datetime.now(timezone.utc).isoformat()
+        self._final_progress = self.progress()
+        try:
+            os.remove(self.progress_path)
+        except OSError:
+            pass
+        self.state = "succeeded" if self.returncode == 0 else "failed"
+
+    @property
+    def running(self) -> bool:
+        return self.state == "running"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """True once the build has finished."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    def progress(self) -> Dict[str, Any]:
+        """Latest progress written by build_index: phase, files_done / files_to_index, committed / submitted chunks."""
+        if self._final_progress is not None:
+            return self._final_progress
+        try:
+            with open(self.progress_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def fraction(self) -> float:
+        """Rough 0..1 completion for a progress bar."""
+        if not self.running:
+            return 1.0
+        p = self.progress()
+        phase = p.get("phase")
+        if phase in ("optimizing", "bm25", "metadata_index", "swapping", "done"):
+            return 0.95
+        if phase != "indexing":
+            return 0.02
+        files = p.get("files_to_index") or 0
+        done = p.get("files_done", 0) / files if files else 0.0
+        return 0.05 + 0.85 * min(1.0, done)
+
+    def status(self) -> Dict[str, Any]:
+        elapsed = self._elapsed if self._elapsed is not None else (time.perf_counter() - self._started if self._started else 0.0)
+        return {
+            "state": self.state,
+            "full": self.full,
+            "collection": self.collection,
+            "started_at_utc": self.started_at_utc,
+            "finished_at_utc": self.finished_at_utc,
+            "elapsed_s": round(elapsed, 1),
+            "returncode": self.returncode,
+            "progress": self.progress(),
+            "stdout_tail": self.stdout[-2000:],
+            "stderr_tail": self.stderr[-2000:],
+        }
+
+# ---------- Process-wide job ----------
+_job: Optional[IndexBuildJob] = None
+_job_lock = threading.Lock()
+
+def start_build(full: bool = False, persist_dir: str = CHROMA_DIR, collection: str = COLLECTION_NAME) -> IndexBuildJob:
+    """Starts a background build, or returns the one already running in this process (one build at a time)."""
+    global _job
+    with _job_lock:
+        if _job is None or not _job.running:
+            _job = IndexBuildJob(full=full, persist_dir=persist_dir, collection=collection).start()
+        return _job
+
+def current_build() -> Optional[IndexBuildJob]:
+    """The running or most recently finished build of this process, if any."""
+    return _job
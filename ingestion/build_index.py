@@ -1,36 +1,417 @@
+import argparse
+import json
 import os
 import shutil
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
-from config.settings import RAW_DIR, CHROMA_DIR, COLLECTION_NAME, CHUNK_SIZE, CHUNK_OVERLAP
-from ingestion.loaders import load_documents
-from ingestion.chunking import chunk_documents
+from config.settings import RAW_DIR, CHROMA_DIR, COLLECTION_NAME, LOAD_WORKERS, INGEST_BATCH_SIZE, INDEX_KEEP_VERSIONS, VECTOR_BACKEND, EMBED_NORMALIZE
+from ingestion.loaders import list_source_files, iter_loaded_files, supported_extensions
+from ingestion.chunking import chunk_documents, chunk_settings, relinked_chunks
+from ingestion.manifest import MANIFEST_NAME, file_sha256, empty_manifest, load_manifest, save_manifest
 from vector_store.embeddings import get_embedding_function
-from vector_store.chroma_store import get_or_create_collection, add_documents_to_collection
+from vector_store.chroma_store import get_or_create_collection, delete_from_collection, BatchWriter
+from vector_store.store import get_client, optimize_collection, clone_index
+from vector_store.bm25 import BM25_FILENAME, BM25Index, build_bm25_from_collection
+from vector_store.metadata_index import METADATA_INDEX_FILENAME, MetadataIndex, build_metadata_index_from_collection
+from vector_store.quantization import QUANTIZATION_MODES
+from vector_store.index_meta import (
+    read_index_meta, update_index_meta, new_index_version, version_dir, current_version, active_index_dir,
+    swap_current, record_build, prune_versions, collection_root,
+    INDEX_META_NAME, INCOMPLETE_NAME, mark_incomplete, read_incomplete, clear_incomplete, resumable_version, discard_incomplete,
+)
 
-def main():
-    if not os.path.isdir(RAW_DIR):
-        raise FileNotFoundError(f"Missing raw data folder: {RAW_DIR}")
+def print_progress(p):
+    print(
+        f"  batch {p['batches']} | committed {p['committed']}/{p['submitted']} chunks "
+        f"(written={p['written']} skipped={p['skipped']}) | {p['chunks_per_sec']:.1f} chunks/s",
+        flush=True
+    )
+
+def _timed(items: Iterable[Any], timings: Dict[str, float], key: str) -> Iterator[Any]:
+    # accumulates the time spent waiting for the next item (e.g. on parser workers)
+    it = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            timings[key] += time.perf_counter() - t0
+        yield item
+
+def _fetch_chunks(collection, ids: List[str], page_size: int = 5000) -> Dict[str, List[Any]]:
+    """Documents + metadata of the given chunk IDs that are (still) in the collection."""
+    out: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+    ids = list(dict.fromkeys(ids))
+    for s in range(0, len(ids), page_size):
+        page = collection.get(ids=ids[s:s + page_size], include=["documents", "metadatas"])
+        out["ids"].extend(page["ids"])
+        out["documents"].extend(d or "" for d in page["documents"])
+        out["metadatas"].extend(page["metadatas"])
+    return out
+
+class BuildProgress:
+    """Progress of one build as JSON, rewritten atomically at each step (read by ingestion.background)."""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.state: Dict[str, Any] = {}
+
+    def update(self, **fields: Any) -> None:
+        self.state.update(fields)
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Build or incrementally update the index into a new version folder.")
+    parser.add_argument("--full", action="store_true", help="rebuild from scratch instead of updating a copy of the current version")
+    parser.add_argument("--workers", type=int, default=LOAD_WORKERS, help="parser processes (0 = one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="chunks embedded + written per batch")
+    parser.add_argument("--raw-dir", default=RAW_DIR, help="folder with the source documents (.pdf, .docx, .xlsx, .html, .md, .txt)")
+    parser.add_argument("--persist-dir", default=CHROMA_DIR, help="index root (versions/, CURRENT, index_meta.json)")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="collection to build; others than the default live under <persist-dir>/collections/<name>")
+    parser.add_argument("--keep-versions", type=int, default=INDEX_KEEP_VERSIONS, help="index versions kept on disk")
+    parser.add_argument("--progress-file", default="", help="write build progress as JSON to this file")
+    parser.add_argument("--quiet", action="store_true", help="no per-batch progress lines")
+    parser.add_argument("--discard-incomplete", action="store_true", help="delete interrupted builds instead of resuming the latest one")
+    # compression is a setting of the collection: later builds keep it unless these are given again
+    parser.add_argument("--quantize", choices=QUANTIZATION_MODES, default=None, help="compressed vectors for the coarse search pass (local backend; default: keep the collection's setting, VECTOR_QUANTIZATION for new ones)")
+    parser.add_argument("--pca-dim", type=int, default=None, help="PCA-project vectors to this many dims before quantizing (0 = off)")
+    parser.add_argument("--pq-subspaces", type=int, default=None, help="bytes per vector with --quantize pq (must divide the (PCA) dim; 0 = dim / 8)")
+    args = parser.parse_args(argv)
+
+    # Queries keep using the CURRENT version while the new one is built in its
+    # own folder; CURRENT is switched only after the build completed.
+    root = collection_root(args.collection, args.persist_dir, COLLECTION_NAME)
+    if args.discard_incomplete:
+        dropped = discard_incomplete(root)
+        if dropped:
+            print(f"  discarded unfinished builds | {', '.join(dropped)}")
+    base_version = current_version(root)
+    base_dir = None if args.full or base_version is None else active_index_dir(root)
+    if base_dir is not None and bool((read_index_meta(base_dir) or {}).get("embed_normalize", False)) != EMBED_NORMALIZE:
+        # unchanged chunks would keep vectors made the other way
+        print(f"⚠️ EMBED_NORMALIZE={int(EMBED_NORMALIZE)} differs from the current version's: rebuilding from scratch")
+        base_dir = None
+    mode = "full" if base_dir is None else "incremental"
+
+    # an interrupted build of the same base continues where it stopped (its
+    # committed chunks and manifest are kept); a full build only resumes a full one
+    version = resumable_version(root)
+    info = read_incomplete(version_dir(root, version)) if version else None
+    resume = info is not None and info.get("embed_normalize") == EMBED_NORMALIZE and (mode == "incremental" or info.get("mode") == "full")
+    if resume and not info.get("ready"):
+        # stopped while the base was still being copied: start that copy over
+        shutil.rmtree(version_dir(root, version), ignore_errors=True)
+        resume = False
+    elif resume:
+        mode = info.get("mode", mode)
+        print(f"  resuming unfinished build | version={version} mode={mode}")
+    else:
+        version = new_index_version()
+    build_dir = version_dir(root, version)
+    progress = BuildProgress(args.progress_file)
+    progress.update(phase="starting", version=version, mode=mode, resumed=resume)
+    started_at = datetime.now(timezone.utc).isoformat()
+
+    try:
+        result = build(args, build_dir, base_dir, version, progress, base_version=base_version, resume=resume)
+    except BaseException as e:
+        # the folder is kept (flagged incomplete, no longer owned) so the next run resumes into it
+        info = read_incomplete(build_dir)
+        incomplete = info is not None
+        if incomplete:
+            mark_incomplete(build_dir, **dict(info, pid=None))
+        record_build(root, {
+            "version": version,
+            "started_at_utc": started_at,
+            "finished_at_utc": datetime.now(timezone.utc).isoformat(),
+            "success": False,
+            "incomplete": incomplete,
+            "mode": mode,
+            "resumed": resume,
+            "error": f"{type(e).__name__}: {e}",
+        })
+        progress.update(phase="failed", error=f"{type(e).__name__}: {e}")
+        if incomplete:
+            print(f"⚠️ build of {version} stopped; the next run resumes it (or pass --discard-incomplete)", flush=True)
+        raise
 
-    # clean rebuild
-    if os.path.isdir(CHROMA_DIR):
-        shutil.rmtree(CHROMA_DIR)
+    if result["index_version"] == version:
+        progress.update(phase="swapping")
+        swap_current(root, version)
+        pruned = prune_versions(root, args.keep_versions)
+        if pruned:
+            print(f"  pruned versions | {', '.join(pruned)}")
 
-    docs = load_documents(RAW_DIR)
-    if not docs:
-        raise RuntimeError("No .pdf or .docx found in data/raw")
+    stats, timings = result["stats"], result["timings"]
+    record_build(root, {
+        "version": result["index_version"],
+        "new_version": result["index_version"] == version,
+        "started_at_utc": started_at,
+        "finished_at_utc": datetime.now(timezone.utc).isoformat(),
+        "success": True,
+        "mode": progress.state["mode"],
+        "resumed": resume,
+        "duration_s": round(timings["total_s"], 3),
+        "chunks": stats["total_chunks"],
+        "upserted": stats["upserted"],
+        "deleted": stats["deleted"],
+        "files": {k: stats[k] for k in ("new", "changed", "unchanged", "removed")},
+        "chunks_per_sec": round(stats["upserted"] / timings["total_s"], 1) if timings["total_s"] > 0 else 0.0,
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+    })
+    progress.update(phase="done", index_version=result["index_version"])
+    return result
 
-    chunks = chunk_documents(docs, CHUNK_SIZE, CHUNK_OVERLAP)
+def build(
+    args,
+    persist_dir: str,
+    base_dir: Optional[str],
+    version: str,
+    progress: BuildProgress,
+    base_version: Optional[str] = None,
+    resume: bool = False,
+) -> Dict[str, Any]:
+    """
+    Builds version `version` into persist_dir, starting from a copy of base_dir
+    (incremental) or from nothing (full). When nothing changed since base_dir no
+    copy is made and the base version is returned as the index_version.
+
+    persist_dir stays flagged incomplete until the build finished; with
+    resume=True it already holds an interrupted build, which is continued from
+    its own manifest instead of a fresh copy.
+    """
+    raw_dir = args.raw_dir
+    started = time.perf_counter()
+    ingested_at = int(time.time())  # unix seconds; the ingested_after / ingested_before filters compare against it
+
+    if not os.path.isdir(raw_dir):
+        raise FileNotFoundError(f"Missing raw data folder: {raw_dir}")
+
+    paths = list_source_files(raw_dir)
+    if not paths:
+        raise RuntimeError(f"No {' / '.join(supported_extensions())} files found in {raw_dir}")
+
+    chunker, chunk_size, chunk_overlap = chunk_settings()
+    if resume:
+        manifest = load_manifest(persist_dir, chunk_size, chunk_overlap, chunker)
+    elif base_dir:
+        manifest = load_manifest(base_dir, chunk_size, chunk_overlap, chunker)
+    else:
+        manifest = empty_manifest(chunk_size, chunk_overlap, chunker)
+
+    known = manifest["files"]
+    stats = {"new": 0, "changed": 0, "unchanged": 0, "removed": 0, "docs": 0, "upserted": 0, "deleted": 0}
+    timings = {"hash_s": 0.0, "copy_s": 0.0, "load_s": 0.0, "chunk_s": 0.0, "embed_s": 0.0, "write_s": 0.0, "optimize_s": 0.0, "bm25_s": 0.0, "metadata_index_s": 0.0}
+
+    # hash everything first; only new / changed files are parsed
+    progress.update(phase="hashing", files_total=len(paths))
+    to_load = []
+    hashes = {}
+    t0 = time.perf_counter()
+    for path in paths:
+        filename = os.path.basename(path)
+        sha = file_sha256(path)
+        entry = known.get(filename)
+        if entry and entry.get("sha256") == sha:
+            stats["unchanged"] += 1
+            continue
+        stats["changed" if entry else "new"] += 1
+        hashes[filename] = sha
+        to_load.append(path)
+    timings["hash_s"] = time.perf_counter() - t0
+
+    current = {os.path.basename(p) for p in paths}
+    requantize = any(v is not None for v in (args.quantize, args.pca_dim, args.pq_subspaces))
+    if base_dir and not resume and not to_load and not set(known) - current and not requantize:
+        base_meta = read_index_meta(base_dir) or {}
+        print(f"✅ Index up to date | version={base_meta.get('index_version')} files(unchanged={stats['unchanged']})")
+        stats["total_chunks"] = base_meta.get("chunks", 0)
+        timings["total_s"] = time.perf_counter() - started
+        return {"stats": stats, "timings": timings, "index_version": base_meta.get("index_version") or os.path.basename(base_dir)}
+
+    t0 = time.perf_counter()
+    if not resume:
+        marker = {"base_version": base_version, "mode": "incremental" if base_dir else "full", "embed_normalize": EMBED_NORMALIZE}
+        mark_incomplete(persist_dir, ready=False, **marker)
+        if base_dir:
+            progress.update(phase="copying")
+            # files this build only replaces are hard-linked, not copied
+            cs = clone_index(base_dir, persist_dir, replaced=(BM25_FILENAME, METADATA_INDEX_FILENAME, MANIFEST_NAME, INDEX_META_NAME), ignore=(INCOMPLETE_NAME,))
+            print(f"  copy | linked={cs['linked']} reflinked={cs['reflinked']} copied={cs['copied']} ({cs['copied_mb']} MB)")
+        mark_incomplete(persist_dir, ready=True, **marker)
+    else:
+        # claim it, so a concurrent run does not resume the same folder
+        mark_incomplete(persist_dir, **{k: v for k, v in (read_incomplete(persist_dir) or {}).items() if k != "pid"})
+    timings["copy_s"] = time.perf_counter() - t0
 
     embedding_fn = get_embedding_function()
+    client = get_client(persist_dir)
     collection = get_or_create_collection(
-        persist_dir=CHROMA_DIR,
-        collection_name=COLLECTION_NAME,
-        embedding_function=embedding_fn
+        persist_dir=persist_dir,
+        collection_name=args.collection,
+        embedding_function=embedding_fn,
+        client=client
     )
+    batch_size = min(args.batch_size, client.get_max_batch_size())
+    if requantize:
+        if hasattr(collection, "set_quantization"):
+            collection.set_quantization(mode=args.quantize, pca_dim=args.pca_dim, pq_m=args.pq_subspaces)
+        else:
+            print(f"⚠️ --quantize / --pca-dim / --pq-subspaces need VECTOR_BACKEND=local (is {VECTOR_BACKEND}); ignored")
+
+    # manifest without data (e.g. the collection was dropped) -> start over
+    reset = collection.count() == 0 and bool(known)
+    if reset:
+        known.clear()
+        to_load = list(paths)
+        hashes = {os.path.basename(p): file_sha256(p) for p in paths}
+        stats.update(new=len(paths), changed=0, unchanged=0)
 
-    add_documents_to_collection(collection, chunks)
+    # A file enters the manifest (and its stale chunks are deleted) only once all
+    # of its new chunks are committed, so an interrupted build never records a
+    # file as indexed when it isn't.
+    pending_files = []
+    deleted_ids: List[str] = []
+
+    def commit_ready(writer):
+        while pending_files and pending_files[0][0] <= writer.committed:
+            _, filename, entry, stale = pending_files.pop(0)
+            delete_from_collection(collection, stale)
+            deleted_ids.extend(stale)
+            known[filename] = entry
+            save_manifest(persist_dir, manifest)
+
+    def on_progress(p):
+        progress.update(committed=p["committed"], submitted=p["submitted"], chunks_per_sec=round(p["chunks_per_sec"], 1))
+        if not args.quiet:
+            print_progress(p)
+
+    # streaming: each file is chunked and queued as soon as a worker has parsed it
+    progress.update(phase="indexing", files_to_index=len(to_load), files_done=0, committed=0, submitted=0)
+    # files parsed before (same content hash) come straight from the parse cache
+    loaded = iter_loaded_files(to_load, max_workers=args.workers or None, hashes={p: hashes[os.path.basename(p)] for p in to_load})
+    with BatchWriter(collection, embedding_fn, batch_size=batch_size, on_progress=on_progress) as writer:
+        for path, docs in _timed(loaded, timings, "load_s"):
+            filename = os.path.basename(path)
+            entry = known.get(filename)
+
+            t0 = time.perf_counter()
+            chunks = chunk_documents(docs, chunk_size, chunk_overlap, chunker)
+            for c in chunks:
+                c.metadata["ingested_at"] = ingested_at
+            timings["chunk_s"] += time.perf_counter() - t0
+            stats["docs"] += len(docs)
+
+            old_ids = set(entry["chunks"]) if entry else set()
+            new_ids = [c.metadata["chunk_id"] for c in chunks]
+
+            # only chunks whose content hash is new (or whose neighbour links /
+            # offsets moved) get embedded and written
+            fresh = relinked_chunks(chunks, entry["chunks"]) if entry else chunks
+            stale = sorted(old_ids - set(new_ids))
+            seq_end = writer.add(fresh)
+            stats["deleted"] += len(stale)
+
+            pending_files.append((seq_end, filename, {"sha256": hashes[filename], "chunks": new_ids}, stale))
+            commit_ready(writer)
+            progress.update(files_done=progress.state["files_done"] + 1)
+
+    commit_ready(writer)
+    stats["upserted"] = writer.written
+    timings["embed_s"] = writer.embed_seconds
+    timings["write_s"] = writer.write_seconds
+
+    for filename in sorted(set(known) - current):
+        stale = known.pop(filename).get("chunks", [])
+        delete_from_collection(collection, stale)
+        deleted_ids.extend(stale)
+        stats["removed"] += 1
+        stats["deleted"] += len(stale)
+
+    save_manifest(persist_dir, manifest)
+    progress.update(phase="optimizing")
+    t0 = time.perf_counter()
+    optimize_collection(collection)
+    timings["optimize_s"] = time.perf_counter() - t0
+    if hasattr(collection, "quantization_stats") and collection.quantization["mode"] != "none":
+        qs = collection.quantization_stats()
+        print(
+            f"  quantization | mode={qs['mode']} pca_dim={qs['pca_dim'] or 'off'} "
+            f"bytes/vector={qs['code_bytes_per_vector']} (float32: {qs['float_bytes_per_vector']}) "
+            f"codes={qs['codes_mb']} MB vectors={qs['vectors_mb']} MB"
+        )
+
+    # sparse + metadata index: the base's are updated for the chunks this build
+    # wrote or deleted; rebuilt from the collection when there is nothing to
+    # update, or when a resumed build cannot tell what the interrupted run changed
+    touched = stats["new"] + stats["changed"] + stats["removed"] or resume
+    rebuild = resume or reset
+    remove = set(deleted_ids) | set(writer.written_ids)
+    written: Optional[Dict[str, Any]] = None
+
+    if touched or not os.path.exists(os.path.join(persist_dir, BM25_FILENAME)):
+        progress.update(phase="bm25")
+        t0 = time.perf_counter()
+        bm25 = None if rebuild else BM25Index.load(persist_dir)
+        if bm25 is None:
+            bm25, how = build_bm25_from_collection(collection), "rebuilt"
+        else:
+            written = _fetch_chunks(collection, writer.written_ids)
+            bm25 = bm25.updated(remove, written["ids"], written["documents"])
+            how = f"updated (+{len(written['ids'])} -{len(set(deleted_ids) - set(written['ids']))})"
+        bm25.save(persist_dir)
+        timings["bm25_s"] = time.perf_counter() - t0
+        print(f"  bm25 index | {how} chunks={len(bm25.ids)} terms={len(bm25.terms)}")
+
+    # secondary metadata index: filters resolve to chunk IDs before vector search
+    if touched or not os.path.exists(os.path.join(persist_dir, METADATA_INDEX_FILENAME)):
+        progress.update(phase="metadata_index")
+        t0 = time.perf_counter()
+        index = None if rebuild else MetadataIndex.load(persist_dir)
+        if index is None:
+            index = build_metadata_index_from_collection(collection)
+        else:
+            written = written or _fetch_chunks(collection, writer.written_ids)
+            index = index.updated(remove, written["ids"], written["metadatas"])
+        index.save(persist_dir)
+        timings["metadata_index_s"] = time.perf_counter() - t0
+
+    # a new version invalidates query-time caches (e.g. the semantic answer cache)
+    meta = update_index_meta(
+        persist_dir,
+        index_version=version,
+        chunks=collection.count(),
+        # query embeddings must be made the same way (checked when the index is opened)
+        embed_normalize=bool(getattr(embedding_fn, "normalize", False)),
+    )
+    clear_incomplete(persist_dir)
+    print(f"  index version | {meta['index_version']}")
+
+    if getattr(embedding_fn, "cache", None) is not None:
+        embedding_fn.cache.save()
+        cs = embedding_fn.cache.stats()
+        print(f"  embedding cache | hits={cs['hits']} misses={cs['misses']} hit_rate={cs['hit_rate']:.1%} entries={cs['entries']}")
+
+    print(
+        f"✅ Built index | mode={progress.state.get('mode') or ('incremental' if base_dir else 'full')} "
+        f"files(new={stats['new']} changed={stats['changed']} unchanged={stats['unchanged']} removed={stats['removed']}) "
+        f"docs={stats['docs']} chunks(upserted={stats['upserted']} deleted={stats['deleted']} total={collection.count()}) "
+        f"throughput={writer.chunks_per_sec:.1f} chunks/s "
+        f"db={persist_dir}"
+    )
 
-    print(f"✅ Built index | docs={len(docs)} chunks={len(chunks)} db={CHROMA_DIR}")
+    stats["total_chunks"] = collection.count()
+    timings["total_s"] = time.perf_counter() - started
+    return {"stats": stats, "timings": timings, "index_version": meta["index_version"]}
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,236 @@
-from typing import List
+import hashlib
+import re
+from typing import Any, List, Dict, Iterator, Iterable, Tuple
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-def chunk_documents(docs: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", " ", ""],
-    )
-    return splitter.split_documents(docs)
+from config.settings import CHUNKER, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# ~ one wordpiece per word / punctuation mark; close enough for MiniLM-style vocabularies.
+# Runs without word boundaries (hashes, base64, "xxxx...") count one token per
+# _MAX_TOKEN_CHARS characters, so a token count always bounds the text's length.
+_MAX_TOKEN_CHARS = 16
+_TOKEN = re.compile(r"\w{1,%d}|[^\w\s]" % _MAX_TOKEN_CHARS)
+_LINE = re.compile(r"[^\n]*\n?")
+# sentence end: terminal punctuation (+ closing quotes / brackets), whitespace, then a likely sentence start
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+(?=[A-Z0-9(\[\"'])")
+_HEADING = re.compile(
+    r"^(?:#{1,6}\s+\w.*"                                                        # markdown
+    r"|(?:\d{1,2}(?:\.\d{1,2})*\.?|[IVX]+\.|(?:Article|Annex|Chapter|Section|Title)\s+[\dIVXLC]+\w*\.?)\s+[A-Z].*"  # numbered
+    r"|[A-Z][A-Z0-9 ,&:/()'-]{3,}"                                              # ALL CAPS
+    r")$"
+)
+_TABLE_CELL_GAP = re.compile(r"\t|\s{3,}|\|")
+
+def count_tokens(text: str) -> int:
+    return len(_TOKEN.findall(text))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The prefix of text holding its first max_tokens tokens, as count_tokens() counts them."""
+    if max_tokens <= 0:
+        return ""
+    for n, m in enumerate(_TOKEN.finditer(text), start=1):
+        if n == max_tokens:
+            return text[:m.end()]
+    return text
+
+def chunk_settings() -> Tuple[str, int, int]:
+    """(chunker, size, overlap) as configured; size / overlap are tokens or characters depending on the chunker."""
+    if CHUNKER == "recursive":
+        return CHUNKER, CHUNK_SIZE, CHUNK_OVERLAP
+    return "tokens", CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+
+def chunk_documents(docs: List[Document], chunk_size: int, chunk_overlap: int, chunker: str = "recursive") -> List[Document]:
+    """
+    Chunks one file's pages. Every chunk gets chunk_id, token_count, char_start /
+    char_end (offsets into its page's text) and prev_chunk_id / next_chunk_id
+    ("" at the ends of the file).
+    """
+    if chunker == "tokens":
+        chunks = list(iter_token_chunks(docs, chunk_size, chunk_overlap))
+    else:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", " ", ""],
+            add_start_index=True,
+        )
+        chunks = splitter.split_documents(docs)
+        for c in chunks:
+            start = c.metadata.pop("start_index", -1)
+            c.metadata.update(char_start=start, char_end=start + len(c.page_content), token_count=count_tokens(c.page_content))
+    return link_neighbours(assign_chunk_ids(chunks))
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def assign_chunk_ids(chunks: List[Document]) -> List[Document]:
+    """
+    Content-hashed IDs: <source_file>-<page>-<sha1(text)[:16]>.
+    They only change when the chunk text changes, so re-indexing can diff by ID.
+    Identical chunks on the same page get an occurrence suffix (-1, -2, ...).
+    """
+    seen: Dict[str, int] = {}
+    for d in chunks:
+        md = d.metadata
+        base = f"{md.get('source_file', 'doc')}-{md.get('page', 'na')}-{chunk_hash(d.page_content)[:16]}"
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        md["chunk_id"] = base if n == 0 else f"{base}-{n}"
+    return chunks
+
+def link_neighbours(chunks: List[Document]) -> List[Document]:
+    """prev_chunk_id / next_chunk_id within each source file, in reading order ("" when there is none)."""
+    last: Dict[str, Document] = {}
+    for d in chunks:
+        src = d.metadata.get("source_file", "doc")
+        prev = last.get(src)
+        d.metadata["prev_chunk_id"] = prev.metadata["chunk_id"] if prev else ""
+        d.metadata["next_chunk_id"] = ""
+        if prev:
+            prev.metadata["next_chunk_id"] = d.metadata["chunk_id"]
+        last[src] = d
+    return chunks
+
+def relinked_chunks(chunks: List[Document], old_ids: List[str]) -> List[Document]:
+    """
+    Chunks of a re-chunked file that must be (re)written: new content, or kept
+    content whose neighbours or offsets changed. Offsets are page-relative, so
+    every chunk on a page that gained a new chunk is rewritten.
+    """
+    known = set(old_ids)
+    old_pos = {cid: i for i, cid in enumerate(old_ids)}
+
+    def old_neighbour(cid: str, step: int) -> str:
+        j = old_pos[cid] + step
+        return old_ids[j] if 0 <= j < len(old_ids) else ""
+
+    def page_of(md: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+        # spreadsheets have no page number: a sheet's cell range is the page
+        return md.get("page"), md.get("sheet"), md.get("cell_range")
+
+    changed_pages = {page_of(c.metadata) for c in chunks if c.metadata["chunk_id"] not in known}
+    out = []
+    for c in chunks:
+        md = c.metadata
+        cid = md["chunk_id"]
+        if (
+            cid not in known
+            or page_of(md) in changed_pages
+            or md["prev_chunk_id"] != old_neighbour(cid, -1)
+            or md["next_chunk_id"] != old_neighbour(cid, 1)
+        ):
+            out.append(c)
+    return out
+
+# ---------- Token chunker ----------
+def _line_kind(line: str) -> str:
+    s = line.strip()
+    if not s:
+        return "blank"
+    if len(_TABLE_CELL_GAP.findall(s)) >= 2:
+        return "table"
+    # short, unpunctuated, no table-of-contents leaders
+    if len(s) <= 80 and len(s.split()) <= 10 and _HEADING.match(s) and not s.endswith((",", ";", "-")) and ". ." not in s:
+        return "heading"
+    return "text"
+
+def _blocks(text: str) -> Iterator[Tuple[str, int, int]]:
+    """(kind, start, end) runs of lines: paragraphs, tables, and single heading lines."""
+    kind, start, end = None, 0, 0
+    for m in _LINE.finditer(text):
+        if m.start() == len(text):
+            break
+        k = _line_kind(m.group())
+        if k == kind and k != "heading":
+            end = m.end()
+            continue
+        if kind not in (None, "blank"):
+            yield kind, start, end
+        kind, start, end = k, m.start(), m.end()
+    if kind not in (None, "blank"):
+        yield kind, start, end
+
+def _units(text: str, max_tokens: int, max_chars: int) -> Iterator[Tuple[str, int, int, int]]:
+    """
+    (kind, start, end, tokens) packing units: sentences of paragraphs, whole
+    tables (line groups when too big), headings. Units over max_tokens tokens
+    or max_chars characters are cut into token windows within both limits.
+    """
+    for kind, start, end in _blocks(text):
+        if kind == "text":
+            spans, s = [], start
+            for m in _SENTENCE_END.finditer(text, start, end):
+                spans.append((s, m.start() + 1))
+                s = m.end()
+            spans.append((s, end))
+        elif kind == "table":
+            spans = [(start, end)]
+            if end - start > max_chars or count_tokens(text[start:end]) > max_tokens:
+                spans = [(m.start() + start, m.end() + start) for m in _LINE.finditer(text[start:end]) if m.group().strip()]
+        else:
+            spans = [(start, end)]
+
+        for s, e in spans:
+            while s < e and text[s].isspace():
+                s += 1
+            while e > s and text[e - 1].isspace():
+                e -= 1
+            if s >= e:
+                continue
+            # every non-space character is in a token, so a unit that fits is yielded whole
+            w_start, w_end, n = s, s, 0
+            for ts, te in (m.span() for m in _TOKEN.finditer(text, s, e)):
+                if n and (n == max_tokens or te - w_start > max_chars):
+                    yield kind, w_start, w_end, n
+                    n = 0
+                if not n:
+                    w_start = ts
+                w_end, n = te, n + 1
+            if n:
+                yield kind, w_start, w_end, n
+
+def iter_token_chunks(
+    docs: Iterable[Document], max_tokens: int, overlap_tokens: int, max_chars: int = CHUNK_SIZE
+) -> Iterator[Document]:
+    """
+    Streaming, structure-aware chunking: one pass over each page, sized in tokens.
+    Chunks end on sentence (or table row) boundaries, never span pages, and a
+    heading always starts a new chunk. The last sentences of a chunk, up to
+    overlap_tokens, are repeated at the start of the next one in the same section.
+    A sentence longer than max_chars characters is cut like one over max_tokens.
+    """
+    max_tokens = max(1, max_tokens)
+    max_chars = max(_MAX_TOKEN_CHARS, max_chars)
+    for doc in docs:
+        text = doc.page_content or ""
+        section = ""
+        cur: List[Tuple[str, int, int, int]] = []
+        cur_tokens = 0
+
+        def emit() -> Document:
+            start, end = cur[0][1], cur[-1][2]
+            md = dict(doc.metadata, char_start=start, char_end=end, token_count=cur_tokens, section=section)
+            return Document(page_content=text[start:end], metadata=md)
+
+        for unit in _units(text, max_tokens, max_chars):
+            kind, _, _, n = unit
+            starts_section = kind == "heading" and any(u[0] != "heading" for u in cur)
+            if cur and (starts_section or cur_tokens + n > max_tokens):
+                yield emit()
+                carry: List[Tuple[str, int, int, int]] = []
+                if not starts_section:
+                    budget = min(overlap_tokens, max_tokens - n)
+                    for u in reversed(cur):
+                        if u[0] == "heading" or u[3] > budget:
+                            break
+                        carry.insert(0, u)
+                        budget -= u[3]
+                cur, cur_tokens = carry, sum(u[3] for u in carry)
+            if kind == "heading" and all(u[0] == "heading" for u in cur):
+                section = " ".join(text[unit[1]:unit[2]].split())[:200]
+            cur.append(unit)
+            cur_tokens += n
+
+        if cur:
+            yield emit()
@@ -1,25 +1,148 @@
+import multiprocessing
 import os
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Iterator, Iterable, NamedTuple, Tuple, Optional
 from langchain.schema import Document
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
 
-def load_documents(raw_dir: str) -> List[Document]:
-    docs: List[Document] = []
+from config.settings import PARSE_CACHE
+from ingestion.manifest import file_sha256
+from ingestion.parse_cache import ParseCache
+from ingestion import parsers
 
-    for filename in os.listdir(raw_dir):
+# ---------- Loader registry ----------
+class Loader(NamedTuple):
+    name: str
+    parse: Callable[[str], List[Document]]
+    # bump when the parser's output changes: cached pages of the old version are ignored
+    version: int = 1
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.name}-v{self.version}"
+
+LOADERS: Dict[str, Loader] = {}
+
+def register_loader(extensions: Iterable[str], parse: Callable[[str], List[Document]], name: str = "", version: int = 1) -> Loader:
+    """
+    Plugs a parser in for the given extensions (".csv", ...). parse(path) returns
+    the file's pages; source / source_file metadata is filled in afterwards, and
+    name becomes the pages' doc_type.
+    parse must be a module-level function: it is pickled by reference into the
+    parser processes.
+    """
+    loader = Loader(name or parse.__name__, parse, version)
+    for ext in extensions:
+        LOADERS["." + ext.lower().lstrip(".")] = loader
+    return loader
+
+register_loader([".pdf"], parsers.parse_pdf, "pdf")
+register_loader([".docx"], parsers.parse_docx, "docx")
+register_loader([".xlsx", ".xlsm"], parsers.parse_xlsx, "xlsx", version=2)
+register_loader([".html", ".htm"], parsers.parse_html, "html")
+register_loader([".md", ".markdown"], parsers.parse_text, "md")
+register_loader([".txt"], parsers.parse_text, "txt")
+
+def supported_extensions() -> Tuple[str, ...]:
+    return tuple(sorted(LOADERS))
+
+def loader_for(path: str) -> Optional[Loader]:
+    _, ext = os.path.splitext(path.lower())
+    return LOADERS.get(ext)
+
+def list_source_files(raw_dir: str) -> List[str]:
+    files = []
+    for filename in sorted(os.listdir(raw_dir)):
         path = os.path.join(raw_dir, filename)
-        _, ext = os.path.splitext(filename.lower())
+        if loader_for(filename) is not None and os.path.isfile(path) and not filename.startswith("~$"):  # skip Office lock files
+            files.append(path)
+    return files
 
-        if ext == ".pdf":
-            loaded = PyPDFLoader(path).load()
-        elif ext == ".docx":
-            loaded = Docx2txtLoader(path).load()
-        else:
+# ---------- Loading ----------
+def _finish(path: str, loader: Loader, docs: List[Document]) -> List[Document]:
+    filename = os.path.basename(path)
+    for d in docs:
+        d.metadata = d.metadata or {}
+        d.metadata["source"] = path
+        d.metadata["source_file"] = filename
+        d.metadata["doc_type"] = loader.name  # metadata filter: doc_type
+    return docs
+
+def _cached(path: str, loader: Loader, sha256: Optional[str]) -> Optional[List[Document]]:
+    if not PARSE_CACHE:
+        return None
+    docs = ParseCache().get(sha256 or file_sha256(path), loader.cache_key)
+    return _finish(path, loader, docs) if docs is not None else None
+
+def _parse(path: str, loader: Loader, sha256: Optional[str] = None) -> List[Document]:
+    docs = loader.parse(path)
+    if PARSE_CACHE:
+        ParseCache().put(sha256 or file_sha256(path), loader.cache_key, docs)
+    return _finish(path, loader, docs)
+
+def load_file(path: str, sha256: Optional[str] = None) -> List[Document]:
+    """Pages of one file, from the parse cache when this content was parsed before ([] for unknown types)."""
+    loader = loader_for(path)
+    if loader is None:
+        return []
+    cached = _cached(path, loader, sha256)
+    return cached if cached is not None else _parse(path, loader, sha256)
+
+def iter_loaded_files(
+    paths: Iterable[str],
+    max_workers: Optional[int] = None,
+    hashes: Optional[Dict[str, str]] = None,
+) -> Iterator[Tuple[str, List[Document]]]:
+    """
+    Parse files in a process pool and yield (path, pages) as each file finishes.
+    Files whose content is in the parse cache are yielded first, without a
+    worker; `hashes` ({path: sha256}) saves hashing files the caller already hashed.
+    At most 2 * max_workers files are in flight, so memory stays bounded by the
+    files being parsed rather than by the whole corpus.
+    """
+    hashes = hashes or {}
+    to_parse = []
+    for path in paths:
+        loader = loader_for(path)
+        if loader is None:
+            yield path, []
             continue
+        sha = hashes.get(path) or (file_sha256(path) if PARSE_CACHE else None)
+        cached = _cached(path, loader, sha)
+        if cached is not None:
+            yield path, cached
+        else:
+            to_parse.append((path, loader, sha))
 
-        for d in loaded:
-            d.metadata = d.metadata or {}
-            d.metadata["source_file"] = filename
-        docs.extend(loaded)
+    workers = max_workers or os.cpu_count() or 1
+    workers = min(workers, len(to_parse))
 
-    return docs
+    if workers <= 1:
+        for path, loader, sha in to_parse:
+            yield path, _parse(path, loader, sha)
+        return
+
+    # spawn: the parent may already hold torch / sqlite threads that fork would copy
+    ctx = multiprocessing.get_context("spawn")
+    pending = iter(to_parse)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        in_flight = {}
+        for job in pending:
+            in_flight[pool.submit(_parse, *job)] = job[0]
+            if len(in_flight) >= 2 * workers:
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                path = in_flight.pop(fut)
+                yield path, fut.result()
+                nxt = next(pending, None)
+                if nxt is not None:
+                    in_flight[pool.submit(_parse, *nxt)] = nxt[0]
+
+def iter_documents(raw_dir: str, max_workers: Optional[int] = None) -> Iterator[Document]:
+    for _, loaded in iter_loaded_files(list_source_files(raw_dir), max_workers=max_workers):
+        yield from loaded
+
+def load_documents(raw_dir: str, max_workers: Optional[int] = None) -> List[Document]:
+    return list(iter_documents(raw_dir, max_workers=max_workers))
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+from typing import Dict, Any
+
+MANIFEST_NAME = "index_manifest.json"
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def empty_manifest(chunk_size: int, chunk_overlap: int, chunker: str = "recursive") -> Dict[str, Any]:
+    return {"chunker": chunker, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "files": {}}
+
+def load_manifest(persist_dir: str, chunk_size: int, chunk_overlap: int, chunker: str = "recursive") -> Dict[str, Any]:
+    """
+    Manifest of what is currently indexed:
+      files: {source_file: {"sha256": <file hash>, "chunks": [<content-hashed chunk ids, in reading order>]}}
+    If the chunking settings changed, every file is marked stale (its chunks are
+    kept so they can be deleted once the file is re-chunked).
+    """
+    path = os.path.join(persist_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return empty_manifest(chunk_size, chunk_overlap, chunker)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty_manifest(chunk_size, chunk_overlap, chunker)
+
+    manifest.setdefault("files", {})
+    # manifests written before the token chunker have no "chunker" key
+    settings = (manifest.get("chunker", "recursive"), manifest.get("chunk_size"), manifest.get("chunk_overlap"))
+    if settings != (chunker, chunk_size, chunk_overlap):
+        for entry in manifest["files"].values():
+            entry["sha256"] = None
+        manifest["chunk_size"] = chunk_size
+        manifest["chunk_overlap"] = chunk_overlap
+        manifest["chunker"] = chunker
+    return manifest
+
+def save_manifest(persist_dir: str, manifest: Dict[str, Any]) -> None:
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
@@ -0,0 +1,50 @@
+import gzip
+import json
+import os
+import tempfile
+from typing import List, Optional
+from langchain.schema import Document
+
+from config.settings import PARSE_CACHE_DIR
+
+class ParseCache:
+    """
+    Parsed pages on disk, one gzipped JSON file per (file sha256, parser key).
+    The parser key names the loader and its version, so bumping a loader's
+    version re-parses every file of that type. Path-specific metadata
+    ("source", "source_file") is not stored: identical bytes under another
+    name or folder hit the same entry.
+    """
+
+    def __init__(self, cache_dir: str = PARSE_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, sha256: str, parser_key: str) -> str:
+        return os.path.join(self.cache_dir, sha256[:2], f"{sha256}.{parser_key}.json.gz")
+
+    def get(self, sha256: str, parser_key: str) -> Optional[List[Document]]:
+        try:
+            with gzip.open(self._path(sha256, parser_key), "rt", encoding="utf-8") as f:
+                pages = json.load(f)
+        except (OSError, ValueError, EOFError):
+            return None
+        return [Document(page_content=p["text"], metadata=p["metadata"]) for p in pages]
+
+    def put(self, sha256: str, parser_key: str, docs: List[Document]) -> None:
+        path = self._path(sha256, parser_key)
+        pages = [
+            {"text": d.page_content, "metadata": {k: v for k, v in (d.metadata or {}).items() if k not in ("source", "source_file")}}
+            for d in docs
+        ]
+        # write + rename: parser processes may store the same file concurrently.
+        # A cache that cannot be written (read-only / full disk) just stays cold.
+        tmp = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(pages, f, default=str)
+            os.replace(tmp, path)
+        except OSError:
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
@@ -0,0 +1,208 @@
+import datetime
+import re
+from html.parser import HTMLParser
+from typing import Any, Iterator, List, Optional, Tuple
+from langchain.schema import Document
+
+from config.settings import XLSX_ROWS_PER_PAGE
+
+# ---------- PDF / DOCX ----------
+def parse_pdf(path: str) -> List[Document]:
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(path).load()
+
+def parse_docx(path: str) -> List[Document]:
+    from langchain_community.document_loaders import Docx2txtLoader
+    return Docx2txtLoader(path).load()
+
+# ---------- Plain text / Markdown ----------
+def parse_text(path: str) -> List[Document]:
+    # markdown needs no conversion: the token chunker already splits on "#" headings
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        text = f.read()
+    return [Document(page_content=text, metadata={"source": path})] if text.strip() else []
+
+# ---------- HTML ----------
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "header", "footer", "aside", "nav", "blockquote",
+    "pre", "ul", "ol", "dl", "dt", "dd", "table", "thead", "tbody", "tr", "form", "figure", "figcaption",
+}
+_SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe"}
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+
+class _HTMLText(HTMLParser):
+    """Visible text of a page: headings become markdown headings, table cells are joined with " | "."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: List[str] = []
+        self.line: List[str] = []
+        self.title = ""
+        self._skip = 0
+        self._in_title = False
+        self._cells = 0
+
+    def _flush(self, prefix: str = "") -> None:
+        text = _SPACES.sub(" ", "".join(self.line)).strip()
+        if text:
+            self.lines.append(prefix + text)
+        self.line = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "br":
+            self._flush()
+        elif re.fullmatch(r"h[1-6]", tag) or tag in _BLOCK_TAGS:
+            self._flush()
+            self._cells = 0
+        elif tag == "li":
+            self._flush()
+            self.line.append("- ")
+        elif tag in ("td", "th"):
+            if self._cells:
+                self.line.append(" | ")
+            self._cells += 1
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif re.fullmatch(r"h[1-6]", tag):
+            self._flush("#" * int(tag[1]) + " ")
+        elif tag in _BLOCK_TAGS or tag == "li":
+            self._flush()
+            if tag in ("p", "table", "ul", "ol", "pre", "blockquote"):
+                self.lines.append("")
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._in_title:
+            self.title += data
+        else:
+            self.line.append(data.replace("\n", " "))
+
+    def text(self) -> str:
+        self._flush()
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(self.lines)).strip()
+
+def parse_html(path: str) -> List[Document]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        html = f.read()
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    text = parser.text()
+    if not text:
+        return []
+    metadata = {"source": path}
+    title = _SPACES.sub(" ", parser.title).strip()
+    if title:
+        metadata["title"] = title
+    return [Document(page_content=text, metadata=metadata)]
+
+# ---------- XLSX ----------
+def _column_letter(col: int) -> str:
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(value).upper()
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.6g}"
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return _SPACES.sub(" ", str(value)).strip()
+
+def _row_blocks(rows: Iterator[Tuple[Any, ...]]) -> Iterator[List[Tuple[int, List[str]]]]:
+    """Runs of non-empty rows as [(row number, cell texts)], split at blank rows."""
+    block: List[Tuple[int, List[str]]] = []
+    for row_no, values in enumerate(rows, start=1):
+        cells = [_cell_text(v) for v in values]
+        if any(cells):
+            block.append((row_no, cells))
+        elif block:
+            yield block
+            block = []
+    if block:
+        yield block
+
+def _header(block: List[Tuple[int, List[str]]]) -> Optional[List[str]]:
+    """The first row is a header when it labels at least two columns and nothing in it is a number."""
+    if len(block) < 2:
+        return None
+    cells = [c for c in block[0][1] if c]
+    if len(cells) < 2 or any(re.fullmatch(r"-?[\d.,%]+", c) for c in cells):
+        return None
+    return block[0][1]
+
+def _render_row(cells: List[str], header: Optional[List[str]]) -> str:
+    if header is None:
+        return " | ".join(c for c in cells if c)
+    return " | ".join(
+        f"{header[i]}: {c}" if i < len(header) and header[i] else c
+        for i, c in enumerate(cells) if c
+    )
+
+def parse_xlsx(path: str, rows_per_page: int = XLSX_ROWS_PER_PAGE) -> List[Document]:
+    """
+    Reads each sheet in read-only mode (rows are streamed from the file, with
+    cached formula values and no styles) and turns it into pages of at most
+    rows_per_page rows, returned as one list for the whole workbook. Blank rows split a sheet into
+    blocks; a block whose first row is a header is rendered "Header: value | ..."
+    per row so every chunk stays self-describing, other rows as "a | b | c".
+    Small header-less blocks (titles, labelled inputs) are gathered into one page.
+    Page metadata: sheet and cell_range ("B12:Q52"); there is no page number,
+    citations point at the cells instead.
+    """
+    import openpyxl
+
+    rows_per_page = max(1, rows_per_page)
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    docs: List[Document] = []
+    try:
+        for ws in wb.worksheets:
+            loose: List[Tuple[int, List[str]]] = []
+
+            def emit(rows: List[Tuple[int, List[str]]], header: Optional[List[str]], header_row: Optional[int] = None) -> None:
+                used = [i for _, cells in rows for i, c in enumerate(cells) if c]
+                first_col, last_col = min(used) + 1, max(used) + 1
+                first_row = header_row or rows[0][0]
+                cell_range = f"{_column_letter(first_col)}{first_row}:{_column_letter(last_col)}{rows[-1][0]}"
+                text = "\n".join(_render_row(cells, header) for _, cells in rows)
+                docs.append(Document(
+                    page_content=text,
+                    metadata={"source": path, "sheet": ws.title, "cell_range": cell_range},
+                ))
+
+            def flush_loose() -> None:
+                if loose:
+                    emit(list(loose), None)
+                    loose.clear()
+
+            for block in _row_blocks(ws.iter_rows(min_row=1, min_col=1, values_only=True)):
+                header = _header(block)
+                if header is None:
+                    if len(loose) + len(block) > rows_per_page:
+                        flush_loose()
+                    loose.extend(block)
+                    continue
+                flush_loose()
+                # the header is repeated in every data row, so only the first page's range covers it
+                data = block[1:]
+                for start in range(0, len(data), rows_per_page):
+                    emit(data[start:start + rows_per_page], header, block[0][0] if start == 0 else None)
+            flush_loose()
+    finally:
+        wb.close()
+    return docs
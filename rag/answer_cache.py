@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from config.settings import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_S, ANSWER_CACHE_SIZE
+
+class SemanticAnswerCache:
+    """
+    Answers keyed on the embedding of the standalone (rewritten) query.
+
+    A lookup hits when
+      - cosine similarity to a cached query >= threshold,
+      - the chunk IDs retrieved now are the same set the cached answer was built
+        from (so a paraphrase that pulls different context still regenerates),
+      - the entry is younger than the TTL and was built on the current index version.
+    Vectors live in one preallocated (size, dim) matrix, so a lookup is a single
+    matrix-vector product. LRU eviction once full; everything is dropped when the
+    index version changes.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl_s: float = ANSWER_CACHE_TTL_S, max_entries: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._vecs: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # slot -> entry, LRU order
+        self._version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _sync_version(self, index_version: Optional[str]) -> None:
+        if index_version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = index_version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    @staticmethod
+    def _unit(vec: np.ndarray) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32).reshape(-1)
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else v
+
+    def lookup(self, query_vec: np.ndarray, chunk_ids: List[str], index_version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        q = self._unit(query_vec)
+        ids = frozenset(chunk_ids)
+        now = time.time()
+        with self._lock:
+            self._sync_version(index_version)
+            if not self._entries or self._vecs is None:
+                self.misses += 1
+                return None
+
+            # expire first, then one matrix-vector product over the live slots
+            for slot in [s for s, e in self._entries.items() if now - e["created"] > self.ttl_s]:
+                del self._entries[slot]
+            slots = np.fromiter(self._entries.keys(), dtype=np.int64)
+            if len(slots) == 0:
+                self.misses += 1
+                return None
+            sims = self._vecs[slots] @ q
+
+            for j in np.argsort(-sims):
+                if sims[j] < self.threshold:
+                    break
+                slot = int(slots[j])
+                entry = self._entries[slot]
+                if entry["chunk_ids"] == ids:
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return dict(entry["result"], cache_similarity=float(sims[j]))
+            self.misses += 1
+            return None
+
+    def store(self, query_vec: np.ndarray, chunk_ids: List[str], result: Dict[str, Any], index_version: Optional[str] = None) -> None:
+        q = self._unit(query_vec)
+        with self._lock:
+            self._sync_version(index_version)
+            if self._vecs is None or self._vecs.shape[1] != q.shape[0]:
+                self._vecs = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+                self._entries.clear()
+
+            if len(self._entries) >= self.max_entries:
+                slot, _ = self._entries.popitem(last=False)
+            else:
+                used = set(self._entries)
+                slot = next(s for s in range(self.max_entries) if s not in used)
+
+            self._vecs[slot] = q
+            self._entries[slot] = {"chunk_ids": frozenset(chunk_ids), "result": result, "created": time.time()}
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._entries),
+            "invalidations": self.invalidations,
+        }
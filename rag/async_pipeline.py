@@ -0,0 +1,88 @@
+import asyncio
+from typing import Dict, Any, List, Optional, Union
+
+from config.settings import (
+    TOP_K, RETRIEVAL_MODE, RERANK,
+    REWRITE_TIMEOUT_S, RETRIEVE_TIMEOUT_S, GENERATE_TIMEOUT_S,
+)
+from rag.engine import RAGEngine
+from rag.pipeline import get_engine
+from rag.retriever import merge_results, to_sources
+from rag.generator import generate
+from rag.query_rewriter import rewrite_query
+from rag.tracing import tracer, Trace
+
+async def _stage(fn, timeout: float, *args, **kwargs):
+    # blocking steps run in the default thread pool; on timeout we stop waiting
+    # (the worker thread itself cannot be cancelled and finishes in the background)
+    with tracer.span("await_" + getattr(fn, "__name__", "stage")):
+        return await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), timeout=timeout)
+
+async def answer_async(
+    query: str,
+    top_k: int = TOP_K,
+    history: Optional[List[Dict[str, str]]] = None,
+    mode: str = RETRIEVAL_MODE,
+    rerank: bool = RERANK,
+    engine: Optional[RAGEngine] = None,
+    collection: Union[str, List[str], None] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    asyncio version of answer() that takes the rewrite off the critical path:
+      1. rewrite_query and retrieval on the RAW query start concurrently
+      2. if the rewrite is identical, the speculative result is used as is;
+         otherwise the rewritten query is retrieved and both result sets are merged
+      3. generation on the merged context
+    A rewrite that fails or times out falls back to the raw query.
+    """
+    with tracer.trace("answer_async", top_k=top_k, mode=mode, rerank=rerank) as tr:
+        result = await _answer_async(query, top_k, history, mode, rerank, engine, collection, filters)
+    if isinstance(tr, Trace):
+        result["trace"] = tr.to_dict()
+    return result
+
+async def _answer_async(query, top_k, history, mode, rerank, engine, collection, filters) -> Dict[str, Any]:
+    engine = engine or get_engine()
+    history = history or []
+
+    rewrite_task = asyncio.create_task(
+        _stage(rewrite_query, REWRITE_TIMEOUT_S, query, history, llm=engine.rewrite_llm, vocabulary=engine.vocabulary(collection))
+    )
+    raw_task = asyncio.create_task(
+        _stage(engine.retrieve, RETRIEVE_TIMEOUT_S, query, top_k=top_k, mode=mode, rerank=rerank, collection=collection, filters=filters)
+    )
+
+    try:
+        rewritten = await rewrite_task
+    except Exception:
+        rewritten = query
+
+    if rewritten.strip() == query.strip():
+        docs = await raw_task
+    else:
+        rewritten_docs, raw_docs = await asyncio.gather(
+            _stage(engine.retrieve, RETRIEVE_TIMEOUT_S, rewritten, top_k=top_k, mode=mode, rerank=rerank, collection=collection, filters=filters),
+            raw_task,
+            return_exceptions=True,
+        )
+        if isinstance(rewritten_docs, BaseException):
+            raise rewritten_docs
+        # the speculative raw-query result is a bonus; drop it if it failed
+        lists = [rewritten_docs] if isinstance(raw_docs, BaseException) else [rewritten_docs, raw_docs]
+        docs = merge_results(lists, top_k=top_k)
+
+    vec, hit = await asyncio.to_thread(engine.cached_answer, rewritten, docs, collection=collection)
+    if hit is not None:
+        return dict(hit, rewritten_query=rewritten, cache_hit=True)
+
+    # Generation remains grounded ONLY in retrieved docs
+    ans = await _stage(generate, GENERATE_TIMEOUT_S, query, docs, llm=engine.llm)
+
+    result = {
+        "answer": ans,
+        "sources": to_sources(docs),
+        "rewritten_query": rewritten
+    }
+    engine.remember_answer(vec, docs, result, collection=collection)
+    return dict(result, cache_hit=False)
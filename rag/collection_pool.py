@@ -0,0 +1,248 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from config.settings import ANSWER_CACHE, MAX_OPEN_COLLECTIONS, COLLECTION_IDLE_S
+from vector_store.chroma_store import close_client, get_or_create_collection
+from vector_store.store import get_client
+from vector_store.bm25 import BM25Index
+from vector_store.metadata_index import MetadataIndex, Selection, build_metadata_index_from_collection
+from vector_store.index_meta import IndexVersionWatcher, IndexPointer, read_index_meta
+from rag.answer_cache import SemanticAnswerCache
+from rag.tracing import tracer
+
+class CollectionHandle:
+    """
+    Everything query-time that belongs to one collection: store client and
+    collection, BM25 and metadata indexes and answer cache, all following the
+    index version CURRENT points at. The embedding model is not here; it is shared.
+    """
+
+    def __init__(self, name: str, root: str, backend: str, embedding_fn: Callable[[], Any], answer_cache: bool = ANSWER_CACHE):
+        self.name = name
+        self.root = root
+        self.backend = backend
+        self._embedding_fn = embedding_fn
+        self._pointer = IndexPointer(root)
+        self.persist_dir = self._pointer.active_dir()
+        self._index_version = IndexVersionWatcher(self.persist_dir)
+        self.answer_cache = SemanticAnswerCache() if answer_cache else None
+
+        self._lock = threading.RLock()
+        self._client = None
+        self._collection = None
+        self._retired_client = None
+        self._bm25: Optional[BM25Index] = None
+        self._bm25_loaded = False
+        self._metadata_index: Optional[MetadataIndex] = None
+
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+    def _follow_index(self) -> None:
+        """Switches to a newly swapped-in index version (one stat() per call)."""
+        active = self._pointer.active_dir()
+        if active == self.persist_dir:
+            return
+        with self._lock:
+            if active == self.persist_dir:
+                return
+            # queries already holding the old collection finish on it; its
+            # client is closed at the next swap (or close()), not now
+            if self._retired_client is not None:
+                close_client(self._retired_client)
+            self._retired_client = self._client
+            self._client = None
+            self._collection = None
+            self._bm25 = None
+            self._bm25_loaded = False
+            self._metadata_index = None
+            self.persist_dir = active
+            self._index_version = IndexVersionWatcher(active)
+            if self.answer_cache is not None:
+                self.answer_cache.clear()
+
+    @property
+    def collection(self):
+        self._follow_index()
+        collection = self._collection
+        if collection is None:
+            with self._lock:
+                if self._collection is None:
+                    embedding_fn = self._embedding_fn()
+                    self._check_embeddings(embedding_fn)
+                    self._client = get_client(self.persist_dir, backend=self.backend)
+                    self._collection = get_or_create_collection(
+                        persist_dir=self.persist_dir,
+                        collection_name=self.name,
+                        embedding_function=embedding_fn,
+                        client=self._client
+                    )
+                collection = self._collection
+        return collection
+
+    @property
+    def embed_normalize(self) -> bool:
+        """Whether the active index version holds unit-length vectors."""
+        self._follow_index()
+        # indexes built before embed_normalize was recorded used raw vectors
+        return bool((read_index_meta(self.persist_dir) or {}).get("embed_normalize", False))
+
+    def _check_embeddings(self, embedding_fn) -> None:
+        built = self.embed_normalize
+        query = bool(getattr(embedding_fn, "normalize", False))
+        if built != query:
+            print(
+                f"⚠️ Collection {self.name!r} was built with EMBED_NORMALIZE={int(built)} but queries use "
+                f"EMBED_NORMALIZE={int(query)}: distances are not comparable. Set EMBED_NORMALIZE={int(built)} "
+                f"or rebuild with --full.",
+                flush=True
+            )
+
+    @property
+    def bm25(self) -> Optional[BM25Index]:
+        """Sparse index persisted by build_index; None if it was never built."""
+        self._follow_index()
+        if not self._bm25_loaded:
+            with self._lock:
+                if not self._bm25_loaded:
+                    self._bm25 = BM25Index.load(self.persist_dir)
+                    self._bm25_loaded = True
+        return self._bm25
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """Metadata index persisted by build_index; built from the collection for indexes that predate it."""
+        self._follow_index()
+        index = self._metadata_index
+        if index is None:
+            with self._lock:
+                if self._metadata_index is None:
+                    self._metadata_index = MetadataIndex.load(self.persist_dir) or build_metadata_index_from_collection(self.collection)
+                index = self._metadata_index
+        return index
+
+    def select(self, filters: Dict[str, Any]) -> Selection:
+        """Chunks matching normalized filters (see vector_store.metadata_index)."""
+        with tracer.span("metadata_filter") as sp:
+            selection = self.metadata_index.select(filters)
+            sp.set("matching", len(selection.ids))
+            sp.set("total", selection.total)
+        return selection
+
+    def index_version(self) -> Optional[str]:
+        return self._index_version.current()
+
+    def close(self) -> None:
+        with self._lock:
+            for client in (self._client, self._retired_client):
+                if client is not None:
+                    close_client(client)
+            self._client = None
+            self._retired_client = None
+            self._collection = None
+            self._bm25 = None
+            self._bm25_loaded = False
+            self._metadata_index = None
+            if self.answer_cache is not None:
+                self.answer_cache.clear()
+
+class CollectionPool:
+    """
+    Lazily opened collection handles, least recently used first out. At most
+    max_open handles stay open and handles idle for idle_s are closed, so memory
+    is bounded by max_open rather than by the number of collections on disk.
+    A handle leased by a running query is never closed; the pool can briefly
+    exceed max_open instead.
+    """
+
+    def __init__(
+        self,
+        root_for: Callable[[str], str],
+        backend: str,
+        embedding_fn: Callable[[], Any],
+        max_open: int = MAX_OPEN_COLLECTIONS,
+        idle_s: float = COLLECTION_IDLE_S,
+        answer_cache: bool = ANSWER_CACHE,
+    ):
+        self.root_for = root_for
+        self.backend = backend
+        self.embedding_fn = embedding_fn
+        self.max_open = max(1, max_open)
+        self.idle_s = idle_s
+        self.answer_cache = answer_cache
+        self._handles: "OrderedDict[str, CollectionHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.evicted = 0
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[CollectionHandle]:
+        handle = self._acquire(name)
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.in_use -= 1
+                handle.last_used = time.monotonic()
+
+    def get(self, name: str) -> CollectionHandle:
+        """Handle without a lease (it may be evicted later; fine for one-off reads)."""
+        handle = self._acquire(name)
+        with self._lock:
+            handle.in_use -= 1
+        return handle
+
+    def _acquire(self, name: str) -> CollectionHandle:
+        to_close: List[CollectionHandle] = []
+        with self._lock:
+            handle = self._handles.get(name)
+            if handle is None:
+                handle = CollectionHandle(name, self.root_for(name), self.backend, self.embedding_fn, self.answer_cache)
+                self._handles[name] = handle
+                self.opened += 1
+            self._handles.move_to_end(name)
+            handle.in_use += 1
+            handle.last_used = time.monotonic()
+            to_close = self._evict_locked()
+        for h in to_close:
+            h.close()
+        return handle
+
+    def _evict_locked(self) -> List[CollectionHandle]:
+        now = time.monotonic()
+        out = []
+        for name in list(self._handles):  # least recently used first
+            h = self._handles[name]
+            if h.in_use:
+                continue
+            idle = self.idle_s > 0 and now - h.last_used > self.idle_s
+            if idle or len(self._handles) > self.max_open:
+                out.append(self._handles.pop(name))
+        self.evicted += len(out)
+        return out
+
+    def sweep(self) -> int:
+        """Closes idle handles now (eviction otherwise happens on the next lease)."""
+        with self._lock:
+            to_close = self._evict_locked()
+        for h in to_close:
+            h.close()
+        return len(to_close)
+
+    def close(self) -> None:
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for h in handles:
+            h.close()
+
+    def open_names(self) -> List[str]:
+        with self._lock:
+            return list(self._handles)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"open": list(self._handles), "max_open": self.max_open, "opened": self.opened, "evicted": self.evicted}
@@ -0,0 +1,180 @@
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+from config.settings import CHUNK_OVERLAP, CHUNK_OVERLAP_TOKENS
+from ingestion.chunking import count_tokens, truncate_tokens
+from vector_store.bm25 import tokenize
+
+_SENTENCE = re.compile(r"(?<=[.!?;:])\s+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "which", "who", "why", "with",
+}
+_MIN_OVERLAP = 20  # chars; shorter matches are coincidence, not CHUNK_OVERLAP
+
+def location(md: Dict[str, Any], sep: str = "=") -> Optional[str]:
+    """Where a chunk sits in its file, for citations: its page, or a spreadsheet's sheet and cell range."""
+    if md.get("sheet"):
+        return f"sheet{sep}{md['sheet']}" + (f", cells{sep}{md['cell_range']}" if md.get("cell_range") else "")
+    page = md.get("page")
+    return f"page{sep}{page}" if page is not None else None
+
+def _overlap(a: str, b: str, max_overlap: int) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if < _MIN_OVERLAP)."""
+    tail = a[-max_overlap:]
+    probe = b[:_MIN_OVERLAP]
+    if len(probe) < _MIN_OVERLAP:
+        return 0
+    pos = tail.find(probe)
+    while pos != -1:
+        n = len(tail) - pos
+        if b.startswith(tail[pos:]):
+            return n
+        pos = tail.find(probe, pos + 1)
+    return 0
+
+def _merge_group(parts: List[Tuple[int, str]], max_overlap: int) -> List[Tuple[List[int], str]]:
+    """
+    Chains chunks of one page that overlap (a CHUNK_OVERLAP side effect) into one
+    passage and drops chunks fully contained in another. parts are (cite, text).
+    """
+    blocks = [([cite], text) for cite, text in parts]
+    merged = True
+    while merged and len(blocks) > 1:
+        merged = False
+        for i in range(len(blocks)):
+            for j in range(len(blocks)):
+                if i == j:
+                    continue
+                (ci, ti), (cj, tj) = blocks[i], blocks[j]
+                if tj in ti:
+                    joined = ti
+                else:
+                    n = _overlap(ti, tj, max_overlap)
+                    if not n:
+                        continue
+                    joined = ti + tj[n:]
+                blocks[i] = (sorted(ci + cj), joined)
+                del blocks[j]
+                merged = True
+                break
+            if merged:
+                break
+    return blocks
+
+def _query_terms(query: Optional[str]) -> set:
+    return {t for t in tokenize(query or "") if t not in _STOPWORDS}
+
+def _cut(sentence: str, max_tokens: int) -> str:
+    """sentence cut at a token boundary so that it plus the trailing " …" fits max_tokens."""
+    if count_tokens(sentence) <= max_tokens:
+        return sentence
+    cut = truncate_tokens(sentence, max_tokens - 1).rstrip()
+    return cut + " …" if cut else ""
+
+def _trim(text: str, terms: set, max_sentences: int, max_tokens: int) -> str:
+    """Keeps the sentences sharing the most query terms, in their original order, within max_tokens."""
+    sentences = [s for s in _SENTENCE.split(" ".join(text.split())) if s]
+    if len(sentences) <= 1:
+        return _cut(sentences[0] if sentences else "", max_tokens)
+
+    scored = sorted(range(len(sentences)), key=lambda i: (-len(terms & set(tokenize(sentences[i]))), i))
+    # each kept sentence pays for the "…" that may precede it; 1 more for a trailing one
+    keep, used = [], 1
+    for i in scored[:max_sentences]:
+        cost = count_tokens(sentences[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        keep.append(i)
+        used += cost
+    if not keep:
+        # not even one sentence fits: the most relevant one, cut
+        return _cut(sentences[scored[0]], max_tokens)
+    keep.sort()
+
+    out = []
+    for n, i in enumerate(keep):
+        if n == 0 and i > 0 or n > 0 and i != keep[n - 1] + 1:
+            out.append("…")
+        out.append(sentences[i])
+    if keep and keep[-1] != len(sentences) - 1:
+        out.append("…")
+    return " ".join(out)
+
+def pack_context(
+    docs: List[Dict[str, Any]],
+    query: Optional[str],
+    max_tokens: int,
+    full_chunks: int,
+    trim_sentences: int,
+) -> List[Dict[str, Any]]:
+    """
+    Context blocks within a token budget. Citation numbers are the 1-based
+    positions of docs (= the rank shown in the sources list) and never shift:
+    merged passages carry every number they contain, and dropped chunks simply
+    leave their number unused.
+
+      1. overlapping / contained chunks of the same source + page (or sheet range) are merged
+      2. while the blocks do not fit max_tokens, the least relevant ones past
+         the first `full_chunks` (highest citation number first) are cut to
+         their `trim_sentences` sentences most relevant to the query
+      3. blocks are taken in relevance order (lowest citation number first);
+         any block that does not fit the remaining budget is cut to fit, or dropped
+    """
+    max_overlap = max(2 * CHUNK_OVERLAP, 16 * CHUNK_OVERLAP_TOKENS, 200)
+    groups: Dict[Tuple[Any, Any], List[Tuple[int, str]]] = {}
+    stored_tokens: Dict[int, int] = {}
+    for i, d in enumerate(docs, start=1):
+        md = d.get("metadata", {}) or {}
+        key = (md.get("source_file", "unknown"), location(md))
+        groups.setdefault(key, []).append((i, (d.get("text") or "").strip()))
+        if md.get("token_count"):
+            stored_tokens[i] = int(md["token_count"])
+
+    blocks = []
+    for key, parts in groups.items():
+        for cites, text in _merge_group(parts, max_overlap):
+            # unmerged chunks reuse the token count stored at index time
+            tokens = stored_tokens.get(cites[0]) if len(cites) == 1 else None
+            blocks.append({"cites": cites, "source_file": key[0], "location": key[1], "text": text, "tokens": tokens})
+    blocks.sort(key=lambda b: b["cites"][0])
+
+    terms = _query_terms(query)
+    for b in blocks:
+        b["tokens"] = b["tokens"] or count_tokens(b["text"])
+        b["header_cost"] = count_tokens(_header(b)) + 2
+    total = sum(b["header_cost"] + b["tokens"] for b in blocks)
+    for b in reversed(blocks[full_chunks:]):
+        if total <= max_tokens:
+            break
+        text = _trim(b["text"], terms, trim_sentences, b["tokens"])
+        tokens = count_tokens(text)
+        total -= b["tokens"] - tokens
+        b.update(text=text, tokens=tokens)
+
+    budget = max_tokens
+    packed = []
+    for b in blocks:
+        header_cost = b.pop("header_cost")
+        room = budget - header_cost
+        if room <= 0:
+            break
+        text, tokens = b["text"], b["tokens"]
+        if tokens > room:
+            text = _trim(text, terms, len(text), room)
+            tokens = count_tokens(text)
+        if not text.strip(" …"):
+            continue
+        budget -= header_cost + tokens
+        packed.append(dict(b, text=text, tokens=tokens))
+
+    # reading order = citation order
+    packed.sort(key=lambda b: b["cites"][0])
+    return packed
+
+def _header(block: Dict[str, Any]) -> str:
+    cites = "".join(f"[{c}]" for c in block["cites"])
+    return f"{cites} source={block['source_file']}" + (f", {block['location']}" if block["location"] else "")
+
+def format_blocks(blocks: List[Dict[str, Any]]) -> str:
+    return "\n\n---\n\n".join(f"{_header(b)}\n{b['text']}" for b in blocks)
@@ -0,0 +1,497 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterator, Tuple, Union
+
+from config.settings import (
+    TOP_K, CHROMA_DIR, COLLECTION_NAME, RETRIEVAL_MODE,
+    RERANK, RERANK_CANDIDATES, RERANK_BUDGET_MS, ANSWER_CACHE, BATCH_GENERATE_WORKERS, VECTOR_BACKEND,
+)
+from vector_store.embeddings import get_embedding_function
+from vector_store.chroma_store import embed_texts
+from vector_store.bm25 import BM25Index
+from vector_store.index_meta import collection_root, list_collections, index_ready
+from vector_store.metadata_index import normalize_filters
+from rag.collection_pool import CollectionPool, CollectionHandle
+from rag.llm import get_chat_model, llm_available
+from rag.retriever import retrieve_batch, filtered_retrieve_batch, hybrid_retrieve_batch, merge_by_score, to_sources
+from rag.generator import generate, generate_stream
+from rag.query_rewriter import rewrite_query, rewrite_stats
+from rag.tracing import tracer, Trace
+
+class RAGEngine:
+    """
+    Long-lived holder for the embedding model, collections and LLM clients.
+    Everything is loaded once (lazily, or up front via warm_up) and then shared
+    by every caller, so per-question latency is retrieval + generation only.
+    Safe to share across threads and Streamlit sessions.
+
+    Query methods take `collection`: None for the default collection, a name,
+    or a list of names to search all of them and merge the results by score.
+    Collections are opened on first use and closed again by LRU / idle
+    eviction (see CollectionPool); the embedding model is shared by all.
+    """
+
+    def __init__(
+        self,
+        persist_dir: str = CHROMA_DIR,
+        collection_name: str = COLLECTION_NAME,
+        llm: Optional[Any] = None,
+        rewrite_llm: Optional[Any] = None,
+        embedding_fn: Optional[Any] = None,
+        backend: str = VECTOR_BACKEND,
+        answer_cache: bool = ANSWER_CACHE,
+    ):
+        # persist_dir is the index root of the default collection; other
+        # collections live under <persist_dir>/collections/<name>
+        self.index_root = persist_dir
+        self.collection_name = collection_name
+        self.backend = backend
+
+        # injected clients (e.g. a fake LLM) are kept across close()
+        self._llm_override = llm
+        self._rewrite_llm_override = rewrite_llm
+        self._embedding_fn_override = embedding_fn
+
+        self._lock = threading.RLock()
+        self._embedding_fn = embedding_fn
+        self.collections = CollectionPool(
+            self._collection_root,
+            backend,
+            lambda: self.embedding_fn,
+            answer_cache=answer_cache,
+        )
+        self._reranker = None
+        self._llm = None
+        self._rewrite_llm = None
+
+    # ---------- Lazily-loaded resources ----------
+    @property
+    def embedding_fn(self):
+        if self._embedding_fn is None:
+            with self._lock:
+                if self._embedding_fn is None:
+                    self._embedding_fn = get_embedding_function()
+        return self._embedding_fn
+
+    # default collection (one-off reads; queries lease handles from the pool)
+    @property
+    def collection(self):
+        return self.collections.get(self.collection_name).collection
+
+    @property
+    def bm25(self) -> Optional[BM25Index]:
+        """Sparse index persisted by build_index; None if it was never built."""
+        return self.collections.get(self.collection_name).bm25
+
+    @property
+    def persist_dir(self) -> str:
+        return self.collections.get(self.collection_name).persist_dir
+
+    @property
+    def answer_cache(self):
+        return self.collections.get(self.collection_name).answer_cache
+
+    def _collection_root(self, name: str) -> str:
+        root = collection_root(name, self.index_root, self.collection_name)
+        # only the default collection may be opened before it is built
+        if name != self.collection_name and not index_ready(root):
+            raise ValueError(f"Unknown collection {name!r}; built: {', '.join(self.list_collections()) or 'none'}")
+        return root
+
+    def list_collections(self) -> List[str]:
+        """Collections with a built index on disk."""
+        return list_collections(self.index_root, self.collection_name)
+
+    def filter_values(self, collection: Union[str, List[str], None] = None) -> Dict[str, List[str]]:
+        """Indexed source files and doc types of the given collection(s), for filter pickers."""
+        out: Dict[str, set] = {"source_file": set(), "doc_type": set()}
+        for name in self._names(collection):
+            with self.collections.lease(name) as handle:
+                index = handle.metadata_index
+                for col in out:
+                    out[col].update(index.distinct(col))
+        return {col: sorted(values) for col, values in out.items()}
+
+    @property
+    def reranker(self):
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    # imported lazily: the cross-encoder is only loaded if re-ranking is used
+                    from rag.reranker import CrossEncoderReranker
+                    self._reranker = CrossEncoderReranker()
+        return self._reranker
+
+    @property
+    def llm(self):
+        if self._llm_override is not None:
+            return self._llm_override
+        if self._llm is None and llm_available():
+            with self._lock:
+                if self._llm is None:
+                    self._llm = get_chat_model(temperature=0.2)
+        return self._llm
+
+    @property
+    def rewrite_llm(self):
+        if self._rewrite_llm_override is not None:
+            return self._rewrite_llm_override
+        if self._rewrite_llm is None and llm_available():
+            with self._lock:
+                if self._rewrite_llm is None:
+                    self._rewrite_llm = get_chat_model(temperature=0.0)
+        return self._rewrite_llm
+
+    # ---------- Lifecycle ----------
+    def warm_up(self) -> "RAGEngine":
+        """Load everything now instead of on the first question."""
+        self.collection
+        self.bm25
+        if RERANK:
+            self.reranker
+        self.llm
+        self.rewrite_llm
+        # the first encode pays for tokenizer / torch initialisation
+        embed_texts(self.embedding_fn, ["warm up"])
+        return self
+
+    def refresh(self) -> None:
+        """Close every collection handle (reopened on next use); the model stays loaded."""
+        self.collections.close()
+
+    def close(self) -> None:
+        """Release the collection, embedding model and LLM clients."""
+        with self._lock:
+            self.refresh()
+            cache = getattr(self._embedding_fn, "cache", None)
+            if cache is not None:
+                cache.save()
+            self._embedding_fn = self._embedding_fn_override
+            self._reranker = None
+            self._llm = None
+            self._rewrite_llm = None
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        cache = getattr(self._embedding_fn, "cache", None)
+        if cache is not None:
+            out["embedding_cache"] = cache.stats()
+        if self._reranker is not None:
+            out["reranker"] = self._reranker.stats()
+        out["rewrite"] = rewrite_stats()
+        out["collections"] = self.collections.stats()
+        if self.collection_name in out["collections"]["open"]:
+            cache = self.collections.get(self.collection_name).answer_cache
+            if cache is not None:
+                out["answer_cache"] = cache.stats()
+        return out
+
+    # ---------- Query ----------
+    def _names(self, collection: Union[str, List[str], None]) -> List[str]:
+        if collection is None:
+            return [self.collection_name]
+        if isinstance(collection, str):
+            return [collection]
+        names = list(dict.fromkeys(collection))
+        if not names:
+            raise ValueError("collection list is empty")
+        return names
+
+    def _cache_handle(self, collection: Union[str, List[str], None]) -> Optional[CollectionHandle]:
+        # answers are cached per collection; fan-out searches are not cached
+        names = self._names(collection)
+        return self.collections.get(names[0]) if len(names) == 1 else None
+
+    def vocabulary(self, collection: Union[str, List[str], None] = None) -> Optional[BM25Index]:
+        """Index vocabulary the query rewriter scores keyphrases against (the first collection's BM25)."""
+        return self.collections.get(self._names(collection)[0]).bm25
+
+    def cached_answer(self, rewritten: str, docs: List[Dict[str, Any]], vec=None, collection: Union[str, List[str], None] = None):
+        """(query embedding, cached result or None); the embedding is reused by remember_answer."""
+        handle = self._cache_handle(collection)
+        if handle is None or handle.answer_cache is None:
+            return None, None
+        with tracer.span("answer_cache_lookup") as sp:
+            if vec is None:
+                vec = embed_texts(self.embedding_fn, [rewritten])
+            hit = handle.answer_cache.lookup(vec, [d["id"] for d in docs], handle.index_version())
+            sp.set("hit", hit is not None)
+        if hit is not None:
+            tracer.incr("answer_cache_hits")
+        return vec, hit
+
+    def remember_answer(self, vec, docs: List[Dict[str, Any]], result: Dict[str, Any], collection: Union[str, List[str], None] = None) -> None:
+        handle = self._cache_handle(collection)
+        if handle is not None and handle.answer_cache is not None and vec is not None:
+            handle.answer_cache.store(vec, [d["id"] for d in docs], result, handle.index_version())
+
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        mode: str = RETRIEVAL_MODE,
+        rerank: bool = RERANK,
+        collection: Union[str, List[str], None] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        with tracer.span("retrieve", mode=mode, top_k=top_k, rerank=rerank):
+            if rerank:
+                # over-fetch, then let the cross-encoder pick the best top_k within the budget
+                deadline = time.perf_counter() + RERANK_BUDGET_MS / 1000.0
+                candidates = self._retrieve(query, max(top_k, RERANK_CANDIDATES), mode, collection, filters)
+                with tracer.span("rerank", candidates=len(candidates)):
+                    docs = self.reranker.rerank(query, candidates, top_k=top_k, deadline=deadline)
+            else:
+                docs = self._retrieve(query, top_k, mode, collection, filters)
+        tracer.incr("retrieved_chunks", len(docs))
+        return docs
+
+    def _retrieve(self, query: str, top_k: int, mode: str, collection=None, filters=None) -> List[Dict[str, Any]]:
+        return self._retrieve_batch([query], top_k, mode, collection, filters)[1][0]
+
+    def _retrieve_batch(self, queries: List[str], top_k: int, mode: str, collection=None, filters=None) -> Tuple[Any, List[List[Dict[str, Any]]]]:
+        """
+        One embedding call, then one multi-query search per collection; returns
+        (query embeddings, ranked lists). Results of several collections are
+        merged by score. Metadata filters apply to every collection searched.
+        """
+        names = self._names(collection)
+        filters = normalize_filters(filters)
+        if len(names) > 1:
+            self._check_comparable(names)
+        with tracer.span("embed_query", queries=len(queries)):
+            query_embeddings = embed_texts(self.embedding_fn, queries)
+
+        per_collection = []
+        for name in names:
+            with self.collections.lease(name) as handle, tracer.span("search_collection", collection=name):
+                lists = self._search_collection(handle, queries, top_k, mode, query_embeddings, filters)
+            for docs in lists:
+                for d in docs:
+                    d["collection"] = name
+            per_collection.append(lists)
+
+        if len(per_collection) == 1:
+            return query_embeddings, per_collection[0]
+        return query_embeddings, [merge_by_score([lists[q] for lists in per_collection], top_k) for q in range(len(queries))]
+
+    def _check_comparable(self, names: List[str]) -> None:
+        # merged results are ranked by distance, which means nothing across raw and unit-length vectors
+        normalized = {name: self.collections.get(name).embed_normalize for name in names}
+        if len(set(normalized.values())) > 1:
+            raw = [name for name, n in normalized.items() if not n]
+            unit = [name for name, n in normalized.items() if n]
+            raise ValueError(
+                f"Cannot search {', '.join(names)} together: {', '.join(unit)} built with EMBED_NORMALIZE=1, "
+                f"{', '.join(raw)} with EMBED_NORMALIZE=0. Rebuild them with the same setting (--full)."
+            )
+
+    @staticmethod
+    def _search_collection(handle: CollectionHandle, queries: List[str], top_k: int, mode: str, query_embeddings, filters=None) -> List[List[Dict[str, Any]]]:
+        collection = handle.collection
+        # filters resolve to chunk IDs through the metadata index, before any vector search
+        selection = handle.select(filters) if filters else None
+        bm25 = handle.bm25 if mode == "hybrid" else None
+        if bm25 is not None:
+            return hybrid_retrieve_batch(collection, bm25, queries, top_k=top_k, query_embeddings=query_embeddings, selection=selection)
+        # dense, or hybrid requested before a sparse index exists
+        if selection is not None:
+            return filtered_retrieve_batch(collection, selection, queries, top_k, query_embeddings)
+        return retrieve_batch(collection, queries, top_k=top_k, query_embeddings=query_embeddings)
+
+    def _search_batch(self, queries: List[str], top_k: int, mode: str, rerank: bool, collection=None, filters=None):
+        """Deduped queries -> (unique queries, their embeddings, ranked lists)."""
+        unique = list(dict.fromkeys(queries))
+        if not unique:
+            return [], None, []
+        with tracer.span("retrieve_batch", mode=mode, top_k=top_k, rerank=rerank, queries=len(unique)):
+            fetch_k = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+            vecs, lists = self._retrieve_batch(unique, fetch_k, mode, collection, filters)
+            if rerank:
+                with tracer.span("rerank", candidates=sum(len(c) for c in lists)):
+                    # same per-query budget as retrieve()
+                    lists = [
+                        self.reranker.rerank(q, c, top_k=top_k, deadline=time.perf_counter() + RERANK_BUDGET_MS / 1000.0)
+                        for q, c in zip(unique, lists)
+                    ]
+        tracer.incr("retrieved_chunks", sum(len(d) for d in lists))
+        return unique, vecs, lists
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = TOP_K,
+        mode: str = RETRIEVAL_MODE,
+        rerank: bool = RERANK,
+        collection: Union[str, List[str], None] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """retrieve() for many queries at once, in input order; duplicates are searched once."""
+        queries = [(q or "").strip() for q in queries]
+        unique, _, lists = self._search_batch(queries, top_k, mode, rerank, collection, filters)
+        by_query = dict(zip(unique, lists))
+        return [by_query[q] for q in queries]
+
+    def answer_batch(
+        self,
+        queries: List[str],
+        top_k: int = TOP_K,
+        mode: str = RETRIEVAL_MODE,
+        rerank: bool = RERANK,
+        max_workers: int = BATCH_GENERATE_WORKERS,
+        collection: Union[str, List[str], None] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        answer() for many standalone questions (no chat history): one embedding
+        call and one vector search for the whole batch, answer-cache lookups
+        reuse those embeddings, and the remaining generations run concurrently.
+        Identical questions are answered once. Results are in input order.
+        """
+        queries = [(q or "").strip() for q in queries]
+        with tracer.trace("answer_batch", queries=len(queries), top_k=top_k, mode=mode, rerank=rerank):
+            unique, vecs, lists = self._search_batch(queries, top_k, mode, rerank, collection, filters)
+
+            results: Dict[str, Dict[str, Any]] = {}
+            todo = []
+            for i, (q, docs) in enumerate(zip(unique, lists)):
+                vec = vecs[i:i + 1] if vecs is not None else None
+                vec, hit = self.cached_answer(q, docs, vec=vec, collection=collection)
+                if hit is not None:
+                    results[q] = dict(hit, rewritten_query=q, cache_hit=True)
+                else:
+                    todo.append((q, docs, vec))
+
+            def run(q, docs, vec):
+                result = {"answer": generate(q, docs, llm=llm), "sources": to_sources(docs), "rewritten_query": q}
+                self.remember_answer(vec, docs, result, collection=collection)
+                return q, dict(result, cache_hit=False)
+
+            if todo:
+                llm = self.llm  # resolve once, before fanning out
+                with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(todo)))) as pool:
+                    # each task gets its own copy of the context so spans land in this trace
+                    futures = [pool.submit(contextvars.copy_context().run, run, *t) for t in todo]
+                    for fut in futures:
+                        q, result = fut.result()
+                        results[q] = result
+
+        return [dict(results[q]) for q in queries]
+
+    def answer(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        history: Optional[List[Dict[str, str]]] = None,
+        mode: str = RETRIEVAL_MODE,
+        rerank: bool = RERANK,
+        collection: Union[str, List[str], None] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Answers one question. filters restricts retrieval to matching chunks:
+        source_file, doc_type, page_range, ingested_after / ingested_before
+        (see vector_store.metadata_index).
+        """
+        with tracer.trace("answer", top_k=top_k, mode=mode, rerank=rerank) as tr:
+            result = self._answer(query, top_k, history, mode, rerank, collection, filters)
+        if isinstance(tr, Trace):
+            result["trace"] = tr.to_dict()
+        return result
+
+    def _answer(self, query, top_k, history, mode, rerank, collection=None, filters=None) -> Dict[str, Any]:
+        # memory to rewrite query ONLY for retrieval
+        with tracer.span("rewrite_query"):
+            rewritten = rewrite_query(query, history or [], llm=self.rewrite_llm, vocabulary=self.vocabulary(collection))
+        docs = self.retrieve(rewritten, top_k=top_k, mode=mode, rerank=rerank, collection=collection, filters=filters)
+
+        vec, hit = self.cached_answer(rewritten, docs, collection=collection)
+        if hit is not None:
+            return dict(hit, rewritten_query=rewritten, cache_hit=True)
+
+        # Generation remains grounded ONLY in retrieved docs
+        ans = generate(query, docs, llm=self.llm)
+
+        result = {
+            "answer": ans,
+            "sources": to_sources(docs),
+            "rewritten_query": rewritten
+        }
+        self.remember_answer(vec, docs, result, collection=collection)
+        return dict(result, cache_hit=False)
+
+    def answer_stream(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        history: Optional[List[Dict[str, str]]] = None,
+        mode: str = RETRIEVAL_MODE,
+        rerank: bool = RERANK,
+        collection: Union[str, List[str], None] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming answer(): yields {"type": "token", "text": ...} events as the
+        LLM produces them, then one {"type": "sources", ...} event with the full
+        answer, sources, rewritten query and timing metrics (ttft_ms = time from
+        the call to the first token, total_ms = time to the last one).
+        """
+        final: Dict[str, Any] = {}
+        with tracer.trace("answer_stream", top_k=top_k, mode=mode, rerank=rerank) as tr:
+            for event in self._answer_stream(query, top_k, history, mode, rerank, collection, filters):
+                if event["type"] == "token":
+                    yield event
+                else:
+                    final = event
+            tr.set("ttft_ms", final.get("metrics", {}).get("ttft_ms"))
+        if isinstance(tr, Trace):
+            final["trace"] = tr.to_dict()
+        yield final
+
+    def _answer_stream(self, query, top_k, history, mode, rerank, collection=None, filters=None) -> Iterator[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        with tracer.span("rewrite_query"):
+            rewritten = rewrite_query(query, history or [], llm=self.rewrite_llm, vocabulary=self.vocabulary(collection))
+        docs = self.retrieve(rewritten, top_k=top_k, mode=mode, rerank=rerank, collection=collection, filters=filters)
+        t_retrieved = time.perf_counter()
+
+        vec, hit = self.cached_answer(rewritten, docs, collection=collection)
+        if hit is not None:
+            yield {"type": "token", "text": hit["answer"]}
+            total = time.perf_counter() - t0
+            yield dict(
+                hit,
+                type="sources",
+                rewritten_query=rewritten,
+                cache_hit=True,
+                metrics={"retrieval_ms": (t_retrieved - t0) * 1000.0, "ttft_ms": total * 1000.0, "total_ms": total * 1000.0},
+            )
+            return
+
+        ttft = None
+        pieces: List[str] = []
+        for text in generate_stream(query, docs, llm=self.llm):
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+            pieces.append(text)
+            yield {"type": "token", "text": text}
+        total = time.perf_counter() - t0
+
+        result = {
+            "answer": "".join(pieces),
+            "sources": to_sources(docs),
+            "rewritten_query": rewritten,
+        }
+        self.remember_answer(vec, docs, result, collection=collection)
+        yield dict(
+            result,
+            type="sources",
+            cache_hit=False,
+            metrics={
+                "retrieval_ms": (t_retrieved - t0) * 1000.0,
+                "ttft_ms": (ttft if ttft is not None else total) * 1000.0,
+                "total_ms": total * 1000.0,
+            },
+        )
@@ -0,0 +1,65 @@
+import re
+import time
+from typing import List, Dict, Any, Iterator, Optional
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+class FakeStreamingLLM:
+    """
+    Offline stand-in for ChatGroq: same invoke()/stream() surface, deterministic
+    output, configurable latency. The answer quotes the first sentence of each of
+    the first context blocks with its citation, so it looks like a grounded reply.
+
+      first_token_delay  seconds before the first chunk (simulated queue + prefill)
+      chunk_delay        seconds between chunks (simulated decode speed)
+      chunk_words        words per streamed chunk
+    """
+
+    def __init__(
+        self,
+        response: Optional[str] = None,
+        first_token_delay: float = 0.2,
+        chunk_delay: float = 0.02,
+        chunk_words: int = 1,
+        max_citations: int = 2,
+    ):
+        self.response = response
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_words = max(1, chunk_words)
+        self.max_citations = max_citations
+
+    def _respond(self, messages: List[Dict[str, Any]]) -> str:
+        if self.response is not None:
+            return self.response
+        user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        if "Context:" not in user:
+            # query rewriting: echo the latest message
+            latest = user.split("Latest user message:\n")[-1].split("\n\n")[0]
+            return latest.strip()
+
+        context = user.split("Context:\n", 1)[1].rsplit("\n\nAnswer:", 1)[0]
+        parts = []
+        for block in context.split("\n\n---\n\n")[:self.max_citations]:
+            m = re.match(r"\[(\d+)\][^\n]*\n(.*)", block, flags=re.S)
+            if not m:
+                continue
+            sentence = re.split(r"(?<=[.!?])\s+", " ".join(m.group(2).split()))[0][:200]
+            parts.append(f"{sentence} [{m.group(1)}]")
+        return " ".join(parts) or "I don't know based on the provided documents."
+
+    def invoke(self, messages: List[Dict[str, Any]]) -> FakeMessage:
+        text = self._respond(messages)
+        time.sleep(self.first_token_delay + self.chunk_delay * max(0, len(text.split()) // self.chunk_words - 1))
+        return FakeMessage(text)
+
+    def stream(self, messages: List[Dict[str, Any]]) -> Iterator[FakeMessage]:
+        words = self._respond(messages).split(" ")
+        time.sleep(self.first_token_delay)
+        for i in range(0, len(words), self.chunk_words):
+            if i:
+                time.sleep(self.chunk_delay)
+            piece = " ".join(words[i:i + self.chunk_words])
+            yield FakeMessage(piece if i == 0 else " " + piece)
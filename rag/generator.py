@@ -1,30 +1,28 @@
-from typing import List, Dict, Any
-from langchain_groq import ChatGroq
-from config.settings import GROQ_API_KEY, GROQ_MODEL
+from typing import List, Dict, Any, Optional, Iterator
+from config.settings import CONTEXT_TOKEN_BUDGET, CONTEXT_FULL_CHUNKS, CONTEXT_TRIM_SENTENCES
+from rag.context_packer import pack_context, format_blocks, location
+from ingestion.chunking import count_tokens
+from rag.llm import get_chat_model, llm_available
+from rag.tracing import tracer, estimate_tokens, NOOP_SPAN
+
+def build_context(docs: List[Dict[str, Any]], query: Optional[str] = None, max_tokens: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    [n]-numbered context blocks, n = position in docs (the rank in the sources list).
+    With a token budget the blocks are packed (see rag.context_packer); 0 = all chunks in full.
+    """
+    if max_tokens > 0:
+        return format_blocks(pack_context(docs, query, max_tokens, CONTEXT_FULL_CHUNKS, CONTEXT_TRIM_SENTENCES))
 
-def build_context(docs: List[Dict[str, Any]]) -> str:
     blocks = []
     for i, d in enumerate(docs, start=1):
         md = d.get("metadata", {}) or {}
         src = md.get("source_file", "unknown")
-        page = md.get("page", None)
-        header = f"[{i}] source={src}" + (f", page={page}" if page is not None else "")
+        loc = location(md)
+        header = f"[{i}] source={src}" + (f", {loc}" if loc else "")
         blocks.append(f"{header}\n{d['text']}")
     return "\n\n---\n\n".join(blocks)
 
-def generate(query: str, docs: List[Dict[str, Any]]) -> str:
-    if not GROQ_API_KEY:
-        raise RuntimeError("GROQ_API_KEY is missing. Add it to your .env")
-
-    llm = ChatGroq(
-        groq_api_key=GROQ_API_KEY,
-        model_name=GROQ_MODEL,
-        temperature=0.2,
-    )
-
-    context = build_context(docs)
-
-    system = (
+SYSTEM_PROMPT = (
     "You are a factual assistant.\n"
     "Use ONLY the provided context.\n"
     "Respond with clear, factual statements grounded in the context.\n"
@@ -34,11 +32,55 @@ def generate(query: str, docs: List[Dict[str, Any]]) -> str:
     "Do NOT explain what you do not know.\n"
     "Do NOT list missing information.\n"
     "Do NOT mention limitations or lack of knowledge explicitly.\n"
-    )
+)
 
+def build_messages(query: str, docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    context = build_context(docs, query=query)
+    user = f"Question:\n{query}\n\nContext:\n{context}\n\nAnswer:"
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user}]
 
+def _resolve_llm(llm: Optional[Any]):
+    if llm is None:
+        if not llm_available():
+            raise RuntimeError("GROQ_API_KEY is missing. Add it to your .env")
+        llm = get_chat_model(temperature=0.2)
+    return llm
 
-    user = f"Question:\n{query}\n\nContext:\n{context}\n\nAnswer:"
+def _traced_messages(query: str, docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    with tracer.span("build_context", chunks=len(docs)) as sp:
+        messages = build_messages(query, docs)
+        sp.set("prompt_tokens_est", sum(estimate_tokens(m["content"]) for m in messages))
+        if sp is not NOOP_SPAN and CONTEXT_TOKEN_BUDGET > 0:
+            sp.set("raw_context_tokens", sum((d.get("metadata") or {}).get("token_count") or count_tokens(d.get("text", "")) for d in docs))
+    return messages
 
-    resp = llm.invoke([{"role": "system", "content": system}, {"role": "user", "content": user}])
+def _record_usage(sp, resp, messages: List[Dict[str, str]], completion: str) -> None:
+    # provider-reported usage when available (ChatGroq), estimates otherwise
+    usage = getattr(resp, "usage_metadata", None) or {}
+    prompt = usage.get("input_tokens") or sum(estimate_tokens(m["content"]) for m in messages)
+    completion_tokens = usage.get("output_tokens") or estimate_tokens(completion)
+    sp.set("prompt_tokens", prompt)
+    sp.set("completion_tokens", completion_tokens)
+    tracer.incr("prompt_tokens", prompt)
+    tracer.incr("completion_tokens", completion_tokens)
+
+def generate(query: str, docs: List[Dict[str, Any]], llm: Optional[Any] = None) -> str:
+    llm = _resolve_llm(llm)
+    messages = _traced_messages(query, docs)
+    with tracer.span("llm") as sp:
+        resp = llm.invoke(messages)
+        _record_usage(sp, resp, messages, resp.content or "")
     return resp.content
+
+def generate_stream(query: str, docs: List[Dict[str, Any]], llm: Optional[Any] = None) -> Iterator[str]:
+    """Yields answer text pieces as the LLM produces them."""
+    llm = _resolve_llm(llm)
+    messages = _traced_messages(query, docs)
+    with tracer.span("llm_stream") as sp:
+        pieces = []
+        for chunk in llm.stream(messages):
+            text = getattr(chunk, "content", chunk)
+            if text:
+                pieces.append(text)
+                yield text
+        _record_usage(sp, None, messages, "".join(pieces))
@@ -0,0 +1,17 @@
+from langchain_groq import ChatGroq
+from config.settings import GROQ_API_KEY, GROQ_MODEL, LLM_PROVIDER, FAKE_LLM_TTFT_MS, FAKE_LLM_CHUNK_MS
+
+def llm_available() -> bool:
+    return LLM_PROVIDER == "fake" or bool(GROQ_API_KEY)
+
+def get_chat_model(temperature: float = 0.2):
+    if LLM_PROVIDER == "fake":
+        # offline runs (tests, benchmarks, load tests) without a Groq key
+        from rag.fake_llm import FakeStreamingLLM
+        return FakeStreamingLLM(first_token_delay=FAKE_LLM_TTFT_MS / 1000.0, chunk_delay=FAKE_LLM_CHUNK_MS / 1000.0)
+
+    return ChatGroq(
+        groq_api_key=GROQ_API_KEY,
+        model_name=GROQ_MODEL,
+        temperature=temperature,
+    )
@@ -1,32 +1,68 @@
-from typing import Dict, Any, List, Optional
+import threading
+from typing import Dict, Any, List, Optional, Iterator, Union
 
-from config.settings import TOP_K, CHROMA_DIR, COLLECTION_NAME
-from vector_store.embeddings import get_embedding_function
-from vector_store.chroma_store import get_or_create_collection
-from rag.retriever import retrieve, to_sources
-from rag.generator import generate
-from rag.query_rewriter import rewrite_query
+from config.settings import TOP_K, RETRIEVAL_MODE, RERANK
+from rag.engine import RAGEngine
+
+_engine: Optional[RAGEngine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> RAGEngine:
+    """Process-wide engine shared by every caller of answer()."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RAGEngine()
+    return _engine
+
+def set_engine(engine: RAGEngine) -> None:
+    """Installs a pre-built engine (e.g. the HTTP server's) as the process-wide one."""
+    global _engine
+    with _engine_lock:
+        _engine = engine
 
 def load_collection():
-    embedding_fn = get_embedding_function()
-    return get_or_create_collection(
-        persist_dir=CHROMA_DIR,
-        collection_name=COLLECTION_NAME,
-        embedding_function=embedding_fn
-    )
-
-def answer(query: str, top_k: int = TOP_K, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
-    collection = load_collection()
-
-    # memory to rewrite query ONLY for retrieval
-    rewritten = rewrite_query(query, history or [])
-    docs = retrieve(collection, rewritten, top_k=top_k)
-
-    # Generation remains grounded ONLY in retrieved docs
-    ans = generate(query, docs)
-
-    return {
-        "answer": ans,
-        "sources": to_sources(docs),
-        "rewritten_query": rewritten
-    }
+    return get_engine().collection
+
+def answer(
+    query: str,
+    top_k: int = TOP_K,
+    history: Optional[List[Dict[str, str]]] = None,
+    mode: str = RETRIEVAL_MODE,
+    rerank: bool = RERANK,
+    collection: Union[str, List[str], None] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    return get_engine().answer(query, top_k=top_k, history=history, mode=mode, rerank=rerank, collection=collection, filters=filters)
+
+def answer_stream(
+    query: str,
+    top_k: int = TOP_K,
+    history: Optional[List[Dict[str, str]]] = None,
+    mode: str = RETRIEVAL_MODE,
+    rerank: bool = RERANK,
+    collection: Union[str, List[str], None] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    return get_engine().answer_stream(query, top_k=top_k, history=history, mode=mode, rerank=rerank, collection=collection, filters=filters)
+
+def retrieve_batch(
+    queries: List[str],
+    top_k: int = TOP_K,
+    mode: str = RETRIEVAL_MODE,
+    rerank: bool = RERANK,
+    collection: Union[str, List[str], None] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[List[Dict[str, Any]]]:
+    return get_engine().retrieve_batch(queries, top_k=top_k, mode=mode, rerank=rerank, collection=collection, filters=filters)
+
+def answer_batch(
+    queries: List[str],
+    top_k: int = TOP_K,
+    mode: str = RETRIEVAL_MODE,
+    rerank: bool = RERANK,
+    collection: Union[str, List[str], None] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    return get_engine().answer_batch(queries, top_k=top_k, mode=mode, rerank=rerank, collection=collection, filters=filters)
@@ -1,57 +1,218 @@
-from typing import List, Dict
-from langchain_groq import ChatGroq
-from config.settings import GROQ_API_KEY, GROQ_MODEL
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from config.settings import REWRITE_LLM_THRESHOLD, REWRITE_CACHE_SIZE
+from rag.llm import get_chat_model, llm_available
+from rag.tracing import tracer
 
 PRONOUNS = {"it", "this", "that", "they", "those", "these", "he", "she", "them", "its", "their"}
+DEMONSTRATIVES = {"this", "that", "these", "those"}
+POSSESSIVES = {"its", "their"}
+
+_WORD = re.compile(r"\w+(?:[-./']\w+)*")
+_STOPWORDS = {
+    "a", "about", "above", "after", "again", "all", "also", "am", "an", "and", "any", "are", "as", "at",
+    "be", "because", "been", "before", "being", "between", "both", "but", "by", "can", "could", "did",
+    "do", "does", "doing", "during", "each", "else", "explain", "few", "for", "from", "further", "give",
+    "had", "has", "have", "having", "her", "here", "him", "his", "how", "i", "if", "in", "into", "is",
+    "just", "me", "more", "most", "much", "my", "no", "nor", "not", "now", "of", "on", "once", "only",
+    "or", "other", "our", "out", "over", "please", "same", "say", "says", "should", "so", "some", "such",
+    "tell", "than", "the", "then", "there", "to", "too", "under", "until", "up", "us", "very", "was", "we",
+    "were", "what", "when", "where", "which", "while", "who", "whom", "why", "will", "with", "would",
+    "you", "your", "mean", "means", "work", "works", "used", "use", "important", "compare", "compared",
+    "example", "examples", "describe", "list", "difference", "differences", "document", "documents",
+    "hello", "hi", "hey", "thanks", "thank", "ok", "okay", "yes", "great",
+} | PRONOUNS
+# follow-ups that continue the previous question ("what about X", "and for Y?")
+_ELLIPSIS = re.compile(r"^\s*(?:and|also|but|what about|how about|and what about|same for|what of|as for)\b", re.I)
+
+HISTORY_TURNS = 8          # messages the rewrite looks at, local or LLM
+_MAX_PHRASE_WORDS = 3
+
+# ---------- Local tier ----------
+def _idf_fn(vocabulary: Optional[Any]) -> Callable[[str], float]:
+    if vocabulary is None:
+        # no index vocabulary: every non-trivial word counts the same
+        return lambda w: 1.0 if len(w) > 2 else 0.0
+
+    def idf(w: str) -> float:
+        # "transformers" in a question, "transformer" in the corpus
+        return vocabulary.term_idf(w) or (vocabulary.term_idf(w[:-1]) if w.endswith("s") else 0.0)
+    return idf
+
+def _prior_turns(user_query: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    # the UI appends the current question to history before answering; the API may not
+    turns = [m for m in history if (m.get("content") or "").strip()]
+    if turns and turns[-1].get("role") == "user" and turns[-1]["content"].strip() == user_query:
+        turns = turns[:-1]
+    return turns[-HISTORY_TURNS:]
 
-def _last_user_topic(history: List[Dict[str, str]]) -> str:
+def extract_keyphrases(
+    turns: List[Dict[str, str]],
+    idf: Callable[[str], float],
+    exclude: Optional[set] = None,
+    max_phrases: int = 5,
+) -> List[Tuple[str, float, int]]:
     """
-    Pull a simple 'topic' from the last user message that isn't just a pronoun.
-    This is a lightweight, reliable fallback for coreference like 'it'.
+    (phrase, score, turn index) candidates from recent turns, best first.
+
+    Phrases are runs of up to three consecutive non-stopwords. A phrase scores
+    the mean index IDF of its words with a bonus per extra word, so a longer
+    phrase only wins when its words are about as specific (words the corpus
+    lacks make a phrase useless for retrieval and disqualify it). Scores are
+    weighted by recency: the latest user turn counts fully, each older user
+    turn 0.6x, assistant turns 0.3x of that (the referent is usually what the
+    user asked about, not a detail of the answer).
+    Phrases already in the question (`exclude`) and sub-phrases of a better
+    phrase are dropped.
     """
-    # Walk backwards through user messages
-    for m in reversed(history):
-        if m.get("role") != "user":
-            continue
-        text = (m.get("content") or "").strip()
-        if not text:
+    exclude = exclude or set()
+    best: Dict[str, Tuple[str, float, int]] = {}
+    user_age = 0
+    for t in range(len(turns) - 1, -1, -1):
+        m = turns[t]
+        is_user = m.get("role") == "user"
+        weight = 0.6 ** user_age * (1.0 if is_user else 0.3)
+        if is_user:
+            user_age += 1
+
+        run: List[str] = []
+        runs: List[List[str]] = []
+        for w in _WORD.findall(m["content"]):
+            if w.lower() in _STOPWORDS or w.isdigit():
+                if run:
+                    runs.append(run)
+                run = []
+            else:
+                run.append(w)
+        if run:
+            runs.append(run)
+
+        for run in runs:
+            for n in range(1, _MAX_PHRASE_WORDS + 1):
+                for i in range(len(run) - n + 1):
+                    words = run[i:i + n]
+                    if words[-1].lower().endswith("ed"):
+                        continue  # "how was DeepSeek-R1 trained": a verb, not part of the topic
+                    scores = [idf(w.lower()) for w in words]
+                    if min(scores) <= 0.0:
+                        continue
+                    key = " ".join(w.lower() for w in words)
+                    if all(w.lower() in exclude for w in words):
+                        continue
+                    score = weight * sum(scores) / n * (1.0 + 0.25 * (n - 1))
+                    if key not in best or score > best[key][1]:
+                        best[key] = (" ".join(words), score, t)
+
+    ranked = sorted(best.values(), key=lambda p: -p[1])
+    out: List[Tuple[str, float, int]] = []
+    for phrase, score, t in ranked:
+        low = f" {phrase.lower()} "
+        if any(low in f" {p.lower()} " for p, _, _ in out):
             continue
-        # If message is longer than a few chars, treat it as topic-ish
-        return text
-    return ""
+        out.append((phrase, score, t))
+        if len(out) == max_phrases:
+            break
+    return out
 
-def rewrite_query(user_query: str, history: List[Dict[str, str]]) -> str:
+def _is_reference(words: List[str], i: int) -> bool:
+    w = words[i]
+    low = w.lower()
+    if low not in PRONOUNS or w == "IT":  # "IT systems"
+        return False
+    if low in DEMONSTRATIVES:
+        # "is this allowed" refers back; "this regulation" names its own noun
+        nxt = words[i + 1].lower() if i + 1 < len(words) else None
+        return nxt is None or nxt in _STOPWORDS or nxt.endswith("ed")
+    return True
+
+def local_rewrite(user_query: str, turns: List[Dict[str, str]], idf: Callable[[str], float]) -> Tuple[str, float]:
     """
-    Converts a follow-up question into a standalone search query using chat history.
-    Retrieval uses this rewritten query; generation uses original user question.
+    (rewritten query, confidence 0..1) without an LLM.
+
+    Standalone questions are returned as they are. Follow-ups that refer back
+    (pronouns, "what about ...", or too few specific terms of their own) get
+    the best keyphrase of recent turns: substituted for the pronoun, or
+    appended in parentheses. Confidence drops when two turns offer equally
+    good referents, when several pronouns may point at different things, and
+    for questions that only look underspecified.
     """
+    words = _WORD.findall(user_query)
+    refs = [i for i in range(len(words)) if _is_reference(words, i)]
+    elliptical = bool(_ELLIPSIS.match(user_query))
+    content = [w.lower() for w in words if w.lower() not in _STOPWORDS]
+    specific = sum(1 for w in content if idf(w) > 0.0)
+    if not refs and not elliptical and specific >= 2:
+        return user_query, 1.0
 
-    uq = (user_query or "").strip()
-    if not history or not uq:
-        return uq
+    phrases = extract_keyphrases(turns, idf, exclude={w.lower() for w in words})
+    if not phrases:
+        # nothing to resolve against: fine for a question that merely looks
+        # short, hopeless for one that points back
+        return user_query, 0.0 if refs or elliptical else 0.7
 
-    # --- Rule-based coreference fallback for short pronoun questions ---
-    # Example: "why is it important" → "why is self-attention important"
-    tokens = [t.strip("?.!,").lower() for t in uq.split()]
-    if any(t in PRONOUNS for t in tokens) and len(tokens) <= 6:
-        topic = _last_user_topic(history[:-1])  # exclude current question
-        if topic:
-            # Build a better standalone query without overthinking
-            return f"{uq} (referring to: {topic})"
-
-    # --- LLM rewriter (more precise) ---
-    if not GROQ_API_KEY:
-        return uq
+    top, top_score, top_turn = phrases[0]
+    rival = next((s for _, s, t in phrases[1:] if t != top_turn), 0.0)
+    confidence = top_score / (top_score + rival)
+    if len({words[i].lower() for i in refs} - DEMONSTRATIVES) > 1:
+        confidence *= 0.6  # "compare it with them": two referents, one keyphrase
+    if not refs and not elliptical:
+        confidence *= 0.8
 
-    llm = ChatGroq(
-        groq_api_key=GROQ_API_KEY,
-        model_name=GROQ_MODEL,
-        temperature=0.0,
-    )
+    # same-turn companions add context ("high-risk systems" next to "EU AI Act")
+    extra = [p for p, s, t in phrases[1:] if t == top_turn and s >= 0.5 * top_score][:1]
+    sub = refs[0] if refs else None
+    if sub is not None:
+        target = words[sub]
+        replacement = f"{top}'s" if target.lower() in POSSESSIVES else top
+        rewritten = re.sub(rf"\b{re.escape(target)}\b", replacement, user_query, count=1)
+        if extra:
+            rewritten = f"{rewritten} ({', '.join(extra)})"
+    else:
+        rewritten = f"{user_query} ({', '.join([top] + extra)})"
+    return rewritten, round(confidence, 3)
+
+# ---------- LLM tier ----------
+class _RewriteMemo:
+    """LRU of LLM rewrites keyed by (history fingerprint, query)."""
+
+    def __init__(self, size: int = REWRITE_CACHE_SIZE):
+        self.size = size
+        self._data: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
 
-    # Keep only the last few turns to prevent noise
-    recent = history[-8:]
-    transcript = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in recent if m.get("content")])
+    def get(self, key: Tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Tuple[str, str], value: str) -> None:
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+_memo = _RewriteMemo()
+
+def history_fingerprint(turns: List[Dict[str, str]]) -> str:
+    payload = json.dumps([[m.get("role"), m.get("content")] for m in turns], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _llm_rewrite(user_query: str, turns: List[Dict[str, str]], llm: Any) -> str:
+    transcript = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in turns])
 
     system = (
         "Rewrite the user's latest message into a SINGLE standalone retrieval query.\n"
@@ -63,14 +224,78 @@ def rewrite_query(user_query: str, history: List[Dict[str, str]]) -> str:
 
     user = (
         f"Conversation:\n{transcript}\n\n"
-        f"Latest user message:\n{uq}\n\n"
+        f"Latest user message:\n{user_query}\n\n"
         "Standalone retrieval query:"
     )
 
-    resp = llm.invoke([{"role": "system", "content": system}, {"role": "user", "content": user}])
-    rewritten = (resp.content or "").strip()
+    tracer.incr("rewrite_llm_calls")
+    with tracer.span("rewrite_llm"):
+        resp = llm.invoke([{"role": "system", "content": system}, {"role": "user", "content": user}])
+    return (resp.content or "").strip()
+
+# ---------- Stats ----------
+_stats_lock = threading.Lock()
+_stats = {"queries": 0, "standalone": 0, "local": 0, "llm": 0, "llm_memo_hits": 0, "llm_unavailable": 0}
+
+def _count(outcome: str) -> None:
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats[outcome] += 1
+    tracer.incr("rewrite_" + outcome)
+
+def rewrite_stats() -> Dict[str, Any]:
+    """Follow-up rewrites by tier since start; llm_share = LLM round-trips / follow-ups."""
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["llm_share"] = round(out["llm"] / out["queries"], 4) if out["queries"] else 0.0
+    return out
+
+# ---------- Entry point ----------
+def rewrite_query(
+    user_query: str,
+    history: List[Dict[str, str]],
+    llm: Optional[Any] = None,
+    vocabulary: Optional[Any] = None,
+    llm_threshold: float = REWRITE_LLM_THRESHOLD,
+) -> str:
+    """
+    Converts a follow-up question into a standalone search query using chat history.
+    Retrieval uses this rewritten query; generation uses original user question.
+
+    Tier 1 resolves references locally from keyphrases of recent turns, scored
+    against `vocabulary` (a BM25Index; None = plain word counts). Only below
+    llm_threshold confidence is the LLM asked, and its rewrites are memoized per
+    (history, query).
+    """
+    uq = (user_query or "").strip()
+    turns = _prior_turns(uq, history or [])
+    if not turns or not uq:
+        return uq
+
+    with tracer.span("rewrite_local") as sp:
+        local, confidence = local_rewrite(uq, turns, _idf_fn(vocabulary))
+        sp.set("confidence", confidence)
+    if confidence >= llm_threshold:
+        _count("standalone" if local == uq else "local")
+        return local
+
+    key = (history_fingerprint(turns), uq)
+    cached = _memo.get(key)
+    if cached is not None:
+        _count("llm_memo_hits")
+        return cached
+
+    if llm is None:
+        if not llm_available():
+            _count("llm_unavailable")
+            return local  # best effort
+        llm = get_chat_model(temperature=0.0)
+
+    _count("llm")
+    rewritten = _llm_rewrite(uq, turns, llm)
 
     # Safety fallback
     if not rewritten or len(rewritten) > 300:
-        return uq
+        return local
+    _memo.put(key, rewritten)
     return rewritten
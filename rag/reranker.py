@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from sentence_transformers import CrossEncoder
+
+from config.settings import RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_CACHE_SIZE
+
+class CrossEncoderReranker:
+    """
+    Re-scores retrieved chunks with a small CPU cross-encoder and keeps the best K.
+
+    - (query, chunk) scores are memoized in a bounded LRU, so repeated questions
+      only pay for chunks they have not seen with that query.
+    - With a deadline, the candidate count is capped by what the measured
+      per-pair cost allows, and scoring stops between batches once the deadline
+      passes. Candidates are taken in retrieval order, so what goes unscored is
+      the tail retrieval already ranked lowest; it still fills the result up to
+      top_k, after the scored chunks and in retrieval order.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE, cache_size: int = RERANK_CACHE_SIZE, model=None):
+        # model: anything with CrossEncoder.predict's signature (default: load model_name)
+        self.model = model if model is not None else CrossEncoder(model_name, max_length=512)
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sec_per_pair: Optional[float] = None  # EMA of measured scoring cost
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _key(query: str, doc: Dict[str, Any]) -> str:
+        chunk = doc.get("id") or doc["text"]
+        return hashlib.sha1(f"{query}\x00{chunk}".encode("utf-8")).hexdigest()
+
+    def _affordable(self, deadline: Optional[float]) -> Optional[int]:
+        if deadline is None or self._sec_per_pair is None:
+            return None
+        remaining = deadline - time.perf_counter()
+        return max(0, int(remaining / self._sec_per_pair))
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_k: int, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        if not docs:
+            return docs
+
+        keys = [self._key(query, d) for d in docs]
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for i, k in enumerate(keys):
+                if k in self._cache:
+                    self._cache.move_to_end(k)
+                    scores[i] = self._cache[k]
+        self.cache_hits += len(scores)
+
+        todo = [i for i in range(len(docs)) if i not in scores]
+        budget = self._affordable(deadline)
+        if budget is not None:
+            todo = todo[:budget]
+
+        for s in range(0, len(todo), self.batch_size):
+            if deadline is not None and s > 0 and time.perf_counter() >= deadline:
+                break
+            batch = todo[s:s + self.batch_size]
+            t0 = time.perf_counter()
+            preds = self.model.predict([(query, docs[i]["text"]) for i in batch], batch_size=self.batch_size, show_progress_bar=False)
+            per_pair = (time.perf_counter() - t0) / len(batch)
+            self._sec_per_pair = per_pair if self._sec_per_pair is None else 0.8 * self._sec_per_pair + 0.2 * per_pair
+            self.cache_misses += len(batch)
+
+            with self._lock:
+                for i, p in zip(batch, preds):
+                    scores[i] = float(p)
+                    self._cache[keys[i]] = float(p)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if not scores:
+            # no time to score anything: fall back to retrieval order
+            return docs[:top_k]
+
+        # a budget overrun degrades the ranking, not the amount of context:
+        # unscored candidates follow the scored ones in retrieval order
+        best = sorted(scores, key=scores.get, reverse=True)
+        best += [i for i in range(len(docs)) if i not in scores]
+        out = []
+        for r, i in enumerate(best[:top_k], start=1):
+            d = dict(docs[i])
+            d["retrieval_rank"] = d.get("rank")
+            d["rank"] = r
+            d["rerank_score"] = scores.get(i)
+            out.append(d)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.cache_hits + self.cache_misses
+        return {
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "hit_rate": (self.cache_hits / total) if total else 0.0,
+            "ms_per_pair": (self._sec_per_pair * 1000.0) if self._sec_per_pair else None,
+        }
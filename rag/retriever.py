@@ -1,32 +1,274 @@
-from typing import List, Dict, Any
+import math
+from typing import List, Dict, Any, Optional
+import numpy as np
 
-def retrieve(collection, query: str, top_k: int) -> List[Dict[str, Any]]:
-    res = collection.query(
-        query_texts=[query],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"]
-    )
+from config.settings import FILTER_PREFILTER_MAX_ROWS, FILTER_PREFILTER_MAX_FRACTION
+from rag.context_packer import location
+from rag.tracing import tracer
+from vector_store.metadata_index import Selection
 
+RETRIEVAL_MODES = ("dense", "hybrid")
+
+def _docs_from_result(res: Dict[str, Any], q: int) -> List[Dict[str, Any]]:
     docs: List[Dict[str, Any]] = []
-    for i in range(len(res["documents"][0])):
+    for i in range(len(res["documents"][q])):
         docs.append({
-            "text": res["documents"][0][i],
-            "metadata": res["metadatas"][0][i] or {},
-            "distance": res["distances"][0][i],
+            "id": res["ids"][q][i],
+            "text": res["documents"][q][i],
+            "metadata": res["metadatas"][q][i] or {},
+            "distance": res["distances"][q][i],
             "rank": i + 1
         })
     return docs
 
+def retrieve_batch(collection, queries: List[str], top_k: int, query_embeddings: Optional[np.ndarray] = None) -> List[List[Dict[str, Any]]]:
+    """One multi-query vector search; returns one ranked list per query."""
+    if not queries:
+        return []
+    # precomputed (n, dim) float32 embeddings skip Chroma's list-based embedding call
+    if query_embeddings is not None:
+        target = {"query_embeddings": query_embeddings}
+    else:
+        target = {"query_texts": list(queries)}
+    with tracer.span("vector_query", n_results=top_k, queries=len(queries)):
+        res = collection.query(
+            **target,
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"]
+        )
+    return [_docs_from_result(res, q) for q in range(len(queries))]
+
+def retrieve(collection, query: str, top_k: int, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    return retrieve_batch(collection, [query], top_k, query_embeddings=query_embedding)[0]
+
+def prefiltered_retrieve_batch(collection, selection: Selection, queries: List[str], top_k: int, query_embeddings: np.ndarray) -> List[List[Dict[str, Any]]]:
+    """
+    Exact search among the selected chunks only: their stored embeddings are
+    fetched by ID and scored in one matrix product, then the winners' texts
+    are fetched in one more call. Cost follows the selection, not the corpus.
+    """
+    if not selection.ids:
+        return [[] for _ in queries]
+    with tracer.span("prefilter_search", candidates=len(selection.ids), queries=len(queries)):
+        got = collection.get(ids=selection.ids, include=["embeddings"])
+        ids = got["ids"]
+        vecs = np.asarray(got["embeddings"], dtype=np.float32).reshape(len(ids), -1)
+        q = np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1)
+        # squared L2, same as Chroma's default space
+        dists = np.maximum(
+            np.einsum("ij,ij->i", vecs, vecs)[None, :] - 2.0 * (q @ vecs.T) + np.einsum("ij,ij->i", q, q)[:, None],
+            0.0,
+        )
+        k = min(top_k, len(ids))
+        tops = []
+        for row in dists:
+            top = np.argpartition(row, k - 1)[:k] if len(row) > k else np.arange(len(row))
+            tops.append(top[np.argsort(row[top], kind="stable")])
+
+        wanted = sorted({ids[i] for top in tops for i in top})
+        rec = collection.get(ids=wanted, include=["documents", "metadatas"])
+        by_id = {cid: (rec["documents"][j], rec["metadatas"][j] or {}) for j, cid in enumerate(rec["ids"])}
+
+    out = []
+    for row, top in zip(dists, tops):
+        docs = []
+        for i in top:
+            text, metadata = by_id.get(ids[i], (None, None))
+            if text is None:
+                continue  # deleted since the metadata index was built
+            docs.append({"id": ids[i], "text": text, "metadata": metadata, "distance": float(row[i]), "rank": len(docs) + 1})
+        out.append(docs)
+    return out
+
+def filtered_retrieve_batch(
+    collection,
+    selection: Selection,
+    queries: List[str],
+    top_k: int,
+    query_embeddings: np.ndarray,
+    prefilter_max_rows: int = FILTER_PREFILTER_MAX_ROWS,
+    prefilter_max_fraction: float = FILTER_PREFILTER_MAX_FRACTION,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Dense search restricted to a metadata selection. Selective filters (at most
+    prefilter_max_rows chunks and prefilter_max_fraction of the collection, or
+    fewer chunks than the over-fetch would return) are searched exactly among
+    the matching chunks. Broad ones over-fetch from the full index, about 2x
+    top_k / matching fraction, and drop non-matching hits; queries left with
+    fewer than top_k hits retry with a 4x larger over-fetch, or the exact search
+    when the selection is small enough for it.
+    """
+    n = len(selection.ids)
+    fetch = min(selection.total, math.ceil(2 * top_k / max(selection.fraction, 1e-9)))
+    small = n <= prefilter_max_rows
+    # scoring the matching chunks directly is cheaper than over-fetching more than them
+    if small and (selection.fraction <= prefilter_max_fraction or fetch >= n):
+        return prefiltered_retrieve_batch(collection, selection, queries, top_k, query_embeddings)
+
+    allowed = set(selection.ids)
+    q = np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1)
+    out: List[List[Dict[str, Any]]] = [[] for _ in queries]
+    pending = list(range(len(queries)))
+    while pending:
+        short = []
+        with tracer.span("postfilter_search", fetch_k=fetch, matching=n, queries=len(pending)):
+            results = retrieve_batch(collection, [queries[i] for i in pending], fetch, query_embeddings=q[pending])
+        for i, docs in zip(pending, results):
+            out[i] = [dict(d, rank=r) for r, d in enumerate((d for d in docs if d["id"] in allowed), start=1)][:top_k]
+            if len(out[i]) < min(top_k, n):
+                short.append(i)
+        if not short or fetch >= selection.total:
+            break
+        if small:
+            exact = prefiltered_retrieve_batch(collection, selection, [queries[i] for i in short], top_k, q[short])
+            for i, docs in zip(short, exact):
+                out[i] = docs
+            break
+        pending, fetch = short, min(selection.total, fetch * 4)
+    return out
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for r, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + r)
+    return scores
+
+def merge_results(result_lists: List[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """RRF-merge several ranked result lists (e.g. raw + rewritten query), deduped by chunk id."""
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for docs in result_lists:
+        for d in docs:
+            key = d.get("id") or d["text"]
+            prev = by_id.get(key)
+            # keep the copy with the smaller distance
+            if prev is None or (d.get("distance") is not None and (prev.get("distance") is None or d["distance"] < prev["distance"])):
+                by_id[key] = d
+    fused = reciprocal_rank_fusion([[d.get("id") or d["text"] for d in docs] for docs in result_lists])
+    out = []
+    for key in sorted(fused, key=fused.get, reverse=True)[:top_k]:
+        d = dict(by_id[key])
+        d["rank"] = len(out) + 1
+        out.append(d)
+    return out
+
+def merge_by_score(result_lists: List[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Merges the results of separate collections: by rrf_score when every doc has
+    one (hybrid search; rank-based, so comparable across collections), else by
+    distance (same embedding model everywhere). Ties go to the smaller distance;
+    docs without one go last.
+    """
+    docs = [d for lst in result_lists for d in lst]
+    by_rrf = bool(docs) and all(d.get("rrf_score") is not None for d in docs)
+    docs.sort(key=lambda d: (-d["rrf_score"] if by_rrf else 0.0, d.get("distance") is None, d.get("distance") or 0.0))
+    out = []
+    for d in docs[:top_k]:
+        d = dict(d)
+        d["rank"] = len(out) + 1
+        out.append(d)
+    return out
+
+def hybrid_retrieve_batch(
+    collection,
+    bm25,
+    queries: List[str],
+    top_k: int,
+    query_embeddings: Optional[np.ndarray] = None,
+    fetch_k: Optional[int] = None,
+    selection: Optional[Selection] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Dense + BM25 candidates fused with reciprocal rank fusion, for many queries:
+    one multi-query vector search and one fetch for all sparse-only hits.
+    Their distance is computed from the stored embedding when the query
+    embeddings are known. With a metadata selection both sides only return
+    selected chunks (the dense side needs query_embeddings then).
+    """
+    fetch_k = fetch_k or max(top_k * 4, 20)
+    if selection is not None:
+        dense_lists = filtered_retrieve_batch(collection, selection, queries, fetch_k, query_embeddings)
+        allowed = bm25.mask(selection.ids)
+    else:
+        dense_lists = retrieve_batch(collection, queries, top_k=fetch_k, query_embeddings=query_embeddings)
+        allowed = None
+
+    fused_lists, best_lists = [], []
+    missing = set()
+    for dense, query in zip(dense_lists, queries):
+        with tracer.span("bm25_search"):
+            sparse = bm25.search(query, top_n=fetch_k, allowed=allowed)
+        fused = reciprocal_rank_fusion([[d["id"] for d in dense], [doc_id for doc_id, _ in sparse]])
+        best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+        fused_lists.append(fused)
+        best_lists.append(best)
+        dense_ids = {d["id"] for d in dense}
+        missing.update(doc_id for doc_id in best if doc_id not in dense_ids)
+
+    # sparse-only hits of every query in one fetch
+    missing = sorted(missing)
+    by_id: Dict[str, Dict[str, Any]] = {}
+    stored: Dict[str, np.ndarray] = {}
+    if missing:
+        include = ["documents", "metadatas"] + (["embeddings"] if query_embeddings is not None else [])
+        with tracer.span("fetch_sparse_hits", n=len(missing)):
+            got = collection.get(ids=missing, include=include)
+        for j, doc_id in enumerate(got["ids"]):
+            by_id[doc_id] = {
+                "id": doc_id,
+                "text": got["documents"][j],
+                "metadata": got["metadatas"][j] or {},
+                "distance": None,
+            }
+            if query_embeddings is not None:
+                stored[doc_id] = np.asarray(got["embeddings"][j], dtype=np.float32)
+
+    out: List[List[Dict[str, Any]]] = []
+    for q, (dense, fused, best) in enumerate(zip(dense_lists, fused_lists, best_lists)):
+        dense_by_id = {d["id"]: d for d in dense}
+        docs: List[Dict[str, Any]] = []
+        for doc_id in best:
+            src = dense_by_id.get(doc_id) or by_id.get(doc_id)
+            if src is None:
+                continue  # sparse index is stale for this id
+            d = dict(src)
+            if doc_id not in dense_by_id:
+                d["distance"] = None
+                if doc_id in stored:
+                    diff = stored[doc_id] - query_embeddings[q]
+                    d["distance"] = float(diff @ diff)  # squared L2, same as Chroma's default space
+            d["rank"] = len(docs) + 1
+            d["rrf_score"] = fused[doc_id]
+            docs.append(d)
+        out.append(docs)
+    return out
+
+def hybrid_retrieve(
+    collection,
+    bm25,
+    query: str,
+    top_k: int,
+    query_embedding: Optional[np.ndarray] = None,
+    fetch_k: Optional[int] = None,
+    selection: Optional[Selection] = None,
+) -> List[Dict[str, Any]]:
+    return hybrid_retrieve_batch(collection, bm25, [query], top_k, query_embeddings=query_embedding, fetch_k=fetch_k, selection=selection)[0]
+
 def to_sources(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     out = []
     for d in docs:
         md = d["metadata"]
         preview = d["text"]
-        out.append({
+        src = {
             "rank": d["rank"],
+            "chunk_id": d.get("id"),
             "source_file": md.get("source_file", "unknown"),
             "page": md.get("page", None),
-            "distance": float(d["distance"]),
+            "location": location(md, " "),  # "page 3", or "sheet Budget, cells B2:F40"
+            "distance": float(d["distance"]) if d.get("distance") is not None else None,
             "text_preview": (preview[:350] + "...") if len(preview) > 350 else preview
-        })
+        }
+        if d.get("collection"):
+            src["collection"] = d["collection"]
+        out.append(src)
     return out
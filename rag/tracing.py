@@ -0,0 +1,332 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+from config.settings import TRACE_ENABLED, TRACE_DIR, TRACE_MAX_BYTES, TRACE_KEEP_FILES, TRACE_QUEUE_SIZE
+
+# latency histogram buckets (seconds) for the Prometheus export
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("rag_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("rag_span", default=None)
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English with Llama-style tokenizers
+    return max(1, len(text or "") // 4)
+
+class _NoopSpan:
+    """Returned whenever tracing is off: entering/leaving/setting costs a method call."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Span:
+    __slots__ = ("trace", "name", "attrs", "parent", "start", "duration", "_token")
+
+    def __init__(self, trace: "Trace", name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent = parent.name if parent is not None else None
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            pass  # generator closed from another context
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.add(self)
+        return False
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+class Trace:
+    """One request: a flat list of spans (with parent names) plus counters."""
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.spans: List[Span] = []
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.start = 0.0
+        self.duration = 0.0
+        self.started_at = 0.0
+
+    def __enter__(self):
+        self._token = _current_trace.set(self)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        try:
+            _current_trace.reset(self._token)
+        except ValueError:
+            pass  # generator closed from another context
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def incr(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000.0, 3),
+            "attrs": self.attrs,
+            "counters": self.counters,
+            "spans": [
+                {
+                    "name": s.name,
+                    "parent": s.parent,
+                    "offset_ms": round((s.start - self.start) * 1000.0, 3),
+                    "duration_ms": round(s.duration * 1000.0, 3),
+                    **({"attrs": s.attrs} if s.attrs else {}),
+                }
+                for s in sorted(self.spans, key=lambda s: s.start)
+            ],
+        }
+
+class Tracer:
+    """
+    Lightweight per-request tracing.
+
+      with tracer.trace("answer", top_k=4) as tr:
+          with tracer.span("generate") as sp:
+              sp.set("prompt_tokens", 812)
+          tracer.incr("answer_cache_hit")
+
+    Finished traces are aggregated in memory into Prometheus histograms (the
+    only work under the lock) and queued; a background thread appends them to
+    <dir>/traces.jsonl with buffered writes, rotates the file past max_bytes,
+    and rewrites <dir>/metrics.prom at most once per flush_interval_s. No
+    request waits on disk I/O. When disabled, trace()/span() return a shared
+    no-op object.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TRACE_ENABLED,
+        trace_dir: str = TRACE_DIR,
+        flush_interval_s: float = 1.0,
+        max_bytes: int = TRACE_MAX_BYTES,
+        keep_files: int = TRACE_KEEP_FILES,
+        queue_size: int = TRACE_QUEUE_SIZE,
+    ):
+        self.enabled = enabled
+        self.trace_dir = trace_dir
+        self.flush_interval_s = flush_interval_s
+        self.max_bytes = max_bytes
+        self.keep_files = max(0, keep_files)
+        self._last: Optional[Trace] = None
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._hist: Dict[str, List[float]] = {}   # stage -> bucket counts + [sum, count]
+        self._counters: Dict[str, float] = {}
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+
+    def trace(self, name: str, **attrs: Any):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Trace(self, name, attrs)
+
+    def span(self, name: str, **attrs: Any):
+        if not self.enabled:
+            return NOOP_SPAN
+        trace = _current_trace.get()
+        if trace is None:
+            return NOOP_SPAN
+        return Span(trace, name, attrs)
+
+    def incr(self, name: str, n: float = 1) -> None:
+        if not self.enabled:
+            return
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.incr(name, n)
+
+    def current(self) -> Optional[Trace]:
+        return _current_trace.get() if self.enabled else None
+
+    @property
+    def last(self) -> Optional[Dict[str, Any]]:
+        """The most recently finished trace."""
+        trace = self._last
+        return trace.to_dict() if trace is not None else None
+
+    # ---------- Export ----------
+    def _observe(self, stage: str, seconds: float) -> None:
+        h = self._hist.get(stage)
+        if h is None:
+            h = self._hist[stage] = [0.0] * (len(BUCKETS) + 2)
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+    def _finish(self, trace: Trace) -> None:
+        with self._lock:
+            self._last = trace
+            self._observe(trace.name, trace.duration)
+            for s in trace.spans:
+                self._observe(s.name, s.duration)
+            for k, v in trace.counters.items():
+                self._counters[k] = self._counters.get(k, 0) + v
+        # serialised by the writer thread (the trace is finished and no longer mutated)
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    # ---------- Background writer ----------
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        path = os.path.join(self.trace_dir, "traces.jsonl")
+        f = None
+        size = 0
+        last_prom = 0.0
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval_s)
+            except queue.Empty:
+                item = None
+            # drain whatever else is queued into the same buffered write
+            batch = [item] if item is not None else []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for trace in batch:
+                    if f is None:
+                        os.makedirs(self.trace_dir, exist_ok=True)
+                        f = open(path, "a", encoding="utf-8", buffering=1 << 16)
+                        size = f.tell()
+                    line = json.dumps(trace.to_dict(), default=str) + "\n"
+                    f.write(line)
+                    size += len(line)
+                    if self.max_bytes > 0 and size >= self.max_bytes:
+                        f.close()
+                        f = None
+                        self._rotate(path)
+                if f is not None and batch:
+                    f.flush()
+                now = time.monotonic()
+                if self._hist and now - last_prom >= self.flush_interval_s:
+                    self._write_prometheus()
+                    last_prom = now
+            except OSError:
+                pass  # full / read-only disk: tracing must not take the process down
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _rotate(self, path: str) -> None:
+        # traces.jsonl -> .1 -> .2 ... ; the oldest beyond keep_files is removed
+        if self.keep_files == 0:
+            os.remove(path)
+            return
+        oldest = f"{path}.{self.keep_files}"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for i in range(self.keep_files - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        os.replace(path, f"{path}.1")
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            hist = {stage: list(h) for stage, h in self._hist.items()}
+            counters = dict(self._counters)
+        lines = [
+            "# HELP rag_stage_seconds Latency of RAG pipeline stages.",
+            "# TYPE rag_stage_seconds histogram",
+        ]
+        for stage, h in sorted(hist.items()):
+            for i, le in enumerate(BUCKETS):
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {int(h[i])}')
+            lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {int(h[-1])}')
+            lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {h[-2]:.6f}')
+            lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {int(h[-1])}')
+        lines.append("# HELP rag_events_total Counters recorded by traces (tokens, chunks, cache hits).")
+        lines.append("# TYPE rag_events_total counter")
+        for name, v in sorted(counters.items()):
+            lines.append(f'rag_events_total{{name="{name}"}} {v:g}')
+        return "\n".join(lines) + "\n"
+
+    def _write_prometheus(self) -> None:
+        path = os.path.join(self.trace_dir, "metrics.prom")
+        tmp = f"{path}.{threading.get_ident()}.tmp"  # the writer thread and flush() may both write
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def flush(self) -> None:
+        """Waits until every queued trace is on disk, then rewrites metrics.prom."""
+        if not self.enabled:
+            return
+        if self._writer is not None:
+            self._queue.join()
+        if self._hist:
+            try:
+                self._write_prometheus()
+            except OSError:
+                pass
+
+tracer = Tracer()
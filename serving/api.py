@@ -0,0 +1,202 @@
+"""
+Headless HTTP entry point: one warmed-up engine shared by every request.
+
+  PYTHONPATH=. python -m serving.api --port 8000 [--persist-dir chroma_db]
+  PYTHONPATH=. uvicorn serving.api:app --port 8000      (one process; the engine is per process)
+
+  POST /query         {"query": ..., "top_k", "mode", "rerank", "history", "collection", "filters"} -> answer()
+  POST /query/stream  same body; newline-delimited JSON: token events, then the sources event
+  GET  /health        200 once the index is ready, with pool / batcher stats
+  GET  /metrics       Prometheus text: queue depth, in-flight, shed requests, stage latencies
+
+Requests run on a bounded worker pool (SERVE_WORKERS); past SERVE_MAX_QUEUE
+waiting requests the server answers 503 with Retry-After instead of queueing.
+Query embeddings of concurrent requests are encoded in micro-batches.
+"""
+import argparse
+import asyncio
+import json
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Union
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from config.settings import CHROMA_DIR, TOP_K, RETRIEVAL_MODE, RERANK, SERVE_BATCH_WINDOW_MS
+from rag.engine import RAGEngine
+from rag.pipeline import answer, answer_stream, set_engine
+from rag.retriever import RETRIEVAL_MODES
+from rag.tracing import tracer
+from serving.batching import MicroBatchingEmbedder
+from serving.pool import Overloaded, WorkerPool
+from vector_store.embeddings import get_embedding_function
+from vector_store.index_meta import index_ready
+
+class QueryRequest(BaseModel):
+    query: str = Field(min_length=1, max_length=4000)
+    top_k: int = Field(default=TOP_K, ge=1, le=50)
+    mode: str = RETRIEVAL_MODE
+    rerank: bool = RERANK
+    history: Optional[List[Dict[str, str]]] = None
+    collection: Union[str, List[str], None] = None
+    # source_file, doc_type, page_range, ingested_after, ingested_before
+    filters: Optional[Dict[str, Any]] = None
+
+    def kwargs(self) -> Dict[str, Any]:
+        return {
+            "top_k": self.top_k, "history": self.history, "mode": self.mode, "rerank": self.rerank,
+            "collection": self.collection, "filters": self.filters,
+        }
+
+def _error(status: int, detail: str) -> JSONResponse:
+    headers = {"Retry-After": "1"} if status == 503 else None
+    return JSONResponse({"detail": detail}, status_code=status, headers=headers)
+
+def _check(req: QueryRequest) -> Optional[JSONResponse]:
+    if req.mode not in RETRIEVAL_MODES:
+        return _error(422, f"mode must be one of {', '.join(RETRIEVAL_MODES)}")
+    return None
+
+def create_app(engine: Optional[RAGEngine] = None, pool: Optional[WorkerPool] = None, persist_dir: str = CHROMA_DIR) -> FastAPI:
+    """App factory; engine / pool default to ones built from config.settings at startup."""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        batcher = None
+        eng = engine
+        if eng is None:
+            embedding_fn = get_embedding_function()
+            if SERVE_BATCH_WINDOW_MS > 0:
+                embedding_fn = batcher = MicroBatchingEmbedder(embedding_fn)
+            eng = RAGEngine(persist_dir=persist_dir, embedding_fn=embedding_fn)
+        set_engine(eng)  # rag.pipeline.answer() / answer_stream() now use it
+        app.state.engine = eng
+        app.state.batcher = batcher
+        app.state.pool = pool or WorkerPool()
+        await asyncio.to_thread(eng.warm_up)
+        try:
+            yield
+        finally:
+            app.state.pool.shutdown()
+            eng.close()
+            if batcher is not None:
+                batcher.close()
+
+    app = FastAPI(title="CeADAR RAG", lifespan=lifespan)
+
+    @app.post("/query")
+    async def query(req: QueryRequest):
+        invalid = _check(req)
+        if invalid is not None:
+            return invalid
+        try:
+            return await app.state.pool.run(answer, req.query, **req.kwargs())
+        except Overloaded as e:
+            return _error(503, f"Overloaded: {e}")
+        except ValueError as e:  # e.g. unknown collection, malformed filters
+            return _error(400, str(e))
+
+    @app.post("/query/stream")
+    async def query_stream(req: QueryRequest):
+        invalid = _check(req)
+        if invalid is not None:
+            return invalid
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        disconnected = threading.Event()
+
+        def produce() -> None:
+            stream = answer_stream(req.query, **req.kwargs())
+            try:
+                for event in stream:
+                    if disconnected.is_set():
+                        break  # client went away: stop generating
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            finally:
+                stream.close()
+
+        def finished(fut) -> None:
+            # runs on the loop after every event the worker queued; a failure
+            # is passed on as the exception itself, then None ends the stream
+            exc = None if fut.cancelled() else fut.exception()
+            if exc is not None:
+                events.put_nowait(exc)
+            events.put_nowait(None)
+
+        try:
+            fut = app.state.pool.start(produce)
+        except Overloaded as e:
+            return _error(503, f"Overloaded: {e}")
+        fut.add_done_callback(finished)
+
+        # wait for the first event so shedding / bad requests still get a status code
+        first = await events.get()
+        if isinstance(first, Overloaded):
+            return _error(503, f"Overloaded: {first}")
+        if isinstance(first, ValueError):
+            return _error(400, str(first))
+
+        async def body():
+            event = first
+            try:
+                while event is not None:
+                    if isinstance(event, BaseException):
+                        event = {"type": "error", "error": f"{type(event).__name__}: {event}"}
+                    yield json.dumps(event, default=str) + "\n"
+                    event = await events.get()
+            finally:
+                disconnected.set()
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    @app.get("/health")
+    async def health():
+        eng: RAGEngine = app.state.engine
+        ready = index_ready(eng.index_root)
+        out = {
+            "status": "ok" if ready else "no_index",
+            "index_version": eng.collections.get(eng.collection_name).index_version() if ready else None,
+            "collections": eng.list_collections(),
+            "pool": app.state.pool.stats(),
+        }
+        if app.state.batcher is not None:
+            out["embedding_batcher"] = app.state.batcher.stats()
+        return JSONResponse(out, status_code=200 if ready else 503)
+
+    @app.get("/metrics")
+    async def metrics():
+        text = app.state.pool.prometheus_text()
+        batcher = app.state.batcher
+        if batcher is not None:
+            s = batcher.stats()
+            text += (
+                "# HELP rag_embed_batches_total Query embedding calls made by the micro-batcher.\n"
+                "# TYPE rag_embed_batches_total counter\n"
+                f"rag_embed_batches_total {s['batches']}\n"
+                "# HELP rag_embed_batched_requests_total Encode requests served by those calls.\n"
+                "# TYPE rag_embed_batched_requests_total counter\n"
+                f"rag_embed_batched_requests_total {s['requests']}\n"
+            )
+        if tracer.enabled:
+            text += tracer.prometheus_text()
+        return PlainTextResponse(text)
+
+    return app
+
+app = create_app()
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the RAG pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--persist-dir", default=CHROMA_DIR, help="index root to serve")
+    args = parser.parse_args()
+    served = app if args.persist_dir == CHROMA_DIR else create_app(persist_dir=args.persist_dir)
+    uvicorn.run(served, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
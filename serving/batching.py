@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from config.settings import SERVE_BATCH_WINDOW_MS, SERVE_MAX_BATCH
+from vector_store.chroma_store import embed_texts
+
+class MicroBatchingEmbedder:
+    """
+    Wraps an embedding function so that concurrent encode() calls from
+    different request threads share one model call. The first caller opens a
+    window of window_ms; everything submitted until it closes (or until
+    max_batch texts are waiting) is encoded together and handed back per caller.
+
+    Drop-in for the wrapped function: the engine, Chroma and close() see the
+    same encode() / __call__ / cache surface.
+    """
+
+    def __init__(self, inner: Any, window_ms: float = SERVE_BATCH_WINDOW_MS, max_batch: int = SERVE_MAX_BATCH):
+        self.inner = inner
+        self.window_s = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[List[str], Future]] = []
+        self._pending_texts = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.max_seen = 0
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name: str):
+        # model_name, cache_key, cache, ... of the wrapped function
+        return getattr(self.inner, name)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return embed_texts(self.inner, texts)
+        fut: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("embedding batcher is closed")
+            self._pending.append((list(texts), fut))
+            self._pending_texts += len(texts)
+            self._cond.notify()
+        return fut.result()
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.encode(input).tolist()
+
+    def _take(self) -> List[Tuple[List[str], Future]]:
+        # called with the lock held: whole requests, at least one, up to max_batch texts
+        batch, n = [], 0
+        while self._pending and (not batch or n + len(self._pending[0][0]) <= self.max_batch):
+            texts, fut = self._pending.pop(0)
+            batch.append((texts, fut))
+            n += len(texts)
+        self._pending_texts -= n
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.window_s
+                while self._pending_texts < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take()
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: List[Tuple[List[str], Future]]) -> None:
+        unique = list(dict.fromkeys(t for texts, _ in batch for t in texts))
+        try:
+            vectors = np.asarray(embed_texts(self.inner, unique), dtype=np.float32)
+        except BaseException as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        row = {t: i for i, t in enumerate(unique)}
+        for texts, fut in batch:
+            fut.set_result(vectors[[row[t] for t in texts]])
+        self.batches += 1
+        self.requests += len(batch)
+        self.texts += len(unique)
+        self.max_seen = max(self.max_seen, len(batch))
+
+    def close(self) -> None:
+        """Encodes what is still waiting, then stops the batching thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "mean_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "max_requests_per_batch": self.max_seen,
+            "window_ms": self.window_s * 1000.0,
+        }
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from config.settings import SERVE_WORKERS, SERVE_MAX_QUEUE, SERVE_QUEUE_TIMEOUT_S
+from rag.tracing import BUCKETS
+
+class Overloaded(Exception):
+    """Request shed: the queue is full, or it waited longer than queue_timeout_s for a worker."""
+
+class WorkerPool:
+    """
+    Bounded thread pool for pipeline calls, with admission control.
+
+    At most `workers` calls run at once, which also caps in-flight LLM calls
+    (each answer makes one at a time). Up to `max_queue` more wait for a
+    worker; past that, start() raises Overloaded at once instead of queueing,
+    and a call that waited longer than queue_timeout_s is dropped before it
+    starts (its client has most likely given up).
+    """
+
+    def __init__(self, workers: int = SERVE_WORKERS, max_queue: int = SERVE_MAX_QUEUE, queue_timeout_s: float = SERVE_QUEUE_TIMEOUT_S):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = queue_timeout_s
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rag-worker")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.max_queued = 0
+        self.counters = {"admitted": 0, "completed": 0, "failed": 0, "shed_queue_full": 0, "shed_queue_timeout": 0}
+        self._hist: Dict[str, list] = {}  # "queue_wait" / "run" -> bucket counts + [sum, count]
+
+    def _observe(self, name: str, seconds: float) -> None:
+        h = self._hist.get(name)
+        if h is None:
+            h = self._hist[name] = [0.0] * (len(BUCKETS) + 2)
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+    def _admit(self) -> float:
+        with self._lock:
+            if self.queued + self.in_flight >= self.workers + self.max_queue:
+                self.counters["shed_queue_full"] += 1
+                raise Overloaded(f"{self.queued} requests already waiting")
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            self.counters["admitted"] += 1
+        return time.perf_counter()
+
+    def _wrap(self, fn: Callable[..., Any], submitted: float) -> Callable[..., Any]:
+        def run(*args, **kwargs):
+            waited = time.perf_counter() - submitted
+            with self._lock:
+                self.queued -= 1
+                self._observe("queue_wait", waited)
+                if waited > self.queue_timeout_s:
+                    self.counters["shed_queue_timeout"] += 1
+                    raise Overloaded(f"waited {waited:.1f}s for a worker")
+                self.in_flight += 1
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    self._observe("run", time.perf_counter() - t0)
+                    self.counters["completed" if ok else "failed"] += 1
+        return run
+
+    def start(self, fn: Callable[..., Any], *args, **kwargs) -> "asyncio.Future":
+        """
+        Queues fn(*args, **kwargs) for a worker and returns an awaitable for its
+        result. Raises Overloaded right away when the queue is full; a call shed
+        later for waiting too long raises it from the awaitable.
+        """
+        submitted = self._admit()
+        call = self._wrap(fn, submitted)
+        return asyncio.get_running_loop().run_in_executor(self._executor, lambda: call(*args, **kwargs))
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return await self.start(fn, *args, **kwargs)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "max_queue": self.max_queue,
+                **self.counters,
+            }
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP rag_server_queue_depth Requests admitted and waiting for a worker.",
+                "# TYPE rag_server_queue_depth gauge",
+                f"rag_server_queue_depth {self.queued}",
+                "# HELP rag_server_in_flight Requests running on a worker.",
+                "# TYPE rag_server_in_flight gauge",
+                f"rag_server_in_flight {self.in_flight}",
+                "# HELP rag_server_workers Worker pool size.",
+                "# TYPE rag_server_workers gauge",
+                f"rag_server_workers {self.workers}",
+                "# HELP rag_server_requests_total Requests by outcome.",
+                "# TYPE rag_server_requests_total counter",
+            ]
+            for name, v in sorted(self.counters.items()):
+                lines.append(f'rag_server_requests_total{{outcome="{name}"}} {v}')
+            lines.append("# HELP rag_server_seconds Time waiting for a worker (queue_wait) and running on it (run).")
+            lines.append("# TYPE rag_server_seconds histogram")
+            for name, h in sorted(self._hist.items()):
+                for i, le in enumerate(BUCKETS):
+                    lines.append(f'rag_server_seconds_bucket{{phase="{name}",le="{le}"}} {int(h[i])}')
+                lines.append(f'rag_server_seconds_bucket{{phase="{name}",le="+Inf"}} {int(h[-1])}')
+                lines.append(f'rag_server_seconds_sum{{phase="{name}"}} {h[-2]:.6f}')
+                lines.append(f'rag_server_seconds_count{{phase="{name}"}} {int(h[-1])}')
+        return "\n".join(lines) + "\n"
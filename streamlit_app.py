@@ -1,12 +1,13 @@
 import streamlit as st
-import subprocess
-import os
-import sys
 import json
-from datetime import datetime, timezone
 from pathlib import Path
 
-from rag.pipeline import answer
+from config.settings import RETRIEVAL_MODE, RERANK, COLLECTION_NAME
+from ingestion.background import start_build, current_build
+from rag.pipeline import answer_stream, get_engine
+from rag.retriever import RETRIEVAL_MODES
+from rag.tracing import tracer
+from vector_store.index_meta import index_ready
 
 # Repo root (since this file is in repo root)
 BASE_DIR = Path(__file__).resolve().parent
@@ -15,17 +16,7 @@ INDEX_META_PATH = CHROMA_PATH / "index_meta.json"
 
 # ---------- Helpers ----------
 def index_exists() -> bool:
-    return CHROMA_PATH.exists() and any(CHROMA_PATH.iterdir())
-
-def write_index_meta(success: bool, stdout_text: str = "", stderr_text: str = ""):
-    CHROMA_PATH.mkdir(parents=True, exist_ok=True)
-    meta = {
-        "built_at_utc": datetime.now(timezone.utc).isoformat(),
-        "success": success,
-        "stdout_tail": stdout_text[-2000:] if stdout_text else "",
-        "stderr_tail": stderr_text[-2000:] if stderr_text else "",
-    }
-    INDEX_META_PATH.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return index_ready(str(CHROMA_PATH))
 
 def read_index_meta():
     if INDEX_META_PATH.exists():
@@ -35,15 +26,38 @@ def read_index_meta():
             return None
     return None
 
-def build_index():
-    env = os.environ.copy()
-    return subprocess.run(
-        [sys.executable, "-m", "ingestion.build_index"],
-        capture_output=True,
-        text=True,
-        cwd=str(BASE_DIR),
-        env=env
-    )
+@st.cache_resource(show_spinner="Loading models...")
+def warm_engine():
+    # one warmed-up engine shared by every session of this server process
+    return get_engine().warm_up()
+
+@st.fragment(run_every=1.0)
+def build_status():
+    # builds run in a background process; queries keep using the current index
+    # version until the new one is swapped in
+    job = current_build()
+    if job is None:
+        return
+    if job.running:
+        p = job.progress()
+        text = f"Building index: {p.get('phase', 'starting')}"
+        if p.get("phase") == "indexing":
+            text += f" · {p.get('files_done', 0)}/{p.get('files_to_index', 0)} files · {p.get('committed', 0)} chunks"
+        st.progress(job.fraction(), text=text)
+        return
+
+    if st.session_state.get("build_seen") != job.finished_at_utc:
+        # first poll after the build finished: rerun the page once so status / chat pick it up
+        st.session_state.build_seen = job.finished_at_utc
+        st.rerun()
+    if job.state == "succeeded":
+        st.success(f"Index built in {job.status()['elapsed_s']:.0f}s (version {job.progress().get('index_version', '?')}).")
+        with st.expander("Build logs", expanded=False):
+            st.code(job.stdout)
+    else:
+        st.error("Index build failed. The previous index is still being served.")
+        with st.expander("Error logs", expanded=True):
+            st.code(job.stderr)
 
 # ---------- Page ----------
 st.set_page_config(page_title="CeADAR RAG", layout="wide")
@@ -52,17 +66,18 @@ st.caption("Chat memory improves retrieval, while answers remain grounded ONLY i
 
 # ---------- Auto-build on first run ----------
 if not index_exists():
-    st.info("Index not found. Building it now (first run only)...")
-    with st.spinner("Building index..."):
-        result = build_index()
-    if result.returncode == 0:
-        write_index_meta(True, stdout_text=result.stdout)
-        st.success("Index built. You can now ask questions.")
-    else:
-        write_index_meta(False, stderr_text=result.stderr)
-        st.error("Auto index build failed.")
-        st.code(result.stderr)
-        st.stop()
+    job = current_build()
+    if job is None or job.running:
+        job = start_build()
+        st.info("Index not found. Building it now in the background (first run only)...")
+    build_status()
+    # a failed first build is not retried on every rerun, only on request
+    if job.state == "failed" and st.button("Retry index build"):
+        start_build()
+        st.rerun()
+    st.stop()
+
+warm_engine()
 
 # ---------- Session State ----------
 if "messages" not in st.session_state:
@@ -79,31 +94,78 @@ with st.sidebar:
 
     if meta and meta.get("built_at_utc"):
         st.caption(f"Last built (UTC): {meta['built_at_utc']}")
+    last = ((meta or {}).get("builds") or [None])[-1]
+    if last and last.get("success"):
+        st.caption(f"Version {last['version']} · {last['duration_s']:.1f}s · {last['chunks_per_sec']:.0f} chunks/s")
+
+    engine_stats = get_engine().stats()
+    cache_stats = engine_stats.get("answer_cache")
+    if cache_stats and (cache_stats["hits"] or cache_stats["misses"]):
+        st.caption(f"Answer cache: {cache_stats['hit_rate']:.0%} hit rate ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})")
+    rewrite_stats = engine_stats["rewrite"]
+    if rewrite_stats["queries"]:
+        st.caption(f"Follow-up rewrites: {rewrite_stats['llm_share']:.0%} needed the LLM ({rewrite_stats['llm']}/{rewrite_stats['queries']})")
 
     st.divider()
 
     st.subheader("Indexing")
-    st.write("If you changed documents, rebuild the index.")
-    if st.button("Build/Rebuild Index"):
-        with st.spinner("Building index..."):
-            result = build_index()
-            if result.returncode == 0:
-                write_index_meta(True, stdout_text=result.stdout)
-                st.success("Index built successfully.")
-                with st.expander("Build logs", expanded=False):
-                    st.code(result.stdout)
-            else:
-                write_index_meta(False, stderr_text=result.stderr)
-                st.error("Index build failed.")
-                with st.expander("Error logs", expanded=True):
-                    st.code(result.stderr)
+    st.write("If you changed documents, rebuild the index. Questions keep being answered from the current index while it builds.")
+    job = current_build()
+    building = job is not None and job.running
+    if st.button("Build/Rebuild Index", disabled=building):
+        start_build()
+    build_status()
 
     st.divider()
 
     st.subheader("Retrieval Settings")
+    collections = get_engine().list_collections()
+    search_in = None
+    if len(collections) > 1:
+        search_in = st.multiselect(
+            "Collections",
+            collections,
+            default=collections[:1],
+            help="Several collections are searched together and their results merged by score"
+        ) or None
+    with st.expander("Filters", expanded=False):
+        # options come from the metadata index built with the collection
+        try:
+            options = get_engine().filter_values(search_in) if index_exists() else {"source_file": [], "doc_type": []}
+        except Exception:
+            options = {"source_file": [], "doc_type": []}
+        filter_files = st.multiselect("Documents", options["source_file"], help="Only search these files")
+        filter_types = st.multiselect("Document types", options["doc_type"])
+        page_from, page_to = st.columns(2)
+        first_page = page_from.number_input("From page", min_value=0, value=None, step=1, help="Stored page numbers, as shown in the sources. Chunks without page numbers (spreadsheets, Word, HTML) are not affected")
+        last_page = page_to.number_input("To page", min_value=0, value=None, step=1)
+        ingested_after = st.date_input("Ingested on or after", value=None)
+    filters = {
+        "source_file": filter_files or None,
+        "doc_type": filter_types or None,
+        "page_range": [first_page, last_page] if first_page is not None or last_page is not None else None,
+        "ingested_after": ingested_after,
+    }
+    filters = {k: v for k, v in filters.items() if v is not None} or None
     top_k = st.slider("Top-K chunks", 2, 8, 4)
+    retrieval_mode = st.selectbox(
+        "Retrieval mode",
+        RETRIEVAL_MODES,
+        index=RETRIEVAL_MODES.index(RETRIEVAL_MODE) if RETRIEVAL_MODE in RETRIEVAL_MODES else 0,
+        help="hybrid = dense vectors + BM25 keyword search (better for exact terms, article numbers, model names)"
+    )
+    use_rerank = st.toggle(
+        "Re-rank with cross-encoder",
+        value=RERANK,
+        help="Over-fetch candidates and keep the best Top-K (fewer, better chunks for the LLM)"
+    )
     show_context = st.toggle("Show retrieved sources", value=True)
     show_rewrite = st.toggle("Show rewritten retrieval query", value=False)
+    show_trace = tracer.enabled and st.toggle(
+        "Show stage timings (debug)",
+        value=False,
+        help="Per-stage latency and token counts of the last answer (TRACE_ENABLED=1)"
+    )
 
     st.divider()
 
@@ -123,12 +185,15 @@ for m in st.session_state.messages:
             st.markdown("### Sources Used (Top Matches)")
             for s in m["sources"]:
                 source_file = s.get("source_file", "unknown")
-                page = s.get("page", None)
+                # sources cached before "location" existed only carry a page
+                where = s.get("location") or (f"page {s['page']}" if s.get("page") is not None else None)
                 dist = s.get("distance", None)
 
                 label = f"[{s.get('rank', '?')}] {source_file}"
-                if page is not None:
-                    label += f" (page {page})"
+                if s.get("collection") and s["collection"] != COLLECTION_NAME:
+                    label = f"[{s.get('rank', '?')}] {s['collection']} / {source_file}"
+                if where:
+                    label += f" ({where})"
                 if dist is not None:
                     label += f" — distance: {float(dist):.4f}"
 
@@ -144,43 +209,77 @@ if user_input:
         st.write(user_input)
 
     with st.chat_message("assistant"):
-        with st.spinner("Retrieving + generating..."):
-            try:
-                res = answer(
+        try:
+            res = {}
+
+            def token_stream():
+                # tokens are rendered as they arrive; the final event carries sources + metrics
+                for event in answer_stream(
                     user_input,
                     top_k=top_k,
-                    history=st.session_state.messages
+                    history=st.session_state.messages,
+                    mode=retrieval_mode,
+                    rerank=use_rerank,
+                    collection=search_in,
+                    filters=filters
+                ):
+                    if event["type"] == "token":
+                        yield event["text"]
+                    else:
+                        res.update(event)
+
+            st.write_stream(token_stream())
+
+            metrics = res.get("metrics", {})
+            if metrics:
+                st.caption(
+                    f"Time to first token: {metrics['ttft_ms']:.0f} ms · "
+                    f"total: {metrics['total_ms']:.0f} ms"
                 )
 
-                st.write(res["answer"])
-
-                if show_rewrite:
-                    st.caption(f"Rewritten retrieval query: {res.get('rewritten_query', '')}")
-
-                if show_context:
-                    st.markdown("### Sources Used (Top Matches)")
-                    for s in res.get("sources", []):
-                        source_file = s.get("source_file", "unknown")
-                        page = s.get("page", None)
-                        dist = s.get("distance", None)
-
-                        label = f"[{s.get('rank', '?')}] {source_file}"
-                        if page is not None:
-                            label += f" (page {page})"
-                        if dist is not None:
-                            label += f" — distance: {float(dist):.4f}"
-
-                        with st.expander(label, expanded=False):
-                            st.code(s.get("text_preview", ""))
-
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": res["answer"],
-                    "sources": res.get("sources", []),
-                    "rewritten_query": res.get("rewritten_query", "")
-                })
-
-            except Exception as e:
-                err = str(e)
-                st.error(err)
-                st.session_state.messages.append({"role": "assistant", "content": f"Error: {err}"})
+            if show_rewrite:
+                st.caption(f"Rewritten retrieval query: {res.get('rewritten_query', '')}")
+
+            if show_trace and res.get("trace"):
+                trace = res["trace"]
+                with st.expander(f"Stage timings — {trace['duration_ms']:.0f} ms total", expanded=False):
+                    st.dataframe(
+                        [
+                            {"stage": sp["name"], "parent": sp["parent"] or "", "start_ms": sp["offset_ms"], "ms": sp["duration_ms"]}
+                            for sp in trace["spans"]
+                        ],
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                    st.json(trace["counters"])
+
+            if show_context:
+                st.markdown("### Sources Used (Top Matches)")
+                for s in res.get("sources", []):
+                    source_file = s.get("source_file", "unknown")
+                    # sources cached before "location" existed only carry a page
+                    where = s.get("location") or (f"page {s['page']}" if s.get("page") is not None else None)
+                    dist = s.get("distance", None)
+
+                    label = f"[{s.get('rank', '?')}] {source_file}"
+                    if s.get("collection") and s["collection"] != COLLECTION_NAME:
+                        label = f"[{s.get('rank', '?')}] {s['collection']} / {source_file}"
+                    if where:
+                        label += f" ({where})"
+                    if dist is not None:
+                        label += f" — distance: {float(dist):.4f}"
+
+                    with st.expander(label, expanded=False):
+                        st.code(s.get("text_preview", ""))
+
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": res["answer"],
+                "sources": res.get("sources", []),
+                "rewritten_query": res.get("rewritten_query", "")
+            })
+
+        except Exception as e:
+            err = str(e)
+            st.error(err)
+            st.session_state.messages.append({"role": "assistant", "content": f"Error: {err}"})
@@ -0,0 +1,50 @@
+import numpy as np
+
+from rag import answer_cache
+from rag.answer_cache import SemanticAnswerCache
+
+_Q = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+_PARAPHRASE = np.array([0.99, 0.1, 0.0], dtype=np.float32)  # cosine ~0.995
+_OTHER = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+
+def test_paraphrase_with_the_same_chunks_hits():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_s=60)
+    cache.store(_Q, ["c1", "c2"], {"answer": "42"}, index_version="v1")
+    hit = cache.lookup(_PARAPHRASE, ["c2", "c1"], index_version="v1")
+    assert hit["answer"] == "42" and hit["cache_similarity"] > 0.95
+    assert cache.lookup(_OTHER, ["c1", "c2"], index_version="v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_different_chunk_ids_miss():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_s=60)
+    cache.store(_Q, ["c1", "c2"], {"answer": "42"}, index_version="v1")
+    assert cache.lookup(_Q, ["c1", "c3"], index_version="v1") is None
+    assert cache.lookup(_Q, ["c1"], index_version="v1") is None
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(threshold=0.95, ttl_s=60)
+    cache.store(_Q, ["c1"], {"answer": "42"})
+    now[0] += 59
+    assert cache.lookup(_Q, ["c1"]) is not None
+    now[0] += 2
+    assert cache.lookup(_Q, ["c1"]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_new_index_version_drops_everything():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_s=60)
+    cache.store(_Q, ["c1"], {"answer": "old"}, index_version="v1")
+    assert cache.lookup(_Q, ["c1"], index_version="v2") is None
+    assert cache.stats()["invalidations"] == 1
+    # and an entry from the old version does not come back
+    assert cache.lookup(_Q, ["c1"], index_version="v1") is None
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_s=60, max_entries=2)
+    cache.store(_Q, ["a"], {"answer": "a"})
+    cache.store(_OTHER, ["b"], {"answer": "b"})
+    assert cache.lookup(_Q, ["a"]) is not None  # "b" is now the oldest
+    cache.store(np.array([0.0, 0.0, 1.0]), ["c"], {"answer": "c"})
+    assert cache.lookup(_OTHER, ["b"]) is None
+    assert cache.lookup(_Q, ["a"])["answer"] == "a"
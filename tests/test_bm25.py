@@ -0,0 +1,29 @@
+from vector_store.bm25 import BM25Index
+
+_DOCS = {
+    "a": "Attention is all you need: the transformer architecture",
+    "b": "DeepSeek-R1 improves reasoning with reinforcement learning",
+    "c": "Article 5 of the AI Act lists prohibited practices",
+    "d": "Transformer attention heads and reasoning",
+}
+
+def _scores(index, query):
+    return {cid: round(score, 5) for cid, score in index.search(query, 100)}
+
+def test_update_matches_a_rebuild():
+    index = BM25Index.build(list(_DOCS), list(_DOCS.values()))
+    updated = index.updated(["c"], ["d", "e"], ["attention only", "Annex III high-risk systems"])
+
+    docs = dict(_DOCS, d="attention only", e="Annex III high-risk systems")
+    del docs["c"]
+    rebuilt = BM25Index.build(list(docs), list(docs.values()))
+    assert sorted(updated.ids) == sorted(rebuilt.ids)
+    assert sorted(updated.terms) == sorted(rebuilt.terms)  # "article", "prohibited", ... are gone
+    for query in ("attention transformer", "reasoning", "article prohibited", "high-risk annex"):
+        assert _scores(updated, query) == _scores(rebuilt, query)
+
+def test_update_of_an_empty_index():
+    index = BM25Index.build([], [])
+    assert index.search("anything", 5) == []
+    updated = index.updated([], ["a"], [_DOCS["a"]])
+    assert [cid for cid, _ in updated.search("transformer", 5)] == ["a"]
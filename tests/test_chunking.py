@@ -0,0 +1,42 @@
+from ingestion.chunking import _units, chunk_documents, count_tokens, iter_token_chunks, truncate_tokens
+from langchain.schema import Document
+
+def _page(text, page=1):
+    return Document(page_content=text, metadata={"source_file": "doc.pdf", "page": page})
+
+def test_runs_without_word_boundaries_are_bounded():
+    text = "x" * 20000
+    assert count_tokens(text) == 1250
+    assert truncate_tokens(text, 3) == "x" * 48
+
+    chunks = list(iter_token_chunks([_page(text)], 220, 0, max_chars=1000))
+    assert "".join(c.page_content for c in chunks) == text
+    for c in chunks:
+        assert len(c.page_content) <= 220 * 16
+        assert c.metadata["token_count"] == count_tokens(c.page_content)
+
+def test_long_sentences_are_cut_at_max_chars():
+    sentence = " ".join(["word"] * 400) + "."
+    units = list(_units(sentence, 1000, 500))
+    assert len(units) == 4
+    assert all(end - start <= 500 for _, start, end, _ in units)
+    assert sum(n for *_, n in units) == count_tokens(sentence)
+
+def test_chunks_end_on_sentences_and_overlap():
+    sentences = [f"Sentence number {i} is here." for i in range(10)]  # 6 tokens each
+    chunks = list(iter_token_chunks([_page(" ".join(sentences))], 20, 6))
+    assert chunks[0].page_content == " ".join(sentences[:3])
+    # the last sentence of a chunk opens the next one
+    assert chunks[1].page_content.startswith(sentences[2])
+    for c in chunks:
+        md = c.metadata
+        assert md["token_count"] <= 20
+        assert c.page_content.endswith(".")
+        assert " ".join(sentences)[md["char_start"]:md["char_end"]] == c.page_content
+
+def test_headings_start_chunks_and_pages_are_not_spanned():
+    page1 = "1. Introduction\nShort intro text.\n\n2. Methods\nWe did things."
+    chunks = chunk_documents([_page(page1), _page("Results continue here.", page=2)], 200, 0, "tokens")
+    assert [(c.metadata["page"], c.metadata["section"]) for c in chunks] == [(1, "1. Introduction"), (1, "2. Methods"), (2, "")]
+    assert chunks[1].page_content == "2. Methods\nWe did things."
+    assert [c.metadata["prev_chunk_id"] for c in chunks] == ["", chunks[0].metadata["chunk_id"], chunks[1].metadata["chunk_id"]]
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from rag.engine import RAGEngine
+from vector_store.index_meta import collection_root, swap_current, update_index_meta, version_dir
+
+class _NoEmbeddings:
+    normalize = True
+
+    def __call__(self, texts):
+        raise AssertionError("a mismatched fan-out must fail before embedding")
+
+def _collection(base, name, normalize):
+    root = collection_root(name, str(base), "docs")
+    os.makedirs(version_dir(root, "v1"))
+    update_index_meta(version_dir(root, "v1"), embed_normalize=normalize)
+    swap_current(root, "v1")
+
+def test_fanout_over_mixed_normalization_is_refused(tmp_path):
+    _collection(tmp_path, "docs", True)
+    _collection(tmp_path, "papers", True)
+    _collection(tmp_path, "legacy", False)
+    engine = RAGEngine(persist_dir=str(tmp_path), collection_name="docs", embedding_fn=_NoEmbeddings(), backend="local")
+
+    engine._check_comparable(["docs", "papers"])
+    with pytest.raises(ValueError, match="legacy with EMBED_NORMALIZE=0"):
+        engine.retrieve("question", collection=["docs", "papers", "legacy"], rerank=False)
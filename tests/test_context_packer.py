@@ -0,0 +1,53 @@
+from ingestion.chunking import count_tokens, truncate_tokens
+from rag.context_packer import _header, _trim, location, pack_context
+
+def test_truncate_tokens_cuts_at_token_boundaries():
+    text = "a.b (x) -- e.g., 3.14%"
+    for n in range(count_tokens(text) + 2):
+        assert count_tokens(truncate_tokens(text, n)) == min(n, count_tokens(text))
+
+def test_trim_punctuation_heavy_text_stays_within_budget():
+    # mostly one-character tokens: ~4 chars per token would overshoot the budget
+    text = " ".join(["(a.b)--[1],e.g."] * 40)
+    for budget in (1, 5, 17, 60):
+        assert count_tokens(_trim(text, set(), 3, budget)) <= budget
+
+def test_trim_keeps_sentences_within_budget():
+    text = "First about cats. Second about dogs! Third: cats and dogs. Fourth about birds?"
+    out = _trim(text, {"cats"}, 2, 12)
+    assert count_tokens(out) <= 12
+    assert "cats" in out
+
+def test_pack_context_respects_max_tokens():
+    docs = [
+        {"text": " ".join(["x.y,z;"] * 300), "metadata": {"source_file": f"f{i}.pdf", "page": i}}
+        for i in range(4)
+    ]
+    blocks = pack_context(docs, "x", max_tokens=150, full_chunks=1, trim_sentences=2)
+    used = sum(b["tokens"] + count_tokens(_header(b)) + 2 for b in blocks)
+    assert blocks and used <= 150
+
+def _docs(n_chunks, n_sentences):
+    return [
+        {"text": " ".join(f"Sentence {j} of chunk {i} about topic {j}." for j in range(n_sentences)), "metadata": {"source_file": f"f{i}.pdf", "page": 1}}
+        for i in range(n_chunks)
+    ]
+
+def test_pack_context_keeps_every_chunk_whole_within_budget():
+    docs = _docs(4, 8)
+    blocks = pack_context(docs, "topic", max_tokens=1200, full_chunks=2, trim_sentences=3)
+    assert [b["text"] for b in blocks] == [d["text"] for d in docs]
+
+def test_pack_context_trims_least_relevant_chunks_first_when_over_budget():
+    docs = _docs(4, 8)
+    full = count_tokens(docs[0]["text"])
+    # room for everything but about half of one chunk
+    blocks = pack_context(docs, "topic", max_tokens=4 * (full + 12) - full // 2, full_chunks=2, trim_sentences=3)
+    assert [b["text"] for b in blocks[:3]] == [d["text"] for d in docs[:3]]
+    assert blocks[3]["text"].count("Sentence") == 3
+
+def test_spreadsheet_chunks_are_cited_by_sheet_and_cells():
+    assert location({"page": 3}) == "page=3"
+    assert location({"sheet": "Budget", "cell_range": "B2:F40"}, " ") == "sheet Budget, cells B2:F40"
+    docs = [{"text": "Year: 2024 | Rate: 3.1", "metadata": {"source_file": "b.xlsx", "sheet": "Budget", "cell_range": "B2:F40"}}]
+    assert _header(pack_context(docs, "rate", 1200, 2, 3)[0]) == "[1] source=b.xlsx, sheet=Budget, cells=B2:F40"
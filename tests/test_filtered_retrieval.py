@@ -0,0 +1,69 @@
+import numpy as np
+
+from rag.retriever import filtered_retrieve_batch
+from vector_store.local_store import LocalCollection
+from vector_store.metadata_index import MetadataIndex, normalize_filters
+
+class _Counting:
+    """Wraps a collection and records which calls the retriever makes."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.embedding_gets = 0
+        self.query_sizes = []
+
+    def get(self, ids=None, include=None, **kw):
+        if "embeddings" in (include or []):
+            self.embedding_gets += 1
+        return self.collection.get(ids=ids, include=include, **kw)
+
+    def query(self, query_embeddings=None, n_results=10, include=None, **kw):
+        self.query_sizes.append(n_results)
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, include=include, **kw)
+
+def _corpus(tmp_path, n=3000, dim=16, md_scale=1.0):
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    x[:50] *= md_scale
+    ids = [str(i) for i in range(n)]
+    # 2950 pdf chunks, 50 md chunks
+    mds = [{"source_file": f"f{i % 10}.pdf" if i >= 50 else "notes.md", "doc_type": "pdf" if i >= 50 else "md"} for i in range(n)]
+    coll = LocalCollection(str(tmp_path), "t")
+    coll.upsert(ids=ids, documents=[f"doc {i}" for i in ids], metadatas=mds, embeddings=x)
+    return coll, MetadataIndex.build(ids, mds), x, rng
+
+def _exact(x, q, rows, k):
+    d = ((x[rows] - q) ** 2).sum(axis=1)
+    return [str(rows[i]) for i in np.argsort(d)[:k]]
+
+def test_broad_filter_does_not_fetch_embeddings(tmp_path):
+    coll, index, x, rng = _corpus(tmp_path)
+    counting = _Counting(coll)
+    selection = index.select(normalize_filters({"doc_type": "pdf"}))
+    q = rng.standard_normal((2, x.shape[1])).astype(np.float32)
+    out = filtered_retrieve_batch(counting, selection, ["a", "b"], 5, q, prefilter_max_rows=2000, prefilter_max_fraction=0.05)
+    assert counting.embedding_gets == 0
+    rows = np.arange(50, len(x))
+    for i in range(2):
+        assert [d["id"] for d in out[i]] == _exact(x, q[i], rows, 5)
+
+def test_selective_filter_is_searched_exactly(tmp_path):
+    coll, index, x, rng = _corpus(tmp_path)
+    counting = _Counting(coll)
+    selection = index.select(normalize_filters({"doc_type": "md"}))
+    q = rng.standard_normal((1, x.shape[1])).astype(np.float32)
+    out = filtered_retrieve_batch(counting, selection, ["a"], 5, q, prefilter_max_rows=2000, prefilter_max_fraction=0.05)
+    assert counting.embedding_gets == 1 and not counting.query_sizes
+    assert [d["id"] for d in out[0]] == _exact(x, q[0], np.arange(50), 5)
+
+def test_large_selection_retries_with_larger_overfetch(tmp_path):
+    # the md chunks lie far out: the first over-fetch finds none of them
+    coll, index, x, rng = _corpus(tmp_path, md_scale=4.0)
+    counting = _Counting(coll)
+    # selective by fraction, but over the row cap: never pre-filtered
+    selection = index.select(normalize_filters({"doc_type": "md"}))
+    q = rng.standard_normal((1, x.shape[1])).astype(np.float32)
+    out = filtered_retrieve_batch(counting, selection, ["a"], 5, q, prefilter_max_rows=10, prefilter_max_fraction=0.05)
+    assert counting.embedding_gets == 0
+    assert len(counting.query_sizes) > 1 and counting.query_sizes == sorted(counting.query_sizes)
+    assert [d["id"] for d in out[0]] == _exact(x, q[0], np.arange(50), 5)
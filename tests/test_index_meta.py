@@ -0,0 +1,49 @@
+import os
+
+from vector_store.index_meta import (
+    version_dir, swap_current, mark_incomplete, read_incomplete, clear_incomplete,
+    resumable_version, discard_incomplete, prune_versions,
+)
+
+def _versions(root, *names):
+    for v in names:
+        os.makedirs(version_dir(str(root), v))
+
+def _listed(root):
+    return sorted(os.listdir(os.path.join(str(root), "versions")))
+
+def test_unfinished_build_of_current_base_is_resumable(tmp_path):
+    _versions(tmp_path, "v1", "v2")
+    swap_current(str(tmp_path), "v1")
+    mark_incomplete(version_dir(str(tmp_path), "v2"), base_version="v1", mode="incremental", pid=None)
+    assert resumable_version(str(tmp_path)) == "v2"
+
+    # owned by a live process (this one): not resumable
+    mark_incomplete(version_dir(str(tmp_path), "v2"), base_version="v1", mode="incremental")
+    assert resumable_version(str(tmp_path)) is None
+
+    clear_incomplete(version_dir(str(tmp_path), "v2"))
+    assert read_incomplete(version_dir(str(tmp_path), "v2")) is None
+    assert resumable_version(str(tmp_path)) is None
+
+def test_prune_keeps_resumable_build_and_drops_stale_ones(tmp_path):
+    _versions(tmp_path, "v1", "v2", "v3", "v4")
+    swap_current(str(tmp_path), "v3")
+    mark_incomplete(version_dir(str(tmp_path), "v2"), base_version="v1", pid=None)  # base no longer CURRENT
+    mark_incomplete(version_dir(str(tmp_path), "v4"), base_version="v3", pid=None)
+    assert prune_versions(str(tmp_path), keep=1) == ["v1", "v2"]
+    assert _listed(tmp_path) == ["v3", "v4"]
+
+def test_discard_incomplete(tmp_path):
+    _versions(tmp_path, "v1", "v2")
+    swap_current(str(tmp_path), "v1")
+    mark_incomplete(version_dir(str(tmp_path), "v2"), base_version="v1", pid=None)
+    assert discard_incomplete(str(tmp_path)) == ["v2"]
+    assert _listed(tmp_path) == ["v1"]
+
+def test_prune_keeps_the_version_current_replaced(tmp_path):
+    _versions(tmp_path, "v1", "v2", "v3")
+    for v in ("v1", "v2", "v3"):
+        swap_current(str(tmp_path), v)
+    assert prune_versions(str(tmp_path), keep=1) == ["v1"]
+    assert _listed(tmp_path) == ["v2", "v3"]
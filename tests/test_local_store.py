@@ -0,0 +1,56 @@
+import numpy as np
+
+from vector_store.local_store import LocalCollection
+
+def _clustered(n=4000, dim=16, centers=40, seed=0):
+    rng = np.random.default_rng(seed)
+    c = rng.standard_normal((centers, dim)).astype(np.float32) * 4
+    x = c[rng.integers(0, centers, n)] + rng.standard_normal((n, dim)).astype(np.float32)
+    return x, rng
+
+def _exact(x, q, k):
+    return [str(i) for i in np.argsort(((x - q) ** 2).sum(axis=1))[:k]]
+
+def test_upsert_replaces_and_delete_tombstones(tmp_path):
+    coll = LocalCollection(str(tmp_path), "t")
+    vecs = np.eye(4, dtype=np.float32)
+    coll.upsert(ids=["a", "b", "c"], documents=["A", "B", "C"], metadatas=[{"n": 1}, {"n": 2}, {"n": 3}], embeddings=vecs[:3])
+    coll.upsert(ids=["b"], documents=["B2"], metadatas=[{"n": 20}], embeddings=vecs[3:])
+    coll.delete(["c", "missing"])
+    assert coll.count() == 2
+
+    got = coll.get(ids=["a", "b", "c"])
+    assert got["ids"] == ["a", "b"]
+    assert got["documents"] == ["A", "B2"] and got["metadatas"] == [{"n": 1}, {"n": 20}]
+    res = coll.query(query_embeddings=vecs[3:], n_results=3)
+    assert res["ids"] == [["b", "a"]] and res["distances"][0][0] == 0.0
+
+    # state survives a reopen, and optimize() compacts the dead rows away
+    reopened = LocalCollection(str(tmp_path), "t")
+    assert sorted(reopened.get()["ids"]) == ["a", "b"]
+    reopened.optimize()
+    assert len(reopened._ids) == 2
+    assert reopened.get(ids=["b"], include=["embeddings"])["embeddings"].tolist() == [vecs[3].tolist()]
+
+def test_ivf_recall_against_exact_search(tmp_path):
+    x, rng = _clustered()
+    coll = LocalCollection(str(tmp_path), "t", nprobe=8)
+    ids = [str(i) for i in range(len(x))]
+    coll.upsert(ids=ids, embeddings=x)
+    coll.optimize(ivf_min_rows=1000, nlist=64)
+    assert coll._ivf is not None
+
+    q = x[rng.integers(0, len(x), 50)] + 0.1 * rng.standard_normal((50, x.shape[1])).astype(np.float32)
+    res = coll.query(query_embeddings=q, n_results=10, include=[])
+    hits = sum(len(set(got) & set(_exact(x, q[i], 10))) for i, got in enumerate(res["ids"]))
+    assert hits / 500 >= 0.95
+
+def test_rows_appended_after_the_ivf_build_are_found(tmp_path):
+    x, rng = _clustered()
+    coll = LocalCollection(str(tmp_path), "t", nprobe=1)
+    coll.upsert(ids=[str(i) for i in range(len(x))], embeddings=x)
+    coll.optimize(ivf_min_rows=1000, nlist=64)
+
+    far = np.full((1, x.shape[1]), 50.0, dtype=np.float32)
+    coll.upsert(ids=["new"], embeddings=far)
+    assert coll.query(query_embeddings=far, n_results=1, include=[])["ids"] == [["new"]]
@@ -0,0 +1,48 @@
+from vector_store.metadata_index import MetadataIndex, normalize_filters
+
+# a mixed corpus: PDF chunks have page numbers, XLSX chunks a sheet + cell range instead
+_CHUNKS = [
+    ("pdf-0", {"source_file": "paper.pdf", "doc_type": "pdf", "page": 0, "ingested_at": 100}),
+    ("pdf-2", {"source_file": "paper.pdf", "doc_type": "pdf", "page": 2, "ingested_at": 100}),
+    ("pdf-5", {"source_file": "paper.pdf", "doc_type": "pdf", "page": 5, "ingested_at": 200}),
+    ("xlsx-a", {"source_file": "budget.xlsx", "doc_type": "xlsx", "sheet": "Sheet1", "cell_range": "A1:F40", "ingested_at": 100}),
+    ("xlsx-b", {"source_file": "budget.xlsx", "doc_type": "xlsx", "sheet": "Sheet2", "cell_range": "B12:Q52", "ingested_at": 200}),
+    ("docx-0", {"source_file": "notes.docx", "doc_type": "docx", "ingested_at": 200}),
+]
+
+def _select(filters):
+    index = MetadataIndex.build([cid for cid, _ in _CHUNKS], [md for _, md in _CHUNKS])
+    return index.select(normalize_filters(filters)).ids
+
+def test_page_range_filters_paged_chunks_only():
+    assert _select({"page_range": [1, 5]}) == ["pdf-2", "pdf-5", "xlsx-a", "xlsx-b", "docx-0"]
+    assert _select({"page_range": [None, 0]}) == ["pdf-0", "xlsx-a", "xlsx-b", "docx-0"]
+
+def test_page_range_keeps_spreadsheets_with_doc_type():
+    assert _select({"doc_type": "xlsx", "page_range": [1, 3]}) == ["xlsx-a", "xlsx-b"]
+    assert _select({"doc_type": ["pdf", "xlsx"], "page_range": [2, 2]}) == ["pdf-2", "xlsx-a", "xlsx-b"]
+
+def test_page_range_combines_with_other_filters():
+    assert _select({"page_range": [1, None], "ingested_after": 150}) == ["pdf-5", "xlsx-b", "docx-0"]
+    assert _select({"source_file": "paper.pdf", "page_range": [3, 9]}) == ["pdf-5"]
+
+def test_survives_save_and_load(tmp_path):
+    index = MetadataIndex.build([cid for cid, _ in _CHUNKS], [md for _, md in _CHUNKS])
+    index.save(str(tmp_path))
+    loaded = MetadataIndex.load(str(tmp_path))
+    assert loaded.select(normalize_filters({"page_range": [2, 2]})).ids == ["pdf-2", "xlsx-a", "xlsx-b", "docx-0"]
+
+def test_update_matches_a_rebuild():
+    index = MetadataIndex.build([cid for cid, _ in _CHUNKS], [md for _, md in _CHUNKS])
+    moved = {"source_file": "paper-v2.pdf", "doc_type": "pdf", "page": 3, "ingested_at": 300}
+    new = {"source_file": "slides.md", "doc_type": "md", "ingested_at": 300}
+    updated = index.updated(["xlsx-a", "xlsx-b"], ["pdf-5", "md-0"], [moved, new])
+
+    chunks = dict(_CHUNKS)
+    del chunks["xlsx-a"], chunks["xlsx-b"]
+    chunks.update({"pdf-5": moved, "md-0": new})
+    rebuilt = MetadataIndex.build(list(chunks), list(chunks.values()))
+    assert updated.distinct("source_file") == rebuilt.distinct("source_file") == ["notes.docx", "paper-v2.pdf", "paper.pdf", "slides.md"]
+    assert updated.distinct("doc_type") == ["docx", "md", "pdf"]
+    for filters in ({"doc_type": "xlsx"}, {"page_range": [1, 3]}, {"ingested_after": 250}, {"source_file": "paper.pdf"}):
+        assert sorted(updated.select(normalize_filters(filters)).ids) == sorted(rebuilt.select(normalize_filters(filters)).ids)
@@ -0,0 +1,62 @@
+import openpyxl
+
+from ingestion import loaders
+from ingestion.parse_cache import ParseCache
+from ingestion.parsers import parse_html, parse_xlsx
+from langchain.schema import Document
+
+def _workbook(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Rates"
+    ws.append(["Inflation calculator"])
+    ws.append([])
+    ws.append([None, "Year", "Rate"])
+    for year in range(2019, 2024):
+        ws.append([None, year, year / 1000])
+    wb.save(path)
+
+def test_xlsx_sheet_is_split_into_cell_range_pages(tmp_path):
+    path = str(tmp_path / "rates.xlsx")
+    _workbook(path)
+    pages = parse_xlsx(path, rows_per_page=2)
+
+    assert [p.metadata["cell_range"] for p in pages] == ["A1:A1", "B3:C5", "B6:C7", "B8:C8"]
+    assert all(p.metadata["sheet"] == "Rates" and "page" not in p.metadata for p in pages)
+    # header rows are repeated in every data row, so each page reads on its own
+    assert pages[0].page_content == "Inflation calculator"
+    assert pages[2].page_content == "Year: 2021 | Rate: 2.021\nYear: 2022 | Rate: 2.022"
+
+def test_html_keeps_headings_and_drops_scripts(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text(
+        "<html><head><title>Guide</title><script>var x = 1;</script></head>"
+        "<body><h2>Setup</h2><p>Install it.</p><table><tr><td>a</td><td>b</td></tr></table></body></html>",
+        encoding="utf-8",
+    )
+    [page] = parse_html(str(path))
+    assert page.metadata["title"] == "Guide"
+    assert page.page_content == "## Setup\nInstall it.\n\na | b"
+
+def test_parse_cache_is_keyed_by_content_not_path(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    cache.put("ab" * 32, "xlsx-v2", [Document(page_content="x", metadata={"source": "/a/f.xlsx", "source_file": "f.xlsx", "sheet": "S"})])
+    [page] = cache.get("ab" * 32, "xlsx-v2")
+    assert page.metadata == {"sheet": "S"}
+    assert cache.get("ab" * 32, "xlsx-v1") is None
+    assert cache.get("cd" * 32, "xlsx-v2") is None
+
+def test_load_file_reuses_cached_pages_under_a_new_name(tmp_path, monkeypatch):
+    monkeypatch.setattr(loaders, "PARSE_CACHE", True)
+    monkeypatch.setattr(loaders, "ParseCache", lambda: ParseCache(str(tmp_path / "cache")))
+    calls = []
+    loader = loaders.Loader("txt", lambda path: calls.append(path) or [Document(page_content="hello", metadata={})])
+    monkeypatch.setitem(loaders.LOADERS, ".txt", loader)
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text("same bytes", encoding="utf-8")
+
+    first = loaders.load_file(str(tmp_path / "a.txt"))
+    second = loaders.load_file(str(tmp_path / "b.txt"))
+    assert len(calls) == 1
+    assert second[0].page_content == first[0].page_content == "hello"
+    assert second[0].metadata["source_file"] == "b.txt" and second[0].metadata["doc_type"] == "txt"
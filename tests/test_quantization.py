@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from vector_store.local_store import LocalCollection
+from vector_store.quantization import VectorQuantizer
+
+def _vectors(n=3000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    # most of the variance in a few directions, like sentence embeddings
+    x = rng.standard_normal((n, dim)).astype(np.float32) * np.linspace(3.0, 0.2, dim, dtype=np.float32)
+    return x, rng
+
+def _exact_top1(x, q):
+    return str(int(np.argmin(((x - q) ** 2).sum(axis=1))))
+
+@pytest.mark.parametrize("mode,pca_dim,pq_m", [("int8", 0, 0), ("int8", 16, 0), ("pq", 0, 8)])
+def test_rescored_top1_equals_exact(tmp_path, mode, pca_dim, pq_m):
+    x, rng = _vectors()
+    coll = LocalCollection(str(tmp_path), "t", rescore_factor=8)
+    coll.upsert(ids=[str(i) for i in range(len(x))], embeddings=x)
+    coll.set_quantization(mode, pca_dim, pq_m)
+    coll.optimize()
+    assert coll.quantization_stats()["rows_coded"] == len(x)
+
+    q = x[rng.integers(0, len(x), 40)] + 0.05 * rng.standard_normal((40, x.shape[1])).astype(np.float32)
+    res = coll.query(query_embeddings=q, n_results=1, include=["distances"])
+    assert [ids[0] for ids in res["ids"]] == [_exact_top1(x, qi) for qi in q]
+    # distances come from the float vectors, not the codes
+    assert np.allclose([d[0] for d in res["distances"]], [((x[int(ids[0])] - qi) ** 2).sum() for ids, qi in zip(res["ids"], q)], atol=1e-3)
+
+def test_rows_appended_after_encoding_are_rescored(tmp_path):
+    x, _ = _vectors()
+    coll = LocalCollection(str(tmp_path), "t")
+    coll.upsert(ids=[str(i) for i in range(len(x))], embeddings=x)
+    coll.set_quantization("pq", 0, 8)
+    coll.optimize()
+
+    far = np.full((1, x.shape[1]), 40.0, dtype=np.float32)
+    coll.upsert(ids=["new"], embeddings=far)
+    assert coll.query(query_embeddings=far, n_results=1, include=[])["ids"] == [["new"]]
+    # the codes (and the fitted quantizer) survive a reopen
+    reopened = LocalCollection(str(tmp_path), "t")
+    assert reopened.quantization_stats()["code_bytes_per_vector"] == 8
+    assert reopened.query(query_embeddings=x[:1], n_results=1, include=[])["ids"] == [["0"]]
+
+def test_quantizer_round_trips_through_arrays():
+    x, _ = _vectors(n=600)
+    fitted = VectorQuantizer("int8", pca_dim=8).fit(x)
+    loaded = VectorQuantizer.from_arrays(fitted.to_arrays())
+    assert loaded.code_size == 8
+    assert np.array_equal(loaded.encode(x[:5]), fitted.encode(x[:5]))
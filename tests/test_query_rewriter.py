@@ -0,0 +1,69 @@
+from rag import query_rewriter
+from rag.query_rewriter import rewrite_query
+from vector_store.bm25 import BM25Index
+
+_DOCS = {
+    "a": "The EU AI Act bans social scoring and lists high-risk systems",
+    "b": "DeepSeek-R1 is trained with reinforcement learning",
+    "c": "Transformers use attention",
+    "d": "GDPR protects personal data",
+}
+_VOCABULARY = BM25Index.build(list(_DOCS), list(_DOCS.values()))
+_HISTORY = [
+    {"role": "user", "content": "What does the EU AI Act ban?"},
+    {"role": "assistant", "content": "It bans social scoring."},
+]
+
+class _Reply:
+    def __init__(self, content):
+        self.content = content
+
+class _LLM:
+    def __init__(self, reply="EU AI Act rules compared with GDPR"):
+        self.reply = reply
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return _Reply(self.reply)
+
+def _rewrite(query, llm, history=_HISTORY):
+    return rewrite_query(query, history, llm=llm, vocabulary=_VOCABULARY, llm_threshold=0.5)
+
+def test_standalone_questions_are_kept_without_an_llm_call():
+    llm = _LLM()
+    query = "How is DeepSeek-R1 trained with reinforcement learning?"
+    assert _rewrite(query, llm) == query
+    assert llm.calls == 0
+
+def test_pronoun_and_ellipsis_are_resolved_locally():
+    llm = _LLM()
+    assert _rewrite("What does it say about high-risk systems?", llm) == "What does EU AI Act say about high-risk systems?"
+    assert _rewrite("And GDPR?", llm) == "And GDPR? (EU AI Act)"
+    # the current question echoed at the end of history is not its own context
+    echoed = _HISTORY + [{"role": "user", "content": "And GDPR?"}]
+    assert _rewrite("And GDPR?", llm, echoed) == "And GDPR? (EU AI Act)"
+    assert llm.calls == 0
+
+def test_ambiguous_follow_up_asks_the_llm_once_per_history():
+    query_rewriter._memo.clear()
+    llm = _LLM()
+    before = query_rewriter.rewrite_stats()
+    assert _rewrite("compare it with them", llm) == "EU AI Act rules compared with GDPR"
+    assert _rewrite("compare it with them", llm) == "EU AI Act rules compared with GDPR"
+    assert llm.calls == 1
+    after = query_rewriter.rewrite_stats()
+    assert after["llm"] - before["llm"] == 1 and after["llm_memo_hits"] - before["llm_memo_hits"] == 1
+
+    # a different conversation is a different memo key
+    other = _HISTORY + [{"role": "user", "content": "What about GDPR?"}, {"role": "assistant", "content": "It protects personal data."}]
+    _rewrite("compare it with them", llm, other)
+    assert llm.calls == 2
+
+def test_unusable_llm_output_falls_back_to_the_local_rewrite():
+    query_rewriter._memo.clear()
+    llm = _LLM(reply="")
+    assert _rewrite("compare it with them", llm) == "compare EU AI Act with them"
+    # not memoized: the next call asks again
+    _rewrite("compare it with them", llm)
+    assert llm.calls == 2
@@ -0,0 +1,35 @@
+import time
+
+from rag.reranker import CrossEncoderReranker
+
+class _LengthModel:
+    """Scores a pair by the chunk's length, so longer chunks rank first."""
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        return [float(len(text)) for _, text in pairs]
+
+def _docs(n):
+    return [{"id": f"c{i}", "text": "x" * (i + 1), "rank": i + 1} for i in range(n)]
+
+def test_rerank_orders_by_score():
+    reranker = CrossEncoderReranker(model=_LengthModel())
+    out = reranker.rerank("q", _docs(5), top_k=3)
+    assert [d["id"] for d in out] == ["c4", "c3", "c2"]
+    assert [d["rank"] for d in out] == [1, 2, 3]
+
+def test_budget_overrun_still_returns_top_k():
+    reranker = CrossEncoderReranker(model=_LengthModel(), batch_size=1)
+    reranker._sec_per_pair = 1.0  # measured cost: 2.5 s left affords two pairs
+    out = reranker.rerank("q", _docs(6), top_k=4, deadline=time.perf_counter() + 2.5)
+
+    assert len(out) == 4
+    # the two scored chunks first, then the unscored ones in retrieval order
+    assert [d["id"] for d in out] == ["c1", "c0", "c2", "c3"]
+    assert [d["rerank_score"] is not None for d in out] == [True, True, False, False]
+    assert [d["retrieval_rank"] for d in out] == [2, 1, 3, 4]
+
+def test_no_time_left_falls_back_to_retrieval_order():
+    reranker = CrossEncoderReranker(model=_LengthModel())
+    reranker._sec_per_pair = 1.0
+    out = reranker.rerank("q", _docs(6), top_k=4, deadline=time.perf_counter() - 1.0)
+    assert [d["id"] for d in out] == ["c0", "c1", "c2", "c3"]
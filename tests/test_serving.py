@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from serving.batching import MicroBatchingEmbedder
+from serving.pool import Overloaded, WorkerPool
+
+class _Embedder:
+    """Encodes a text as [len(text), number of calls so far]."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), len(self.calls)] for t in texts], dtype=np.float32)
+
+# ---------- WorkerPool ----------
+def test_full_queue_is_shed_at_once():
+    release = threading.Event()
+
+    async def main(pool):
+        running = [pool.start(release.wait) for _ in range(2)]  # 1 running + 1 queued
+        with pytest.raises(Overloaded):
+            pool.start(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+
+    pool = WorkerPool(workers=1, max_queue=1, queue_timeout_s=10)
+    asyncio.run(main(pool))
+    pool.shutdown()
+    stats = pool.stats()
+    assert stats["admitted"] == 2 and stats["completed"] == 2 and stats["shed_queue_full"] == 1
+    assert stats["queued"] == 0 and stats["in_flight"] == 0
+
+def test_call_that_waited_too_long_is_dropped():
+    ran = []
+
+    async def main(pool):
+        slow = pool.start(time.sleep, 0.2)
+        late = pool.start(ran.append, "late")
+        await slow
+        with pytest.raises(Overloaded):
+            await late
+
+    pool = WorkerPool(workers=1, max_queue=1, queue_timeout_s=0.05)
+    asyncio.run(main(pool))
+    pool.shutdown()
+    assert ran == [] and pool.stats()["shed_queue_timeout"] == 1
+    assert 'rag_server_requests_total{outcome="shed_queue_timeout"} 1' in pool.prometheus_text()
+
+def test_failures_are_counted_and_raised():
+    def boom():
+        raise RuntimeError("boom")
+
+    pool = WorkerPool(workers=2, max_queue=0)
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.run(boom))
+    pool.shutdown()
+    assert pool.stats()["failed"] == 1 and pool.stats()["in_flight"] == 0
+
+# ---------- MicroBatchingEmbedder ----------
+def test_concurrent_callers_share_one_model_call():
+    inner = _Embedder()
+    batcher = MicroBatchingEmbedder(inner, window_ms=100, max_batch=64)
+    texts = [["a", "bb"], ["ccc"], ["bb", "dddd"]]
+    out = [None] * len(texts)
+
+    def call(i):
+        out[i] = batcher.encode(texts[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(texts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert len(inner.calls) == 1 and sorted(inner.calls[0]) == ["a", "bb", "ccc", "dddd"]  # "bb" encoded once
+    for i, ts in enumerate(texts):
+        assert out[i][:, 0].tolist() == [len(t) for t in ts]
+    assert batcher.stats()["requests"] == 3
+
+def test_batches_are_capped_at_max_batch():
+    inner = _Embedder()
+    batcher = MicroBatchingEmbedder(inner, window_ms=100, max_batch=2)
+    threads = [threading.Thread(target=batcher.encode, args=([str(i) * (i + 1)],)) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+    assert all(len(c) <= 2 for c in inner.calls) and sum(len(c) for c in inner.calls) == 5
+
+def test_model_errors_reach_every_caller():
+    class Failing:
+        def encode(self, texts):
+            raise ValueError("model down")
+
+    batcher = MicroBatchingEmbedder(Failing(), window_ms=1)
+    with pytest.raises(ValueError):
+        batcher.encode(["a"])
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.encode(["a"])
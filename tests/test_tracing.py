@@ -0,0 +1,37 @@
+import json
+import os
+import threading
+
+from rag.tracing import Tracer
+
+def _run(tracer, n):
+    for i in range(n):
+        with tracer.trace("answer", i=i):
+            with tracer.span("embed"):
+                pass
+            tracer.incr("tokens", 2)
+
+def test_traces_are_written_in_the_background(tmp_path):
+    tracer = Tracer(enabled=True, trace_dir=str(tmp_path), flush_interval_s=0.05)
+    threads = [threading.Thread(target=_run, args=(tracer, 50)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    tracer.flush()
+
+    with open(tmp_path / "traces.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 200
+    assert records[0]["spans"][0]["name"] == "embed"
+    assert 'rag_stage_seconds_count{stage="answer"} 200' in (tmp_path / "metrics.prom").read_text()
+    assert tracer.last["name"] == "answer"
+
+def test_trace_file_is_rotated(tmp_path):
+    tracer = Tracer(enabled=True, trace_dir=str(tmp_path), max_bytes=4000, keep_files=2)
+    _run(tracer, 300)
+    tracer.flush()
+
+    files = sorted(f for f in os.listdir(tmp_path) if f.startswith("traces.jsonl"))
+    assert files == ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"]
+    assert all(os.path.getsize(tmp_path / f) < 4000 + 1000 for f in files)
@@ -0,0 +1,212 @@
+import os
+import re
+from typing import List, Dict, Tuple, Optional, Iterable
+
+import numpy as np
+
+BM25_FILENAME = "bm25_index.npz"
+
+# keeps compounds like "deepseek-r1", "2024/1689" or "3.2" together
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compounds are kept whole AND split into their parts."""
+    out: List[str] = []
+    for tok in _TOKEN.findall((text or "").lower()):
+        out.append(tok)
+        if not tok.isalnum():
+            out.extend(p for p in re.split(r"[-./_]", tok) if p)
+    return out
+
+class BM25Index:
+    """
+    Sparse inverted index over the same chunks as the vector store.
+
+    Postings are stored CSR-style (indptr / doc / tf arrays per term), so a query
+    is a handful of array slices plus one np.bincount, with no per-document loop.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        terms: List[str],
+        indptr: np.ndarray,
+        postings_doc: np.ndarray,
+        postings_tf: np.ndarray,
+        doc_len: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.ids = ids
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.terms = terms
+        self.indptr = indptr
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+
+        n = len(ids)
+        df = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_len.mean()) if n else 0.0
+        # per-document length normalisation, precomputed once
+        self._norm = (k1 * (1.0 - b + b * doc_len / avgdl)).astype(np.float32) if n else doc_len.astype(np.float32)
+        self._row: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def build(cls, ids: List[str], texts: Iterable[str]) -> "BM25Index":
+        empty = cls([], [], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32))
+        return empty.updated((), ids, texts)
+
+    def updated(self, remove: Iterable[str], ids: List[str], texts: Iterable[str]) -> "BM25Index":
+        """
+        A new index without the `remove` IDs and with `ids` (re)indexed from
+        `texts`. Postings of every other chunk are carried over as arrays, so
+        only the given texts are tokenized.
+        """
+        added = dict(zip(ids, texts))  # an ID given twice keeps its last text
+        drop = set(remove) | set(added)
+        keep = np.fromiter((cid not in drop for cid in self.ids), dtype=bool, count=len(self.ids))
+        new_row = np.cumsum(keep) - 1  # old doc -> doc in the new index
+        n_kept = int(keep.sum())
+
+        kept = keep[self.postings_doc]
+        old_term = np.repeat(np.arange(len(self.terms), dtype=np.int32), np.diff(self.indptr))[kept]
+        old_doc = new_row[self.postings_doc[kept]].astype(np.int32)
+        old_tf = self.postings_tf[kept]
+
+        vocab = dict(self.vocab)
+        rows: List[List[Tuple[int, int]]] = []
+        doc_len: List[int] = []
+        for text in added.values():
+            toks = tokenize(text)
+            doc_len.append(len(toks))
+            counts: Dict[int, int] = {}
+            for t in toks:
+                ti = vocab.setdefault(t, len(vocab))
+                counts[ti] = counts.get(ti, 0) + 1
+            rows.append(list(counts.items()))
+
+        nnz = sum(len(r) for r in rows)
+        term_of = np.empty(nnz, dtype=np.int32)
+        doc_of = np.empty(nnz, dtype=np.int32)
+        tf_of = np.empty(nnz, dtype=np.float32)
+        k = 0
+        for doc_i, r in enumerate(rows, start=n_kept):
+            for ti, tf in r:
+                term_of[k], doc_of[k], tf_of[k] = ti, doc_i, tf
+                k += 1
+        term_of = np.concatenate([old_term, term_of])
+        doc_of = np.concatenate([old_doc, doc_of])
+        tf_of = np.concatenate([old_tf, tf_of])
+
+        # terms left without postings are dropped; the rest keep their order
+        terms = list(self.terms) + [""] * (len(vocab) - len(self.terms))
+        for t, i in vocab.items():
+            terms[i] = t
+        df = np.bincount(term_of, minlength=len(vocab))
+        live = df > 0
+        term_of = (np.cumsum(live) - 1)[term_of]
+
+        # invert doc -> (term, tf) rows into term -> (doc, tf) postings
+        order = np.argsort(term_of, kind="stable")
+        indptr = np.zeros(int(live.sum()) + 1, dtype=np.int64)
+        np.cumsum(df[live], out=indptr[1:])
+        return type(self)(
+            [cid for cid, alive in zip(self.ids, keep) if alive] + list(added),
+            [t for t, alive in zip(terms, live) if alive],
+            indptr,
+            doc_of[order],
+            tf_of[order],
+            np.concatenate([self.doc_len[keep], np.asarray(doc_len, dtype=np.float32)]),
+            k1=self.k1,
+            b=self.b,
+        )
+
+    def term_idf(self, term: str) -> float:
+        """IDF of a lowercased token; 0.0 for terms the corpus does not contain."""
+        ti = self.vocab.get(term)
+        return float(self.idf[ti]) if ti is not None else 0.0
+
+    def mask(self, ids: Iterable[str]) -> np.ndarray:
+        """Boolean row mask for search(allowed=...): True for the given chunk IDs."""
+        if self._row is None:
+            self._row = {cid: i for i, cid in enumerate(self.ids)}
+        rows = [r for r in (self._row.get(cid) for cid in ids) if r is not None]
+        allowed = np.zeros(len(self.ids), dtype=bool)
+        allowed[rows] = True
+        return allowed
+
+    def search(self, query: str, top_n: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Top BM25 hits; with `allowed` (see mask()) only those chunks can match."""
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not term_ids or not self.ids:
+            return []
+
+        docs, contrib = [], []
+        for ti in term_ids:
+            lo, hi = self.indptr[ti], self.indptr[ti + 1]
+            d = self.postings_doc[lo:hi]
+            tf = self.postings_tf[lo:hi]
+            docs.append(d)
+            contrib.append(self.idf[ti] * tf * (self.k1 + 1.0) / (tf + self._norm[d]))
+        scores = np.bincount(np.concatenate(docs), weights=np.concatenate(contrib), minlength=len(self.ids))
+        if allowed is not None:
+            scores[~allowed] = 0.0
+
+        n = min(top_n, int(np.count_nonzero(scores)))
+        if n == 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def save(self, persist_dir: str) -> None:
+        os.makedirs(persist_dir, exist_ok=True)
+        path = os.path.join(persist_dir, BM25_FILENAME)
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            ids=np.asarray(self.ids, dtype=str),
+            terms=np.asarray(self.terms, dtype=str),
+            indptr=self.indptr,
+            postings_doc=self.postings_doc,
+            postings_tf=self.postings_tf,
+            doc_len=self.doc_len,
+            params=np.asarray([self.k1, self.b], dtype=np.float32),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["BM25Index"]:
+        path = os.path.join(persist_dir, BM25_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as z:
+            k1, b = (float(x) for x in z["params"])
+            return cls(
+                ids=z["ids"].tolist(),
+                terms=z["terms"].tolist(),
+                indptr=z["indptr"],
+                postings_doc=z["postings_doc"],
+                postings_tf=z["postings_tf"],
+                doc_len=z["doc_len"],
+                k1=k1,
+                b=b,
+            )
+
+def build_bm25_from_collection(collection, page_size: int = 5000) -> BM25Index:
+    """(Re)build the sparse index from whatever the collection currently holds."""
+    ids: List[str] = []
+    texts: List[str] = []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        texts.extend(d or "" for d in page["documents"])
+        offset += len(page["ids"])
+    return BM25Index.build(ids, texts)
@@ -1,28 +1,196 @@
-from typing import List, Optional, Dict, Any
-import chromadb
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Callable
 
-def get_or_create_collection(persist_dir: str, collection_name: str, embedding_function):
-    client = chromadb.PersistentClient(path=persist_dir)
+from config.settings import INGEST_BATCH_SIZE
+
+def get_client(persist_dir: str):
+    # imported here so the local backend never loads chromadb (SQLite, server stack)
+    import chromadb
+    return chromadb.PersistentClient(path=persist_dir)
+
+def close_client(client) -> None:
+    # Chroma caches one System (and its sqlite handles) per persist path.
+    # Dropping this client's lets a rebuilt index be picked up by the next
+    # client, without touching the other collections open in this process.
+    identifier = getattr(client, "_identifier", None)
+    if identifier is None:
+        client.clear_system_cache()  # local backend: per-client cache
+        return
+    from chromadb.api.shared_system_client import SharedSystemClient
+    system = SharedSystemClient._identifier_to_system.pop(identifier, None)
+    if system is not None:
+        system.stop()
+
+def get_or_create_collection(persist_dir: str, collection_name: str, embedding_function, client=None):
+    client = client or get_client(persist_dir)
     collection = client.get_or_create_collection(
         name=collection_name,
         embedding_function=embedding_function
     )
     return collection
 
-def add_documents_to_collection(collection, docs: List[Any]):
+def embed_texts(embedding_function, texts: List[str]):
+    # float32 ndarray straight through when the function supports it (Chroma
+    # accepts arrays for add/upsert/query); plain callables still work
+    encode = getattr(embedding_function, "encode", None)
+    return encode(texts) if encode is not None else embedding_function(texts)
+
+# differs between build runs without the chunk itself changing
+_RUN_METADATA = ("ingested_at",)
+
+def _same_metadata(stored: Optional[Dict[str, Any]], new: Dict[str, Any]) -> bool:
+    stored = stored or {}
+    return {k: v for k, v in stored.items() if k not in _RUN_METADATA} == {k: v for k, v in new.items() if k not in _RUN_METADATA}
+
+def _chunk_ids(docs: List[Any], offset: int = 0) -> List[str]:
+    ids = []
+    for i, d in enumerate(docs, start=offset):
+        md = d.metadata or {}
+        # stable content-hashed ID when available; positional fallback otherwise
+        ids.append(md.get("chunk_id") or f"{md.get('source_file','doc')}-{md.get('page', 'na')}-{i}")
+    return ids
+
+class BatchWriter:
+    """
+    Embeds and upserts chunks in fixed-size batches.
+
+    Batch N+1 is embedded on the caller's thread while batch N is written to
+    Chroma on a single background thread. Only one write is ever in flight, so
+    a slow store backpressures embedding instead of queueing batches in memory.
+
+    IDs are content hashes, so with skip_existing=True chunks already committed
+    by an interrupted run are dropped before embedding and the build resumes
+    from the last committed batch (build_index keeps the unfinished version
+    folder for that). A stored chunk whose metadata differs (e.g.
+    its neighbour links moved) is still rewritten.
+    """
+
+    def __init__(
+        self,
+        collection,
+        embedding_function=None,
+        batch_size: int = INGEST_BATCH_SIZE,
+        skip_existing: bool = True,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.collection = collection
+        self.embedding_function = embedding_function
+        self.batch_size = max(1, batch_size)
+        self.skip_existing = skip_existing
+        self.on_progress = on_progress
+
+        self._buffer: List[Any] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chroma-writer")
+        self._pending = None
+        self._offset = 0
+        self._started = time.perf_counter()
+
+        self.submitted = 0   # chunks handed to add()
+        self.committed = 0   # chunks (incl. skipped) known to be durable in the store
+        self.written = 0     # chunks actually embedded + upserted
+        self.written_ids: List[str] = []  # their IDs, for incremental BM25 / metadata index updates
+        self.skipped = 0
+        self.batches = 0
+        self.embed_seconds = 0.0  # caller thread, embedding only
+        self.write_seconds = 0.0  # writer thread, upserts only
+
+    def add(self, docs: List[Any]) -> int:
+        """Queue chunks; returns the running submitted count (use with .committed)."""
+        self._buffer.extend(docs)
+        self.submitted += len(docs)
+        while len(self._buffer) >= self.batch_size:
+            batch = self._buffer[:self.batch_size]
+            self._buffer = self._buffer[self.batch_size:]
+            self._write_batch(batch)
+        return self.submitted
+
+    def flush(self) -> None:
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            self._write_batch(batch)
+        self._wait()
+
+    def close(self) -> None:
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # keep whatever was already committed; drop the rest
+            self._wait()
+            self._executor.shutdown(wait=True)
+
+    @property
+    def chunks_per_sec(self) -> float:
+        elapsed = time.perf_counter() - self._started
+        return self.written / elapsed if elapsed > 0 else 0.0
+
+    def _write_batch(self, batch: List[Any]) -> None:
+        size = len(batch)
+        ids = _chunk_ids(batch, offset=self._offset)
+        self._offset += size
+
+        if self.skip_existing:
+            got = self.collection.get(ids=ids, include=["metadatas"])
+            existing = {cid: md for cid, md in zip(got["ids"], got["metadatas"] or [])}
+            if existing:
+                keep = [j for j, cid in enumerate(ids) if cid not in existing or not _same_metadata(existing[cid], batch[j].metadata or {})]
+                batch = [batch[j] for j in keep]
+                ids = [ids[j] for j in keep]
+
+        texts = [d.page_content for d in batch]
+        metadatas = [dict(d.metadata or {}) for d in batch]
+        t0 = time.perf_counter()
+        embeddings = embed_texts(self.embedding_function, texts) if (self.embedding_function and texts) else None
+        self.embed_seconds += time.perf_counter() - t0
+
+        # backpressure: wait for batch N to land before handing over batch N+1
+        self._wait()
+        self._pending = self._executor.submit(self._upsert, ids, texts, metadatas, embeddings, size)
+
+    def _upsert(self, ids, texts, metadatas, embeddings, size) -> None:
+        t0 = time.perf_counter()
+        if ids:
+            self.collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+        self.write_seconds += time.perf_counter() - t0
+        self.written += len(ids)
+        self.written_ids.extend(ids)
+        self.skipped += size - len(ids)
+        self.committed += size
+        self.batches += 1
+        if self.on_progress:
+            self.on_progress({
+                "batches": self.batches,
+                "written": self.written,
+                "skipped": self.skipped,
+                "committed": self.committed,
+                "submitted": self.submitted,
+                "chunks_per_sec": self.chunks_per_sec,
+            })
+
+    def _wait(self) -> None:
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+def add_documents_to_collection(collection, docs: List[Any], embedding_function=None, batch_size: int = INGEST_BATCH_SIZE, on_progress=None):
     """
     docs are LangChain Documents (or compatible objects) with:
       - page_content
-      - metadata
+      - metadata (ideally carrying a content-hashed "chunk_id")
+    Written in batches of batch_size; upserts, so re-adding a chunk is harmless.
     """
-    texts = [d.page_content for d in docs]
-    metadatas: List[Dict[str, Any]] = []
-    ids: List[str] = []
-
-    for i, d in enumerate(docs):
-        md = dict(d.metadata or {})
-        metadatas.append(md)
-        # unique deterministic IDs
-        ids.append(f"{md.get('source_file','doc')}-{md.get('page', 'na')}-{i}")
+    if not docs:
+        return
+    with BatchWriter(collection, embedding_function, batch_size=batch_size, on_progress=on_progress) as writer:
+        writer.add(docs)
 
-    collection.add(documents=texts, metadatas=metadatas, ids=ids)
+def delete_from_collection(collection, ids: List[str]):
+    if ids:
+        collection.delete(ids=list(ids))
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+_WS = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", text or "").strip()
+
+def _key_matrix(keys: List[bytes]) -> np.ndarray:
+    return np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, 20)
+
+class EmbeddingCache:
+    """
+    Disk-backed cache of embedding vectors keyed by (model name, normalized-text hash).
+
+    Storage is three fixed-capacity memory-mapped arrays in cache_dir/<model>/:
+      vectors.f32  capacity x dim float32
+      keys.bin     capacity x 20 bytes (sha1 of model + normalized text)
+      ticks.i64    capacity int64 last-use counter (LRU, 0 = empty slot)
+    The key of every slot is stored next to its vector, so the in-memory lookup
+    table is rebuilt from disk on open and a slot overwritten by another process
+    is detected on read instead of returning the wrong vector.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dim: int, capacity: int):
+        self.model_name = model_name
+        self.dim = dim
+        self.capacity = max(1, capacity)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.path = os.path.join(cache_dir, safe)
+        os.makedirs(self.path, exist_ok=True)
+
+        meta_path = os.path.join(self.path, "meta.json")
+        meta = {"model_name": model_name, "dim": dim, "capacity": self.capacity}
+        fresh = True
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    fresh = json.load(f) != meta
+            except (OSError, ValueError):
+                fresh = True
+        mode = "w+" if fresh else "r+"
+
+        self._vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+        self._keys = np.memmap(os.path.join(self.path, "keys.bin"), dtype=np.uint8, mode=mode, shape=(self.capacity, 20))
+        self._ticks = np.memmap(os.path.join(self.path, "ticks.i64"), dtype=np.int64, mode=mode, shape=(self.capacity,))
+        if fresh:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+        self._lock = threading.Lock()
+        self._slots: Dict[bytes, int] = {}
+        for slot in np.flatnonzero(self._ticks > 0):
+            self._slots[self._keys[slot].tobytes()] = int(slot)
+        self._free = [int(s) for s in np.flatnonzero(self._ticks == 0)[::-1]]
+        self._tick = int(self._ticks.max()) if len(self._slots) else 0
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha1(f"{self.model_name}\x00{normalize_text(text)}".encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """Returns (vectors, missing positions). Rows at missing positions are zeros."""
+        keys = [self.key(t) for t in texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing: List[int] = []
+        with self._lock:
+            pos, slots = [], []
+            for i, k in enumerate(keys):
+                slot = self._slots.get(k)
+                if slot is None:
+                    missing.append(i)
+                else:
+                    pos.append(i)
+                    slots.append(slot)
+            if slots:
+                slots_arr = np.asarray(slots)
+                valid = (self._keys[slots_arr] == _key_matrix([keys[i] for i in pos])).all(axis=1)
+                for i, slot, ok in zip(pos, slots, valid):
+                    if not ok:
+                        self._slots.pop(keys[i], None)
+                        missing.append(i)
+                good = slots_arr[valid]
+                out[np.asarray(pos)[valid]] = self._vectors[good]
+                self._tick += 1
+                self._ticks[good] = self._tick
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        missing.sort()
+        return out, missing
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        keys = list(dict.fromkeys(self.key(t) for t in texts))
+        if len(keys) != len(texts):
+            # duplicate texts in one call: keep the first vector per key
+            first = {}
+            for i, t in enumerate(texts):
+                first.setdefault(self.key(t), i)
+            vectors = vectors[[first[k] for k in keys]]
+        keys = keys[-self.capacity:]
+        vectors = vectors[-self.capacity:]
+
+        with self._lock:
+            new = [(k, v) for k, v in zip(keys, vectors) if k not in self._slots]
+            if not new:
+                return
+            slots = self._allocate(len(new))
+            self._tick += 1
+            for slot, (k, _) in zip(slots, new):
+                self._slots[k] = slot
+            idx = np.asarray(slots)
+            self._vectors[idx] = np.asarray([v for _, v in new], dtype=np.float32)
+            self._keys[idx] = _key_matrix([k for k, _ in new])
+            self._ticks[idx] = self._tick
+
+    def _allocate(self, n: int) -> List[int]:
+        slots = []
+        while self._free and len(slots) < n:
+            slots.append(self._free.pop())
+        need = n - len(slots)
+        if need > 0:
+            # evict the least recently used slots in one vectorized pass
+            ticks = np.array(self._ticks)
+            ticks[slots] = np.iinfo(np.int64).max
+            victims = np.argpartition(ticks, need - 1)[:need]
+            for slot in victims:
+                self._slots.pop(self._keys[slot].tobytes(), None)
+                slots.append(int(slot))
+            self.evictions += need
+        return slots
+
+    def save(self) -> None:
+        with self._lock:
+            self._vectors.flush()
+            self._keys.flush()
+            self._ticks.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "evictions": self.evictions,
+        }
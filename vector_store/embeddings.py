@@ -1,16 +1,112 @@
+import atexit
+import re
+import zlib
 from sentence_transformers import SentenceTransformer
-from typing import List
+from typing import List, Optional
 import numpy as np
 
+from config.settings import EMBED_PROVIDER, EMBED_MODEL, EMBED_BATCH_SIZE, EMBED_NORMALIZE, EMBED_CACHE, EMBED_CACHE_DIR, EMBED_CACHE_SIZE
+from vector_store.embedding_cache import EmbeddingCache
+
 class STEmbeddingFunction:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    """
+    encode() is the native path: it returns one contiguous (n, dim) float32 array
+    that is handed as-is to the cache, the vector store and the retriever.
+    __call__ exists for Chroma's EmbeddingFunction contract, which wants lists.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBED_MODEL,
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = EMBED_BATCH_SIZE,
+        normalize: bool = EMBED_NORMALIZE,
+    ):
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self.cache = cache
+        self.batch_size = batch_size
+        self.normalize = normalize
+
+    @property
+    def cache_key(self) -> str:
+        # normalized and raw vectors must not share cache entries
+        return f"{self.model_name}#norm" if self.normalize else self.model_name
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        emb = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize,
+        )
+        return np.ascontiguousarray(emb, dtype=np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self.cache is None or not texts:
+            return self._encode(texts)
+
+        # cache hits skip the model entirely; only unique misses are encoded
+        vectors, missing = self.cache.get_many(texts)
+        if missing:
+            todo = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = self._encode(todo)
+            self.cache.put_many(todo, fresh)
+            row = {t: j for j, t in enumerate(todo)}
+            for i in missing:
+                vectors[i] = fresh[row[texts[i]]]
+        return vectors
 
     def __call__(self, input: List[str]) -> List[List[float]]: 
-        embeddings = self.model.encode(input, show_progress_bar=False)
-        if isinstance(embeddings, np.ndarray):
-            return embeddings.tolist()
-        return [e.tolist() for e in embeddings]
+        return self.encode(input).tolist()
+
+class HashingEmbeddingFunction:
+    """
+    Offline stand-in for the sentence-transformer: signed feature hashing of word
+    unigrams + bigrams. Deterministic and model-free, so benchmarks and tests run
+    without downloading weights; lexical overlap still drives similarity.
+    """
+
+    def __init__(self, dim: int = 384, normalize: bool = EMBED_NORMALIZE):
+        self.dim = dim
+        self.normalize = normalize
+        self.model_name = f"hash-{dim}"
+        self.cache = None
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.model_name}#norm" if self.normalize else self.model_name
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            words = re.findall(r"\w+", (text or "").lower())
+            for f in words + [a + " " + b for a, b in zip(words, words[1:])]:
+                h = zlib.crc32(f.encode("utf-8"))
+                out[i, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        if self.normalize:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.encode(input).tolist()
 
 def get_embedding_function():
-    return STEmbeddingFunction()
+    if EMBED_PROVIDER == "hash":
+        return HashingEmbeddingFunction()
+
+    fn = STEmbeddingFunction()
+    if EMBED_CACHE:
+        fn.cache = EmbeddingCache(
+            cache_dir=EMBED_CACHE_DIR,
+            model_name=fn.cache_key,
+            dim=fn.model.get_sentence_embedding_dimension(),
+            capacity=EMBED_CACHE_SIZE,
+        )
+        atexit.register(fn.cache.save)
+    return fn
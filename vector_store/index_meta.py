@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+INDEX_META_NAME = "index_meta.json"
+
+# Versioned layout under the index root (CHROMA_DIR):
+#   versions/<index_version>/   one complete index each (store, BM25, manifest, index_meta.json)
+#   CURRENT                     name of the version queries are served from
+#   PREVIOUS                    the version CURRENT pointed at before the last swap
+#   index_meta.json             current version + a history of builds
+# A root without CURRENT is a pre-versioning index stored in the root itself.
+VERSIONS_DIR = "versions"
+CURRENT_NAME = "CURRENT"
+PREVIOUS_NAME = "PREVIOUS"
+BUILD_HISTORY = 20
+# A version folder holding this file is a build that has not completed. It is
+# never served; the next build resumes into it while the version it started
+# from is still CURRENT, and pruning deletes it only once that has changed.
+INCOMPLETE_NAME = "BUILD_INCOMPLETE"
+
+# Extra collections live next to the default one, each with its own versioned root:
+#   <CHROMA_DIR>/collections/<name>/{versions/, CURRENT, index_meta.json}
+COLLECTIONS_DIR = "collections"
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{1,61}[A-Za-z0-9]$")  # Chroma's rule, minus dots
+
+def collection_root(name: str, base: str, default_name: str) -> str:
+    """Index root of a collection; the default collection keeps the base folder itself."""
+    if name == default_name:
+        return base
+    if not _COLLECTION_NAME.match(name or ""):
+        raise ValueError(f"Invalid collection name {name!r}: 3-63 letters, digits, '_' or '-'")
+    return os.path.join(base, COLLECTIONS_DIR, name)
+
+def list_collections(base: str, default_name: str) -> List[str]:
+    """Collections with a built index under base (the default one first)."""
+    names = [default_name] if index_ready(base) else []
+    extra = os.path.join(base, COLLECTIONS_DIR)
+    if os.path.isdir(extra):
+        names += [n for n in sorted(os.listdir(extra)) if _COLLECTION_NAME.match(n) and index_ready(os.path.join(extra, n))]
+    return names
+
+def read_index_meta(persist_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(persist_dir, INDEX_META_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def update_index_meta(persist_dir: str, **fields: Any) -> Dict[str, Any]:
+    """Merge fields into index_meta.json (written atomically) and return the result."""
+    os.makedirs(persist_dir, exist_ok=True)
+    meta = read_index_meta(persist_dir) or {}
+    meta.update(fields)
+    _write_atomic(os.path.join(persist_dir, INDEX_META_NAME), json.dumps(meta, indent=2))
+    return meta
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def version_dir(root: str, version: str) -> str:
+    return os.path.join(root, VERSIONS_DIR, version)
+
+def _read_pointer(root: str, name: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def current_version(root: str) -> Optional[str]:
+    return _read_pointer(root, CURRENT_NAME)
+
+def previous_version(root: str) -> Optional[str]:
+    """The version served before the last swap; engines that have not re-read CURRENT yet may still be on it."""
+    return _read_pointer(root, PREVIOUS_NAME)
+
+def active_index_dir(root: str) -> str:
+    """Folder holding the index queries should use: the CURRENT version, or the root itself."""
+    version = current_version(root)
+    return version_dir(root, version) if version else root
+
+def index_ready(root: str) -> bool:
+    active = active_index_dir(root)
+    if active == root:
+        return os.path.isdir(root) and any(n not in (VERSIONS_DIR, COLLECTIONS_DIR, INDEX_META_NAME) for n in os.listdir(root))
+    return os.path.isdir(active)
+
+def swap_current(root: str, version: str) -> None:
+    """Atomically points CURRENT at a fully built version; readers see the old or the new one, never neither."""
+    old = current_version(root)
+    if old and old != version:
+        _write_atomic(os.path.join(root, PREVIOUS_NAME), old + "\n")
+    _write_atomic(os.path.join(root, CURRENT_NAME), version + "\n")
+
+def record_build(root: str, build: Dict[str, Any]) -> Dict[str, Any]:
+    """Appends a build record to the root index_meta.json (newest last) and mirrors the current version."""
+    meta = read_index_meta(root) or {}
+    meta["builds"] = (meta.get("builds") or [])[-(BUILD_HISTORY - 1):] + [build]
+    version = current_version(root)
+    if version:
+        meta["current_version"] = version
+        meta["index_version"] = version
+    if build.get("success"):
+        meta["built_at_utc"] = build.get("finished_at_utc")
+    os.makedirs(root, exist_ok=True)
+    _write_atomic(os.path.join(root, INDEX_META_NAME), json.dumps(meta, indent=2))
+    return meta
+
+def mark_incomplete(persist_dir: str, **info: Any) -> None:
+    """Flags a version folder as an unfinished build (info: base_version, mode, ...), owned by this process unless pid=None."""
+    os.makedirs(persist_dir, exist_ok=True)
+    info = {"pid": os.getpid(), **info}
+    _write_atomic(os.path.join(persist_dir, INCOMPLETE_NAME), json.dumps(info, indent=2))
+
+def read_incomplete(persist_dir: str) -> Optional[Dict[str, Any]]:
+    """The mark_incomplete() info of an unfinished build; None for a completed version."""
+    path = os.path.join(persist_dir, INCOMPLETE_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def clear_incomplete(persist_dir: str) -> None:
+    try:
+        os.remove(os.path.join(persist_dir, INCOMPLETE_NAME))
+    except FileNotFoundError:
+        pass
+
+def _pid_alive(pid: Any) -> bool:
+    if not isinstance(pid, int) or pid <= 0:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+def _resumable(info: Optional[Dict[str, Any]], current: Optional[str]) -> bool:
+    return info is not None and info.get("base_version") == current
+
+def resumable_version(root: str) -> Optional[str]:
+    """Newest unfinished build that started from the version still CURRENT and whose process has exited."""
+    base = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(base):
+        return None
+    current = current_version(root)
+    for v in sorted(os.listdir(base), reverse=True):
+        info = read_incomplete(os.path.join(base, v))
+        if _resumable(info, current) and not _pid_alive(info.get("pid")):
+            return v
+    return None
+
+def discard_incomplete(root: str) -> List[str]:
+    """Deletes every unfinished build whose process has exited (build_index --discard-incomplete)."""
+    base = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(base):
+        return []
+    removed = []
+    for v in sorted(os.listdir(base)):
+        info = read_incomplete(os.path.join(base, v))
+        if info is not None and not _pid_alive(info.get("pid")):
+            shutil.rmtree(os.path.join(base, v), ignore_errors=True)
+            removed.append(v)
+    return removed
+
+def prune_versions(root: str, keep: int) -> List[str]:
+    """
+    Deletes all but the newest `keep` completed versions. CURRENT and the
+    version it replaced are never deleted (queries already running, and
+    engines that have not seen the swap yet, still read the latter), nor is an
+    unfinished build that can still be resumed (or is still running);
+    unfinished builds that started from an older version are.
+    """
+    base = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(base):
+        return []
+    current = current_version(root)
+    protected = {current, previous_version(root)}
+    complete, removed = [], []
+    for v in sorted(os.listdir(base)):  # versions sort by creation time
+        info = read_incomplete(os.path.join(base, v))
+        if info is None:
+            complete.append(v)
+        elif v != current and not _resumable(info, current) and not _pid_alive(info.get("pid")):
+            shutil.rmtree(os.path.join(base, v), ignore_errors=True)
+            removed.append(v)
+    for v in complete[:-max(1, keep)]:
+        if v not in protected:
+            shutil.rmtree(os.path.join(base, v), ignore_errors=True)
+            removed.append(v)
+    return sorted(removed)
+
+def new_index_version() -> str:
+    # sortable by time, unique across concurrent builds
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:8]
+
+class IndexVersionWatcher:
+    """Cheap per-query check of the index version: re-reads the file only when its mtime changes."""
+
+    def __init__(self, persist_dir: str):
+        self.path = os.path.join(persist_dir, INDEX_META_NAME)
+        self.persist_dir = persist_dir
+        self._mtime = None
+        self._version = None
+
+    def current(self) -> Optional[str]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            meta = read_index_meta(self.persist_dir) or {}
+            self._version = meta.get("index_version")
+            self._mtime = mtime
+        return self._version
+
+class IndexPointer:
+    """Cheap per-query check of which version folder is live: re-reads CURRENT only when its mtime changes."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, CURRENT_NAME)
+        self._mtime = None
+        self._dir = active_index_dir(root)
+
+    def active_dir(self) -> str:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self._dir = active_index_dir(self.root)
+            self._mtime = mtime
+        return self._dir
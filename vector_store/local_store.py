@@ -0,0 +1,567 @@
+import json
+import os
+import shutil
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from config.settings import (
+    LOCAL_IVF_MIN_ROWS, LOCAL_IVF_NLIST, LOCAL_IVF_NPROBE,
+    VECTOR_QUANTIZATION, VECTOR_PCA_DIM, VECTOR_PQ_SUBSPACES, VECTOR_RESCORE_FACTOR,
+)
+from vector_store.quantization import QUANTIZATION_MODES, VectorQuantizer
+
+LOCAL_DIRNAME = "local_index"
+
+_BLOCK_ROWS = 65536  # rows scored per block in brute-force search
+_CODE_BLOCK_ROWS = 4096  # rows per block in the coarse pass over compressed codes
+_QUANT_TRAIN_ROWS = 10000  # sample the PCA / quantizer is fitted on
+
+class LocalCollection:
+    """
+    In-process vector collection with the subset of Chroma's Collection API the
+    pipeline uses (count / get / query / upsert / delete), on plain files:
+
+      vectors.f32   float32 (n, dim) matrix, opened with np.memmap (read-only)
+      norms.f32     squared L2 norm per row, so distances need no full pass
+      records.jsonl {"document", "metadata"} per row + offsets.i64 for random access
+      ids.txt       one ID per row; a row exists once its ID line is written
+      deleted.i64   tombstoned rows (deleted or replaced by a later upsert)
+      ivf_*.npy     optional IVF index (k-means centroids + per-list row IDs)
+      quant_*       optional compressed codes (int8 / PQ, optionally after PCA)
+
+    Everything is append-only between optimize() calls, which compacts away dead
+    rows and (re)builds the IVF index once the collection is large enough.
+    Small collections are searched exactly (blocked brute force); large ones
+    probe the nearest IVF lists, plus an exact scan of rows appended since the
+    index was built. With quantization on, the coarse pass scores the compact
+    codes instead and only the best top_k * rescore_factor rows are rescored
+    against the float vectors, so most of vectors.f32 is never paged in.
+    Readers in several processes share the OS page cache of the memory-mapped
+    files instead of each holding a copy.
+    Distances are squared L2, like Chroma's default space.
+    """
+
+    def __init__(self, path: str, name: str, embedding_function=None, nprobe: int = LOCAL_IVF_NPROBE, rescore_factor: int = VECTOR_RESCORE_FACTOR):
+        self.path = path
+        self.name = name
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # ---------- Files ----------
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> None:
+        meta_path = self._file("meta.json")
+        self.meta: Dict[str, Any] = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        self.dim: Optional[int] = self.meta.get("dim")
+
+        ids: List[str] = []
+        if os.path.exists(self._file("ids.txt")):
+            with open(self._file("ids.txt"), "r", encoding="utf-8") as f:
+                ids = f.read().split("\n")[:-1]
+        # a torn append leaves more vectors/records than IDs; the extra rows are ignored
+        self._ids = ids
+        self._alive = np.ones(len(ids), dtype=bool)
+        if os.path.exists(self._file("deleted.i64")):
+            dead = np.fromfile(self._file("deleted.i64"), dtype=np.int64)
+            self._alive[dead[dead < len(ids)]] = False
+        self._row: Dict[str, int] = {cid: i for i, cid in enumerate(ids) if self._alive[i]}
+
+        self._offsets = np.fromfile(self._file("offsets.i64"), dtype=np.int64) if os.path.exists(self._file("offsets.i64")) else np.zeros(0, dtype=np.int64)
+        self._vectors: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+
+        self._ivf = None
+        ivf = self.meta.get("ivf")
+        if ivf and os.path.exists(self._file("ivf_centroids.npy")):
+            self._ivf = {
+                "rows_indexed": int(ivf["rows_indexed"]),
+                "centroids": np.load(self._file("ivf_centroids.npy")),
+                "indptr": np.load(self._file("ivf_indptr.npy")),
+                "rows": np.load(self._file("ivf_rows.npy"), mmap_mode="r"),
+            }
+
+        self._quant = None
+        quant = self.meta.get("quant")
+        if quant and os.path.exists(self._file("quant_codes.npy")):
+            with np.load(self._file("quant_params.npz"), allow_pickle=False) as z:
+                quantizer = VectorQuantizer.from_arrays(z)
+            self._quant = self._open_quant(int(quant["rows"]), quantizer)
+
+    def _save_meta(self) -> None:
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(vectors, norms) for the committed rows, memory-mapped read-only."""
+        n = len(self._ids)
+        if self._vectors is None or self._vectors.shape[0] != n:
+            if n == 0 or self.dim is None:
+                self._vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+                self._norms = np.zeros(0, dtype=np.float32)
+            else:
+                self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(n, self.dim))
+                self._norms = np.memmap(self._file("norms.f32"), dtype=np.float32, mode="r", shape=(n,))
+        return self._vectors, self._norms
+
+    def _records(self, rows: List[int]) -> List[Dict[str, Any]]:
+        out = []
+        if not rows:
+            return out
+        with open(self._file("records.jsonl"), "rb") as f:
+            for r in rows:
+                f.seek(int(self._offsets[r]))
+                out.append(json.loads(f.readline()))
+        return out
+
+    # ---------- Chroma-compatible API ----------
+    def count(self) -> int:
+        return len(self._row)
+
+    def upsert(self, ids: List[str], documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None, embeddings=None) -> None:
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self._embed(documents or [])
+        vecs = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vecs.shape[1])
+                self.meta["dim"] = self.dim
+                self._save_meta()
+            elif vecs.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vecs.shape[1]} does not match collection dimensionality {self.dim}")
+
+            # last occurrence wins within a batch; earlier live rows become tombstones
+            last = {cid: j for j, cid in enumerate(ids)}
+            keep = sorted(last.values())
+            dead = [self._row[ids[j]] for j in keep if ids[j] in self._row]
+
+            start = len(self._ids)
+            records_path = self._file("records.jsonl")
+            self._own(records_path)
+            with open(records_path, "ab") as f:
+                # rows of an interrupted append (no ID line) are overwritten
+                if start < len(self._offsets):
+                    pos = int(self._offsets[start])
+                    f.truncate(pos)
+                else:
+                    pos = os.path.getsize(records_path)
+                offsets = []
+                for j in keep:
+                    line = json.dumps({"document": documents[j], "metadata": metadatas[j]}, ensure_ascii=False).encode("utf-8") + b"\n"
+                    offsets.append(pos)
+                    f.write(line)
+                    pos += len(line)
+            self._append(self._file("offsets.i64"), np.asarray(offsets, dtype=np.int64), start)
+            kept = vecs[keep]
+            self._append(self._file("vectors.f32"), kept, start)
+            self._append(self._file("norms.f32"), np.einsum("ij,ij->i", kept, kept).astype(np.float32), start)
+
+            # the IDs line commits the rows; replaced rows are tombstoned only after that
+            self._own(self._file("ids.txt"))
+            with open(self._file("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(ids[j] + "\n" for j in keep))
+
+            self._offsets = np.concatenate([self._offsets[:start], np.asarray(offsets, dtype=np.int64)])
+            self._alive = np.concatenate([self._alive, np.ones(len(keep), dtype=bool)])
+            for k, j in enumerate(keep):
+                self._ids.append(ids[j])
+                self._row[ids[j]] = start + k
+            if dead:
+                self._mark_dead(dead)
+
+    def add(self, ids: List[str], documents=None, metadatas=None, embeddings=None) -> None:
+        self.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            rows = [self._row.pop(cid) for cid in ids if cid in self._row]
+            if rows:
+                self._mark_dead(rows)
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] if include is None else list(include)
+        with self._lock:
+            if ids is not None:
+                rows = [self._row[cid] for cid in ids if cid in self._row]
+            else:
+                rows = np.flatnonzero(self._alive).tolist()
+                start = offset or 0
+                rows = rows[start:start + limit] if limit is not None else rows[start:]
+            return self._result(rows, include)
+
+    def query(self, query_embeddings=None, query_texts: Optional[List[str]] = None, n_results: int = 10, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = ["documents", "metadatas", "distances"] if include is None else list(include)
+        if query_embeddings is None:
+            query_embeddings = self._embed(query_texts or [])
+        q = np.ascontiguousarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim or np.shape(query_embeddings)[-1])
+
+        # no lock: searches only read, and serving processes never write
+        hits = [self._search(q[i], n_results) for i in range(q.shape[0])]
+        out: Dict[str, Any] = {"ids": [], "distances": [] if "distances" in include else None, "included": include}
+        for key in ("documents", "metadatas", "embeddings"):
+            out[key] = [] if key in include else None
+        for rows, dists in hits:
+            res = self._result(rows.tolist(), include)
+            out["ids"].append(res["ids"])
+            if out["distances"] is not None:
+                out["distances"].append(dists.tolist())
+            for key in ("documents", "metadatas", "embeddings"):
+                if out[key] is not None:
+                    out[key].append(res[key])
+        return out
+
+    # ---------- Search ----------
+    def _embed(self, texts: List[str]):
+        if self.embedding_function is None:
+            raise ValueError("No embedding function: pass embeddings / query_embeddings")
+        encode = getattr(self.embedding_function, "encode", None)
+        return encode(texts) if encode is not None else self.embedding_function(texts)
+
+    @staticmethod
+    def _top(rows: np.ndarray, dists: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(rows) > k:
+            part = np.argpartition(dists, k - 1)[:k]
+            rows, dists = rows[part], dists[part]
+        order = np.argsort(dists, kind="stable")
+        return rows[order], dists[order]
+
+    def _score(self, rows: np.ndarray, q: np.ndarray, qn: float) -> np.ndarray:
+        vectors, norms = self._matrix()
+        block = vectors[rows]
+        return np.maximum(norms[rows] - 2.0 * (block @ q) + qn, 0.0)
+
+    def _search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(self._ids)
+        k = min(k, len(self._row))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        qn = float(q @ q)
+
+        if self._ivf is not None and self._ivf["rows_indexed"] <= n:
+            ivf = self._ivf
+            cd = ((ivf["centroids"] - q) ** 2).sum(axis=1)
+            probes = np.argsort(cd)[:self.nprobe]
+            parts = [np.asarray(ivf["rows"][ivf["indptr"][c]:ivf["indptr"][c + 1]]) for c in probes]
+            parts.append(np.arange(ivf["rows_indexed"], n, dtype=np.int64))  # appended since the build
+            cand = np.concatenate(parts).astype(np.int64)
+            cand = np.sort(cand[self._alive[cand]])  # sorted rows read the memmap sequentially
+            if len(cand) >= k:
+                if self._quant is not None and self._quant["rows"] <= n:
+                    return self._search_quantized(q, k, qn, cand)
+                return self._top(cand, self._score(cand, q, qn), k)
+            # too few candidates (tiny lists / many deletions): fall through to exact search
+
+        if self._quant is not None and self._quant["rows"] <= n:
+            return self._search_quantized(q, k, qn, None)
+
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_d = np.zeros(0, dtype=np.float32)
+        vectors, norms = self._matrix()
+        for s in range(0, n, _BLOCK_ROWS):
+            e = min(n, s + _BLOCK_ROWS)
+            d = np.maximum(norms[s:e] - 2.0 * (vectors[s:e] @ q) + qn, 0.0)
+            d[~self._alive[s:e]] = np.inf
+            rows, d = self._top(np.arange(s, e, dtype=np.int64), d, k)
+            best_rows, best_d = self._top(np.concatenate([best_rows, rows]), np.concatenate([best_d, d]), k)
+        live = np.isfinite(best_d)
+        return best_rows[live], best_d[live]
+
+    def _search_quantized(self, q: np.ndarray, k: int, qn: float, cand: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Coarse pass over the codes of `cand` (None: every row), exact float distances for the shortlist."""
+        quant = self._quant
+        quantizer, codes, code_norms, coded = quant["quantizer"], quant["codes"], quant["norms"], quant["rows"]
+        n = len(self._ids)
+        state = quantizer.prepare(q)
+        shortlist = k * self.rescore_factor
+
+        if cand is None:
+            best_rows = np.zeros(0, dtype=np.int64)
+            best_d = np.zeros(0, dtype=np.float32)
+            for s in range(0, coded, _CODE_BLOCK_ROWS):
+                e = min(coded, s + _CODE_BLOCK_ROWS)
+                d = quantizer.distances(state, np.asarray(codes[s:e]), code_norms[s:e] if code_norms is not None else None)
+                d[~self._alive[s:e]] = np.inf
+                rows, d = self._top(np.arange(s, e, dtype=np.int64), d, shortlist)
+                best_rows, best_d = self._top(np.concatenate([best_rows, rows]), np.concatenate([best_d, d]), shortlist)
+            coarse = best_rows[np.isfinite(best_d)]
+            tail = np.arange(coded, n, dtype=np.int64)
+            tail = tail[self._alive[coded:n]]
+        else:
+            in_codes = cand[cand < coded]
+            d = quantizer.distances(state, np.asarray(codes[in_codes]), code_norms[in_codes] if code_norms is not None else None)
+            coarse, _ = self._top(in_codes, d, shortlist)
+            tail = cand[cand >= coded]
+
+        # rows appended since the codes were built have no code: they go straight to rescoring
+        rows = np.sort(np.concatenate([coarse, tail]))
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return self._top(rows, self._score(rows, q, qn), k)
+
+    def _result(self, rows: List[int], include: List[str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"ids": [self._ids[r] for r in rows], "included": include}
+        records = self._records(rows) if ("documents" in include or "metadatas" in include) else None
+        out["documents"] = [r["document"] for r in records] if "documents" in include else None
+        out["metadatas"] = [r["metadata"] for r in records] if "metadatas" in include else None
+        if "embeddings" in include:
+            vectors, _ = self._matrix()
+            out["embeddings"] = vectors[rows] if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+        else:
+            out["embeddings"] = None
+        return out
+
+    # ---------- Maintenance ----------
+    @staticmethod
+    def _own(path: str) -> None:
+        # a new index version starts as hard links to the previous one's files
+        # (vector_store.store.clone_index): copy a shared file before writing into it
+        try:
+            if os.stat(path).st_nlink < 2:
+                return
+        except FileNotFoundError:
+            return
+        shutil.copy2(path, path + ".own.tmp")
+        os.replace(path + ".own.tmp", path)
+
+    @classmethod
+    def _append(cls, path: str, arr: np.ndarray, start_row: int) -> None:
+        # rows past start_row are leftovers of an interrupted append: overwrite them
+        row_bytes = arr.itemsize * (arr.shape[1] if arr.ndim == 2 else 1)
+        cls._own(path)
+        with open(path, "ab") as f:
+            f.truncate(start_row * row_bytes)
+            f.write(np.ascontiguousarray(arr).tobytes())
+
+    def _mark_dead(self, rows: List[int]) -> None:
+        self._alive[rows] = False
+        self._own(self._file("deleted.i64"))
+        with open(self._file("deleted.i64"), "ab") as f:
+            f.write(np.asarray(rows, dtype=np.int64).tobytes())
+
+    # ---------- Quantization ----------
+    @property
+    def quantization(self) -> Dict[str, Any]:
+        """This collection's compression settings (the VECTOR_* defaults until set_quantization())."""
+        return self.meta.get("quantization") or {"mode": VECTOR_QUANTIZATION, "pca_dim": VECTOR_PCA_DIM, "pq_m": VECTOR_PQ_SUBSPACES}
+
+    def set_quantization(self, mode: Optional[str] = None, pca_dim: Optional[int] = None, pq_m: Optional[int] = None) -> None:
+        """
+        Change how this collection's vectors are compressed (None keeps the current
+        value). The codes are (re)built by the next optimize().
+        """
+        config = dict(self.quantization)
+        for key, value in (("mode", mode), ("pca_dim", pca_dim), ("pq_m", pq_m)):
+            if value is not None:
+                config[key] = value
+        if config["mode"] not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode {config['mode']!r}; expected one of {', '.join(QUANTIZATION_MODES)}")
+        with self._lock:
+            if config != self.meta.get("quantization"):
+                self.meta["quantization"] = config
+                self._drop_quant()  # also saves meta
+
+    def quantization_stats(self) -> Dict[str, Any]:
+        """Mode and memory of the compressed codes next to the float32 vectors they stand in for."""
+        n = len(self._ids)
+        float_bytes = 4 * (self.dim or 0)
+        code_bytes = 0
+        if self._quant is not None:
+            # int8 also keeps one float32 norm per row
+            code_bytes = self._quant["quantizer"].code_size + (4 if self._quant["norms"] is not None else 0)
+        return {
+            **self.quantization,
+            "rows_coded": self._quant["rows"] if self._quant is not None else 0,
+            "code_bytes_per_vector": code_bytes,
+            "float_bytes_per_vector": float_bytes,
+            "codes_mb": round(code_bytes * n / 1e6, 2),
+            "vectors_mb": round(float_bytes * n / 1e6, 2),
+        }
+
+    def _build_quant(self, seed: int = 0) -> None:
+        config = self.quantization
+        vectors, _ = self._matrix()
+        n = vectors.shape[0]
+        if self._quant is not None and self._quant["rows"] < n <= 2 * self._quant["rows"]:
+            # rows were only appended: encode them with the fitted quantizer
+            # (refitted from scratch once the collection has doubled)
+            quantizer, start = self._quant["quantizer"], self._quant["rows"]
+            parts = [np.asarray(self._quant["codes"])]
+        else:
+            rng = np.random.default_rng(seed)
+            train = np.asarray(vectors[np.sort(rng.choice(n, size=min(n, _QUANT_TRAIN_ROWS), replace=False))])
+            quantizer = VectorQuantizer(config["mode"], int(config.get("pca_dim") or 0), int(config.get("pq_m") or 0)).fit(train, seed=seed)
+            start, parts = 0, []
+        parts += [quantizer.encode(vectors[s:min(n, s + _BLOCK_ROWS)]) for s in range(start, n, _BLOCK_ROWS)]
+        codes = np.concatenate(parts)
+        code_norms = quantizer.code_norms(codes)
+
+        # write + rename: serving processes may have the old codes memory-mapped
+        arrays = {"quant_codes": codes, "quant_norms": code_norms}
+        for name, arr in arrays.items():
+            if arr is not None:
+                np.save(self._file(name + ".tmp.npy"), arr)
+                os.replace(self._file(name + ".tmp.npy"), self._file(name + ".npy"))
+            elif os.path.exists(self._file(name + ".npy")):
+                os.remove(self._file(name + ".npy"))
+        np.savez(self._file("quant_params.tmp.npz"), **quantizer.to_arrays())
+        os.replace(self._file("quant_params.tmp.npz"), self._file("quant_params.npz"))
+        self.meta["quant"] = {"rows": n, "code_bytes": quantizer.code_size}
+        self._save_meta()
+        self._quant = self._open_quant(n, quantizer)
+
+    def _open_quant(self, rows: int, quantizer: VectorQuantizer) -> Dict[str, Any]:
+        norms_path = self._file("quant_norms.npy")
+        return {
+            "rows": rows,
+            "quantizer": quantizer,
+            "codes": np.load(self._file("quant_codes.npy"), mmap_mode="r"),
+            # int8 only: the per-row part of the distance, so the coarse pass needs no decoded copy
+            "norms": np.load(norms_path, mmap_mode="r") if os.path.exists(norms_path) else None,
+        }
+
+    def _drop_quant(self) -> None:
+        self._quant = None
+        self.meta.pop("quant", None)
+        self._save_meta()
+        for name in ("quant_params.npz", "quant_codes.npy", "quant_norms.npy"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+
+    # ---------- Optimize ----------
+    def optimize(self, ivf_min_rows: int = LOCAL_IVF_MIN_ROWS, nlist: int = LOCAL_IVF_NLIST) -> None:
+        """
+        Compact dead rows away; build the IVF index when the collection is large
+        enough, and the compressed codes when quantization is on.
+        """
+        with self._lock:
+            if not self._alive.all():
+                self._compact()
+            n = len(self._ids)
+            if n >= max(1, ivf_min_rows):
+                if self._ivf is None or self._ivf["rows_indexed"] != n:
+                    self._build_ivf(nlist or int(4 * np.sqrt(n)))
+            elif self._ivf is not None:
+                self._drop_ivf()
+            if self.quantization["mode"] != "none" and n:
+                if self._quant is None or self._quant["rows"] != n:
+                    self._build_quant()
+            elif self._quant is not None:
+                self._drop_quant()
+
+    def _compact(self) -> None:
+        rows = np.flatnonzero(self._alive)
+        vectors, norms = self._matrix()
+        records = self._records(rows.tolist())
+        ids = [self._ids[r] for r in rows]
+
+        offsets, pos = [], 0
+        with open(self._file("records.jsonl.tmp"), "wb") as f:
+            for rec in records:
+                line = json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n"
+                offsets.append(pos)
+                f.write(line)
+                pos += len(line)
+        np.ascontiguousarray(vectors[rows]).tofile(self._file("vectors.f32.tmp"))
+        np.ascontiguousarray(norms[rows]).tofile(self._file("norms.f32.tmp"))
+        np.asarray(offsets, dtype=np.int64).tofile(self._file("offsets.i64.tmp"))
+        with open(self._file("ids.txt.tmp"), "w", encoding="utf-8") as f:
+            f.write("".join(cid + "\n" for cid in ids))
+
+        # open memmaps keep the old inodes alive, so concurrent readers are unaffected
+        self._vectors = self._norms = None
+        for name in ("records.jsonl", "vectors.f32", "norms.f32", "offsets.i64", "ids.txt"):
+            os.replace(self._file(name + ".tmp"), self._file(name))
+        if os.path.exists(self._file("deleted.i64")):
+            os.remove(self._file("deleted.i64"))
+        self._drop_ivf()
+        self._drop_quant()  # row numbers changed
+        self._load()
+
+    def _build_ivf(self, nlist: int, iters: int = 10, sample: int = 64, seed: int = 0) -> None:
+        vectors, _ = self._matrix()
+        n = vectors.shape[0]
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(seed)
+
+        # k-means on a sample, then one assignment pass over all rows
+        train = np.asarray(vectors[np.sort(rng.choice(n, size=min(n, nlist * sample), replace=False))])
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = self._assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            counts = np.bincount(assign, minlength=nlist)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+        assign = np.concatenate([
+            self._assign(vectors[s:s + _BLOCK_ROWS], centroids)
+            for s in range(0, n, _BLOCK_ROWS)
+        ])
+        order = np.argsort(assign, kind="stable").astype(np.int32)
+        indptr = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=indptr[1:])
+
+        # write + rename, like the quantized codes
+        for name, arr in (("ivf_centroids", centroids.astype(np.float32)), ("ivf_indptr", indptr), ("ivf_rows", order)):
+            np.save(self._file(name + ".tmp.npy"), arr)
+            os.replace(self._file(name + ".tmp.npy"), self._file(name + ".npy"))
+        self.meta["ivf"] = {"nlist": nlist, "rows_indexed": n}
+        self._save_meta()
+        self._ivf = {
+            "rows_indexed": n,
+            "centroids": centroids.astype(np.float32),
+            "indptr": indptr,
+            "rows": np.load(self._file("ivf_rows.npy"), mmap_mode="r"),
+        }
+
+    @staticmethod
+    def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c); ||x||^2 is constant per row
+        cn = np.einsum("ij,ij->i", centroids, centroids)
+        return np.argmin(cn[None, :] - 2.0 * (np.asarray(x) @ centroids.T), axis=1)
+
+    def _drop_ivf(self) -> None:
+        self._ivf = None
+        self.meta.pop("ivf", None)
+        self._save_meta()
+        for name in ("ivf_centroids.npy", "ivf_indptr.npy", "ivf_rows.npy"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+
+class LocalClient:
+    """Stands in for chromadb.PersistentClient: one LocalCollection per name under <persist_dir>/local_index/."""
+
+    def __init__(self, persist_dir: str):
+        self.root = os.path.join(persist_dir, LOCAL_DIRNAME)
+        self._collections: Dict[str, LocalCollection] = {}
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> LocalCollection:
+        coll = self._collections.get(name)
+        if coll is None:
+            coll = self._collections[name] = LocalCollection(os.path.join(self.root, name), name, embedding_function)
+        return coll
+
+    def get_max_batch_size(self) -> int:
+        return 100000
+
+    def clear_system_cache(self) -> None:
+        # drop memmaps / cached collections; the next open re-reads the files
+        self._collections.clear()
@@ -0,0 +1,262 @@
+import datetime
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+METADATA_INDEX_FILENAME = "metadata_index.npz"
+
+# filters accepted by retrieval (everything optional; all given filters must match)
+#   source_file      "a.pdf" or ["a.pdf", "b.docx"]
+#   doc_type         "pdf" or ["pdf", "xlsx"] (the loader name: pdf, docx, xlsx, html, md, txt)
+#   page_range       [first, last] stored page numbers, inclusive; either end may be None.
+#                    Chunks without a page number (xlsx sheets, docx, html, ...)
+#                    are not paged and pass this filter unchanged
+#   ingested_after   ISO date / datetime or unix seconds, inclusive
+#   ingested_before  ISO date / datetime or unix seconds, exclusive
+FILTER_KEYS = ("source_file", "doc_type", "page_range", "ingested_after", "ingested_before")
+_CATEGORICAL = ("source_file", "doc_type")
+_NUMERIC = ("page", "ingested_at")
+
+def _timestamp(value: Any) -> int:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        dt = value
+    elif isinstance(value, datetime.date):
+        dt = datetime.datetime(value.year, value.month, value.day)
+    elif isinstance(value, str):
+        try:
+            dt = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"Not an ISO date / datetime: {value!r}") from None
+    else:
+        raise ValueError(f"Not a date: {value!r}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)  # naive dates are UTC, like ingested_at
+    return int(dt.timestamp())
+
+def _page(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"page_range bounds must be integers, got {value!r}") from None
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Validated, canonical filters (lists sorted, dates as unix seconds), or None
+    when nothing is filtered. Unknown keys and malformed values raise ValueError.
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter(s) {', '.join(sorted(unknown))}; expected {', '.join(FILTER_KEYS)}")
+    out: Dict[str, Any] = {}
+    for key in _CATEGORICAL:
+        value = filters.get(key)
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        if values:
+            out[key] = sorted({str(v) for v in values})
+    if filters.get("page_range") is not None:
+        bounds = filters["page_range"]
+        bounds = (bounds, bounds) if isinstance(bounds, (int, str)) else tuple(bounds)
+        if len(bounds) != 2:
+            raise ValueError(f"page_range must be [first, last], got {filters['page_range']!r}")
+        lo, hi = _page(bounds[0]), _page(bounds[1])
+        if lo is not None or hi is not None:
+            out["page_range"] = (lo, hi)
+    for key in ("ingested_after", "ingested_before"):
+        if filters.get(key) not in (None, ""):
+            out[key] = _timestamp(filters[key])
+    return out or None
+
+class Selection:
+    """Chunks matching a filter: their IDs (index order) out of `total` indexed chunks."""
+
+    def __init__(self, ids: List[str], total: int):
+        self.ids = ids
+        self.total = total
+
+    @property
+    def fraction(self) -> float:
+        return len(self.ids) / self.total if self.total else 0.0
+
+class MetadataIndex:
+    """
+    Secondary index over chunk metadata, built next to the BM25 index at ingest
+    time, so a filter resolves to its matching chunk IDs without touching the
+    vector store:
+
+      source_file, doc_type   categorical: rows grouped by value (CSR postings)
+      page, ingested_at       numeric: rows sorted by value, ranges by binary search
+
+    Each filter is a handful of slices; several filters are intersected.
+    """
+
+    def __init__(self, ids: List[str], codes: Dict[str, np.ndarray], values: Dict[str, List[str]], numeric: Dict[str, np.ndarray]):
+        self.ids = ids
+        self.codes = codes
+        self.values = values
+        self.numeric = numeric
+        self._id_array = np.asarray(ids, dtype=object)
+
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for col in _CATEGORICAL:
+            c = codes[col]
+            order = np.argsort(c, kind="stable")
+            indptr = np.zeros(len(values[col]) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(c[c >= 0], minlength=len(values[col])), out=indptr[1:])
+            # rows without a value (code -1) sort first; skip past them
+            self._postings[col] = (order[int(np.count_nonzero(c < 0)):], indptr)
+        self._lookup = {col: {v: i for i, v in enumerate(values[col])} for col in _CATEGORICAL}
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for col in _NUMERIC:
+            v = numeric[col]
+            order = np.argsort(v, kind="stable")
+            self._sorted[col] = (order, v[order])
+
+    @classmethod
+    def build(cls, ids: List[str], metadatas: Iterable[Optional[Dict[str, Any]]]) -> "MetadataIndex":
+        empty = cls(
+            [],
+            {col: np.zeros(0, dtype=np.int32) for col in _CATEGORICAL},
+            {col: [] for col in _CATEGORICAL},
+            {col: np.zeros(0, dtype=np.int64) for col in _NUMERIC},
+        )
+        return empty.updated((), ids, metadatas)
+
+    def updated(self, remove: Iterable[str], ids: List[str], metadatas: Iterable[Optional[Dict[str, Any]]]) -> "MetadataIndex":
+        """
+        A new index without the `remove` IDs and with `ids` (re)indexed from
+        `metadatas`; the rows of every other chunk are carried over as arrays.
+        """
+        added = dict(zip(ids, metadatas))  # an ID given twice keeps its last metadata
+        drop = set(remove) | set(added)
+        keep = np.fromiter((cid not in drop for cid in self.ids), dtype=bool, count=len(self.ids))
+
+        lookup: Dict[str, Dict[str, int]] = {col: {v: i for i, v in enumerate(self.values[col])} for col in _CATEGORICAL}
+        codes: Dict[str, List[int]] = {col: [] for col in _CATEGORICAL}
+        numeric: Dict[str, List[int]] = {col: [] for col in _NUMERIC}
+        for md in added.values():
+            md = md or {}
+            source = md.get("source_file")
+            # chunks indexed before doc_type existed: fall back to the file extension
+            doc_type = md.get("doc_type") or (os.path.splitext(source)[1].lstrip(".").lower() if source else None)
+            for col, value in (("source_file", source), ("doc_type", doc_type)):
+                codes[col].append(lookup[col].setdefault(str(value), len(lookup[col])) if value else -1)
+            page = md.get("page")
+            # unpaged chunks (spreadsheets, docx, ...) are stored as "no page" (-1)
+            numeric["page"].append(page if isinstance(page, int) and not isinstance(page, bool) and page >= 0 else -1)
+            ingested = md.get("ingested_at")
+            numeric["ingested_at"].append(int(ingested) if isinstance(ingested, (int, float)) else -1)
+
+        new_codes: Dict[str, np.ndarray] = {}
+        values: Dict[str, List[str]] = {}
+        for col in _CATEGORICAL:
+            c = np.concatenate([self.codes[col][keep], np.asarray(codes[col], dtype=np.int32)])
+            names = [""] * len(lookup[col])
+            for value, code in lookup[col].items():
+                names[code] = value
+            # values no chunk has any more (e.g. a removed file) are dropped
+            used = np.bincount(c[c >= 0], minlength=len(names)) > 0
+            remap = (np.cumsum(used) - 1).astype(np.int32)
+            new_codes[col] = np.where(c >= 0, remap[np.maximum(c, 0)] if len(names) else c, -1).astype(np.int32)
+            values[col] = [v for v, u in zip(names, used) if u]
+        return type(self)(
+            [cid for cid, alive in zip(self.ids, keep) if alive] + list(added),
+            new_codes,
+            values,
+            {col: np.concatenate([self.numeric[col][keep], np.asarray(numeric[col], dtype=np.int64)]) for col in _NUMERIC},
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _category_rows(self, col: str, wanted: List[str]) -> np.ndarray:
+        order, indptr = self._postings[col]
+        codes = (self._lookup[col].get(w) for w in wanted)
+        parts = [order[indptr[c]:indptr[c + 1]] for c in codes if c is not None]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def _range_rows(self, col: str, lo: Optional[int], hi_exclusive: Optional[int], include_missing: bool = False) -> np.ndarray:
+        # missing values are stored as -1, below any valid bound: they sort first
+        order, sorted_values = self._sorted[col]
+        missing = int(np.searchsorted(sorted_values, 0, side="left"))
+        start = max(missing, int(np.searchsorted(sorted_values, lo, side="left")) if lo is not None else 0)
+        end = int(np.searchsorted(sorted_values, hi_exclusive, side="left")) if hi_exclusive is not None else len(order)
+        rows = order[start:max(start, end)]
+        if include_missing:
+            rows = np.concatenate([order[:missing], rows])
+        return np.sort(rows)
+
+    def select(self, filters: Dict[str, Any]) -> Selection:
+        """Chunks matching every filter; `filters` as returned by normalize_filters()."""
+        row_sets = []
+        for col in _CATEGORICAL:
+            if col in filters:
+                row_sets.append(self._category_rows(col, filters[col]))
+        if "page_range" in filters:
+            lo, hi = filters["page_range"]
+            # rows that are not paged are left to the other filters
+            row_sets.append(self._range_rows("page", lo, hi + 1 if hi is not None else None, include_missing=True))
+        if "ingested_after" in filters or "ingested_before" in filters:
+            row_sets.append(self._range_rows("ingested_at", filters.get("ingested_after"), filters.get("ingested_before")))
+
+        if not row_sets:
+            return Selection(list(self.ids), len(self.ids))
+        row_sets.sort(key=len)
+        rows = row_sets[0]
+        for other in row_sets[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return Selection(self._id_array[rows].tolist(), len(self.ids))
+
+    def distinct(self, col: str) -> List[str]:
+        """Values of a categorical column (for filter pickers)."""
+        return sorted(self.values[col])
+
+    def save(self, persist_dir: str) -> None:
+        os.makedirs(persist_dir, exist_ok=True)
+        path = os.path.join(persist_dir, METADATA_INDEX_FILENAME)
+        tmp = path + ".tmp.npz"
+        arrays = {"ids": np.asarray(self.ids, dtype=str)}
+        for col in _CATEGORICAL:
+            arrays[f"{col}_codes"] = self.codes[col]
+            arrays[f"{col}_values"] = np.asarray(self.values[col], dtype=str)
+        for col in _NUMERIC:
+            arrays[col] = self.numeric[col]
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["MetadataIndex"]:
+        path = os.path.join(persist_dir, METADATA_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as z:
+            return cls(
+                ids=z["ids"].tolist(),
+                codes={col: z[f"{col}_codes"] for col in _CATEGORICAL},
+                values={col: z[f"{col}_values"].tolist() for col in _CATEGORICAL},
+                numeric={col: z[col] for col in _NUMERIC},
+            )
+
+def build_metadata_index_from_collection(collection, page_size: int = 5000) -> MetadataIndex:
+    """(Re)build the metadata index from whatever the collection currently holds."""
+    ids: List[str] = []
+    metadatas: List[Optional[Dict[str, Any]]] = []
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        metadatas.extend(page["metadatas"])
+        offset += len(page["ids"])
+    return MetadataIndex.build(ids, metadatas)
@@ -0,0 +1,99 @@
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Optional, Protocol
+
+from config.settings import VECTOR_BACKEND
+from vector_store import chroma_store
+
+VECTOR_BACKENDS = ("chroma", "local")
+
+class VectorCollection(Protocol):
+    """
+    What the pipeline needs from a vector collection (a subset of Chroma's
+    Collection API). Distances are squared L2; results are Chroma-shaped dicts.
+    """
+
+    def count(self) -> int: ...
+
+    def upsert(self, ids: List[str], documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None, embeddings=None) -> None: ...
+
+    def delete(self, ids: List[str]) -> None: ...
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]: ...
+
+    def query(self, query_embeddings=None, query_texts: Optional[List[str]] = None, n_results: int = 10, include: Optional[List[str]] = None) -> Dict[str, Any]: ...
+
+def get_client(persist_dir: str, backend: str = VECTOR_BACKEND):
+    """
+    chromadb.PersistentClient, or the in-process LocalClient. Both provide
+    get_or_create_collection / get_max_batch_size / clear_system_cache, so
+    chroma_store.get_or_create_collection and close_client work with either.
+    """
+    if backend == "local":
+        from vector_store.local_store import LocalClient
+        return LocalClient(persist_dir)
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector backend {backend!r}; expected one of {VECTOR_BACKENDS}")
+    return chroma_store.get_client(persist_dir)
+
+def optimize_collection(collection) -> None:
+    """Post-build maintenance where the backend has any (local: compaction + IVF build)."""
+    optimize = getattr(collection, "optimize", None)
+    if callable(optimize):
+        optimize()
+
+# ---------- Cloning an index version ----------
+_FICLONE = 0x40049409  # linux/fs.h
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copy-on-write clone (btrfs, XFS, ...); False where the filesystem cannot."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+    except OSError:
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def clone_index(src: str, dst: str, replaced: Iterable[str] = (), ignore: Iterable[str] = (), backend: str = VECTOR_BACKEND) -> Dict[str, Any]:
+    """
+    Starts an incremental build's folder from index version src without copying
+    what it does not rewrite. Files that are only ever replaced (write + rename)
+    are hard-linked: the top-level `replaced` names, and every file of the local
+    backend, which copies a shared file before its first in-place write. Chroma
+    writes its files in place, so they are reflinked where the filesystem
+    supports it and copied otherwise.
+    """
+    from vector_store.local_store import LOCAL_DIRNAME
+    replaced, ignore = set(replaced), set(ignore)
+    local_root = os.path.join(src, LOCAL_DIRNAME)
+    stats = {"linked": 0, "reflinked": 0, "copied": 0, "copied_mb": 0.0}
+    for dirpath, _, filenames in os.walk(src):
+        out_dir = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(out_dir, exist_ok=True)
+        for name in filenames:
+            if dirpath == src and name in ignore:
+                continue
+            s, d = os.path.join(dirpath, name), os.path.join(out_dir, name)
+            if os.path.lexists(d):
+                os.remove(d)
+            linkable = (dirpath == src and name in replaced) or (backend == "local" and os.path.commonpath([dirpath, local_root]) == local_root)
+            if linkable:
+                try:
+                    os.link(s, d)
+                    stats["linked"] += 1
+                    continue
+                except OSError:
+                    pass  # e.g. another filesystem
+            if _reflink(s, d):
+                stats["reflinked"] += 1
+                continue
+            shutil.copy2(s, d)
+            stats["copied"] += 1
+            stats["copied_mb"] += os.path.getsize(d) / 1e6
+    stats["copied_mb"] = round(stats["copied_mb"], 1)
+    return stats